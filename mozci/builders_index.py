@@ -0,0 +1,368 @@
+#! /usr/bin/env python
+"""
+This module holds a read-only builders index which processes share through mmap.
+
+Every process that uses mozci.platforms keeps allthethings.json and the
+structures derived from it in memory. When many worker processes run on the
+same host, they can instead map a single file with what they need:
+
+* the metadata of every builder (see platforms.get_buildername_metadata())
+* the build job of every builder (see platforms.determine_upstream_builder())
+* the test jobs of every build job (see platforms.get_downstream_jobs())
+* the builders that platforms.list_builders() returns
+
+The index is opt-in: mozci.platforms does not use it. Tools which run many
+worker processes call get_shared_index() once and use the methods of the
+index instead of the functions of mozci.platforms.
+
+Lookups are binary searches over fixed size records; only the records being
+looked at are read from the mapped file and the pages are shared with the
+other processes.
+
+The file lives next to allthethings.json and it is tied to its size and
+modification time. The first process that notices a new allthethings.json
+loads it, writes the new index to a temporary file and renames it over the old
+one. get_shared_index() keeps returning the index it mapped for
+allthethings.CACHE_TTL seconds; then it checks allthethings.json again and maps
+the new index if the file was replaced. Callers which hold the old index can
+keep reading it.
+
+Layout of the file (little endian)::
+
+    header      MAGIC, FORMAT_VERSION, length of the signature
+    signature   marshal dump of the signature of allthethings.json
+    sections    number of builders; offsets of the sections below;
+                position of the wanted builders in postings; number of repos
+    builders    BUILDER_RECORD per builder, sorted by name (UTF-8)
+    repos       REPO_RECORD per repo name of the builders, sorted by name
+    postings    lists of builder numbers (uint32)
+    strings     names and JSON encoded metadata
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import marshal
+import mmap
+import os
+import struct
+import time
+
+from mozci import platforms
+from mozci.errors import MissingBuilderError, MozciError
+from mozci.sources import allthethings
+from mozci.utils.transfer import replace_file
+
+LOG = logging.getLogger('mozci')
+
+MAGIC = 'MOZCIBIX'
+# Bump this value if the layout of the file changes
+FORMAT_VERSION = 3
+HEADER = struct.Struct('<8sII')
+SECTIONS = struct.Struct('<IIIIIIII')
+# name offset, name length, upstream, metadata offset, metadata length,
+# first downstream posting, number of downstream postings
+BUILDER_RECORD = struct.Struct('<IIiIIII')
+# name offset, name length, first posting, number of postings of the wanted
+# builders which list_builders() returns for the repo name
+REPO_RECORD = struct.Struct('<IIII')
+POSTING = struct.Struct('<I')
+# Values of the upstream field which are not the number of a builder
+NO_UPSTREAM = -1
+NO_BUILD_JOB = -2
+
+# The index in use by this process and when we last checked that it is current
+SHARED_INDEX = None
+SHARED_INDEX_CHECKED_AT = 0
+
+
+def index_path():
+    """Return the path of the shared builders index."""
+    return "%s.builders.mmap" % allthethings.FILENAME
+
+
+def _encode(name):
+    return name.encode('utf-8') if isinstance(name, unicode) else name
+
+
+class SharedBuildersIndex(object):
+    """Read-only view over the contents of a shared builders index.
+
+    buffer can be a mmap object or a string with the contents of the file.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        magic, version, signature_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("This is not a builders index we can read.")
+
+        offset = HEADER.size
+        self.signature = marshal.loads(buffer[offset:offset + signature_length])
+        (self.builders_count, self.builders_offset, self.postings_offset, self.strings_offset,
+         self.wanted_start, self.wanted_count, self.repos_count, self.repos_offset) = \
+            SECTIONS.unpack_from(buffer, offset + signature_length)
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __len__(self):
+        return self.builders_count
+
+    def __contains__(self, buildername):
+        return self._find_builder(buildername) is not None
+
+    def _string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.buffer[start:start + length]
+
+    def _builder(self, number):
+        return BUILDER_RECORD.unpack_from(
+            self.buffer, self.builders_offset + number * BUILDER_RECORD.size)
+
+    def _builder_name(self, number):
+        name_offset, name_length = self._builder(number)[:2]
+        return self._string(name_offset, name_length).decode('utf-8')
+
+    def _postings(self, start, count):
+        return struct.unpack_from(
+            '<%dI' % count, self.buffer, self.postings_offset + start * POSTING.size)
+
+    def _find_record(self, record, offset, count, name):
+        """Return the number and the fields of the record named name (binary search)."""
+        name = _encode(name)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            fields = record.unpack_from(self.buffer, offset + middle * record.size)
+            current = self._string(fields[0], fields[1])
+            if current == name:
+                return middle, fields
+            elif current < name:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def _find_builder(self, buildername):
+        """Return the number and the record of a builder."""
+        return self._find_record(BUILDER_RECORD, self.builders_offset, self.builders_count,
+                                 buildername)
+
+    def _get_builder(self, buildername):
+        found = self._find_builder(buildername)
+        if found is None:
+            raise MissingBuilderError("Builder '{}' is missing. All builders' length: {}".format(
+                buildername, self.builders_count)
+            )
+        return found[1]
+
+    def get_buildername_metadata(self, buildername):
+        """Return the metadata of a builder; see platforms.get_buildername_metadata()."""
+        fields = self._get_builder(buildername)
+        if fields[4] == 0:
+            raise MozciError("We cannot determine the metadata of %s." % buildername)
+        return json.loads(self._string(fields[3], fields[4]))
+
+    def determine_upstream_builder(self, buildername):
+        """Return the build job of a builder; see platforms.determine_upstream_builder()."""
+        upstream = self._get_builder(buildername)[2]
+        if upstream == NO_BUILD_JOB:
+            LOG.error("We didn't find a build job matching %s" % buildername)
+            raise MozciError("No build job matching %s found." % buildername)
+        elif upstream == NO_UPSTREAM:
+            return None
+
+        return str(self._builder_name(upstream))
+
+    def get_downstream_jobs(self, upstream_job):
+        """Return all test jobs that are downstream from a build job."""
+        found = self._find_builder(upstream_job)
+        if found is None:
+            return []
+
+        fields = found[1]
+        return [self._builder_name(n) for n in self._postings(fields[5], fields[6])]
+
+    def list_builders(self, repo_name=None):
+        """
+        Return the builders that platforms.list_builders() returns.
+
+        If repo_name is set, only the builders whose name contains it are
+        returned, as platforms.list_builders() does. The builders of the repo
+        names of allthethings.json are looked up in the repos section; any
+        other value is looked for in the name of every wanted builder.
+        """
+        if not repo_name:
+            return [self._builder_name(n)
+                    for n in self._postings(self.wanted_start, self.wanted_count)]
+
+        found = self._find_record(REPO_RECORD, self.repos_offset, self.repos_count, repo_name)
+        if found is not None:
+            fields = found[1]
+            return [self._builder_name(n) for n in self._postings(fields[2], fields[3])]
+
+        buildernames = [self._builder_name(n)
+                        for n in self._postings(self.wanted_start, self.wanted_count)]
+        return [b for b in buildernames if repo_name in b]
+
+
+def _generate_index(signature):
+    """Return the contents of a shared builders index for the allthethings data loaded."""
+    LOG.debug("Generating the shared builders index.")
+    builders = sorted(allthethings.fetch_allthethings_data()['builders'], key=_encode)
+    numbers = {buildername: n for n, buildername in enumerate(builders)}
+    builders_index = platforms._get_builders_index()
+    wanted = builders_index['wanted']
+    platforms.load_relations()
+
+    strings = []
+    strings_length = [0]
+
+    def add_string(value):
+        value = _encode(value)
+        strings.append(value)
+        strings_length[0] += len(value)
+        return strings_length[0] - len(value), len(value)
+
+    postings = []
+
+    def add_postings(buildernames):
+        start = len(postings)
+        postings.extend(sorted(numbers[b] for b in buildernames))
+        return start, len(postings) - start
+
+    builder_records = []
+    for buildername in builders:
+        try:
+            meta = platforms.get_buildername_metadata(buildername)
+        except (AttributeError, KeyError, TypeError):
+            meta_offset, meta_length = 0, 0
+        else:
+            meta_offset, meta_length = add_string(json.dumps(meta, sort_keys=True))
+
+        upstream = platforms.UPSTREAM_BUILDERS.get(buildername)
+        if upstream is platforms.NO_BUILD_JOB:
+            upstream = NO_BUILD_JOB
+        elif upstream is None or upstream not in numbers:
+            upstream = NO_UPSTREAM
+        else:
+            upstream = numbers[upstream]
+
+        downstream = add_postings(platforms.UPSTREAM_TO_DOWNSTREAM.get(buildername, []))
+        builder_records.append(
+            add_string(buildername) + (upstream, meta_offset, meta_length) + downstream)
+
+    wanted_start, wanted_count = add_postings(wanted)
+    # Like platforms.list_builders(), a repo has the wanted builders whose name contains it
+    repo_records = []
+    for repo_name in sorted((r for r in builders_index['repo_name'] if r), key=_encode):
+        repo_records.append(
+            add_string(repo_name) + add_postings([b for b in wanted if repo_name in b]))
+
+    signature = marshal.dumps(signature)
+    builders_offset = HEADER.size + len(signature) + SECTIONS.size
+    repos_offset = builders_offset + len(builder_records) * BUILDER_RECORD.size
+    postings_offset = repos_offset + len(repo_records) * REPO_RECORD.size
+    strings_offset = postings_offset + len(postings) * POSTING.size
+
+    content = [
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(signature)),
+        signature,
+        SECTIONS.pack(len(builder_records), builders_offset, postings_offset, strings_offset,
+                      wanted_start, wanted_count, len(repo_records), repos_offset),
+    ]
+    content.extend(BUILDER_RECORD.pack(*record) for record in builder_records)
+    content.extend(REPO_RECORD.pack(*record) for record in repo_records)
+    content.append(struct.pack('<%dI' % len(postings), *postings))
+    content.extend(strings)
+    return ''.join(content)
+
+
+def _write_index(content):
+    """Write atomically the shared builders index; readers see the old file or the new one."""
+    path = index_path()
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fd:
+            fd.write(content)
+        replace_file(tmp_path, path)
+    except (IOError, OSError) as e:
+        LOG.debug("We could not write %s (%s)." % (path, str(e)))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    return True
+
+
+def _map_index(signature):
+    """Return the shared builders index on disk if it was generated for signature."""
+    path = index_path()
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as fd:
+            buffer = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError) as e:
+        LOG.debug("We could not map %s (%s)." % (path, str(e)))
+        return None
+
+    try:
+        index = SharedBuildersIndex(buffer)
+    except (struct.error, EOFError, ValueError, TypeError) as e:
+        LOG.debug("%s is corrupted (%s)." % (path, str(e)))
+        buffer.close()
+        return None
+
+    if index.signature != signature:
+        LOG.debug("%s is outdated." % path)
+        index.close()
+        return None
+
+    return index
+
+
+def get_shared_index(verify=True):
+    """
+    Return the shared builders index of the current allthethings.json.
+
+    The index on disk is mapped if it was generated for the current
+    allthethings.json, otherwise, we generate it from allthethings.json. The
+    index is returned without looking at allthethings.json again during
+    allthethings.CACHE_TTL seconds; then it is kept unless allthethings.json
+    has been replaced.
+    """
+    global SHARED_INDEX, SHARED_INDEX_CHECKED_AT
+
+    now = time.time()
+    if SHARED_INDEX is not None and \
+       0 <= now - SHARED_INDEX_CHECKED_AT < allthethings.CACHE_TTL:
+        return SHARED_INDEX
+
+    signature = allthethings.refresh_allthethings_file(verify)
+    SHARED_INDEX_CHECKED_AT = now
+    if SHARED_INDEX is not None and SHARED_INDEX.signature == signature:
+        return SHARED_INDEX
+
+    index = _map_index(signature)
+    if index is None:
+        allthethings.fetch_allthethings_data(verify=verify)
+        if allthethings._DATA_SIGNATURE != signature:
+            # allthethings.json was replaced since this process loaded it
+            allthethings.DATA = None
+            allthethings.fetch_allthethings_data(verify=False)
+
+        # The signature of the data we actually used
+        content = _generate_index(allthethings._DATA_SIGNATURE)
+        index = _map_index(signature) if _write_index(content) else None
+        if index is None:
+            # Not shared with other processes, but we can still use it
+            index = SharedBuildersIndex(content)
+
+    # Callers might still use the previous index; its file is unmapped once it is not referenced
+    SHARED_INDEX = index
+    return SHARED_INDEX
@@ -41,12 +41,13 @@ from mozci.query_jobs import (
     EXCEPTION,
     RETRY,
     BuildApi,
+    BuildjsonApi,
     TreeherderApi,
     status_to_string,
 )
 from mozci.utils.authentication import get_credentials
 from mozci.utils.misc import _all_urls_reachable
-from mozci.utils.transfer import clean_directory
+from mozci.utils.cache import maybe_evict
 from mozhginfo.pushlog_client import (
     query_push_by_revision,
     query_pushes_by_specified_revision_range,
@@ -83,10 +84,12 @@ def validate():
 def set_query_source(query_source="buildapi"):
     """ Function to set the global QUERY_SOURCE """
     global QUERY_SOURCE
-    assert query_source in ('buildapi', 'treeherder')
+    assert query_source in ('buildapi', 'buildjson', 'treeherder')
     LOG.info('Setting {} as our query source'.format(query_source))
     if query_source == "treeherder":
         source_class = TreeherderApi
+    elif query_source == "buildjson":
+        source_class = BuildjsonApi
     else:
         source_class = BuildApi
     QUERY_SOURCE = source_class()
@@ -123,8 +126,9 @@ class StatusSummary(object):
         self._running = 0
         self._coalesced = 0
         self._failed = 0
+        jobs_data = QUERY_SOURCE.get_jobs_data_or_none(jobs)
         for job in jobs:
-            status = QUERY_SOURCE.get_job_status(job)
+            status = QUERY_SOURCE.get_job_status(job, jobs_data)
             if status == PENDING:
                 self._pending += 1
             if status in (RUNNING, UNKNOWN):
@@ -205,9 +209,10 @@ def determine_trigger_objective(revision, buildername,
     failed_job = None
 
     LOG.debug("List of matching jobs:")
+    jobs_data = query_api.get_jobs_data_or_none(build_jobs)
     for job in build_jobs:
         try:
-            status = query_api.get_job_status(job)
+            status = query_api.get_job_status(job, jobs_data)
         except BuildjsonError:
             LOG.debug("We have hit bug 1159279 and have to work around it. We will "
                       "pretend that we could not reach the files for it.")
@@ -497,8 +502,8 @@ def trigger_job(revision, buildername, times=1, files=None, dry_run=False,
     else:
         LOG.debug("Nothing needs to be triggered")
 
-    # Cleanup old buildjson files.
-    clean_directory()
+    # Cleanup old buildjson files (at most once every cache.EVICTION_INTERVAL seconds)
+    maybe_evict()
 
     return list_of_requests
 
@@ -555,7 +560,8 @@ def trigger_range(buildername, revisions, times=1, dry_run=False,
                         count=(times - status_summary.potential_jobs),
                         dry_run=dry_run)
                     schedule_new_job = False
-                except (IndexError, ConnectionError, ReadTimeout, ValueError) as e:
+                except (IndexError, BuildjsonError, ConnectionError, ReadTimeout,
+                        ValueError) as e:
                     # Logging until we can determine why we get these errors
                     # We should have one of these:
                     # {'requests': [{'request_id': int]}
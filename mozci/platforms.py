@@ -12,7 +12,12 @@ from mozci.errors import (
     MissingBuilderError,
     MozciError
 )
-from mozci.sources.allthethings import fetch_allthethings_data
+from mozci.sources import allthethings
+from mozci.sources.allthethings import (
+    fetch_allthethings_data,
+    load_index_section,
+    save_index_section
+)
 
 LOG = logging.getLogger('mozci')
 
@@ -45,11 +50,423 @@ SHORTNAME_TO_NAME = {}
 # test cppunit" : larch-android-api-11-opt-unittest
 BUILDERNAME_TO_TRIGGER = {}
 BUILD_JOBS = {}
+# What determine_upstream_builder() returns for every builder in allthethings.json;
+# builders for which it raises MozciError are stored with NO_BUILD_JOB
+UPSTREAM_BUILDERS = {}
+NO_BUILD_JOB = False
+# Metadata of every builder as returned by get_buildername_metadata()
+BUILDERS_METADATA = None
+# Immutable metadata records handed out by get_buildername_metadata() keyed by buildername.
+METADATA_CACHE = {}
+# Index to look up builders by their metadata (see _get_builders_index())
+BUILDERS_INDEX = None
+# Metadata keys by which BUILDERS_INDEX can look up builders
+INDEXED_KEYS = ('build_type', 'downstream', 'job_type', 'nightly', 'platform_name',
+                'repo_name', 'suite_name')
+# Generation of the allthethings data (see allthethings.GENERATION) that the caches belong to
+CACHE_GENERATION = None
+# The allthethings data that the caches were computed from
+CACHED_DATA = None
+# What changed the last time that the allthethings data was reloaded (see get_builders_changes())
+BUILDERS_CHANGES = None
+# BuildernamesIndex objects used by filter_buildernames() keyed by their buildernames
+BUILDERNAMES_INDEXES = collections.OrderedDict()
+MAX_BUILDERNAMES_INDEXES = 4
 UPSTREAM_TO_DOWNSTREAM = None
 SETA_DICT = None
 MAX_PUSHES = 5
 
 
+class BuilderMetadata(dict):
+    """Read-only dictionary with the metadata of a builder.
+
+    The same record is handed to every caller of get_buildername_metadata(),
+    thus, it cannot be modified.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("The metadata of a builder cannot be modified.")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (BuilderMetadata, (dict(self),))
+
+
+class BuildernamesIndex(object):
+    """Case insensitive substring index over a list of buildernames.
+
+    Every buildername is split into lowercase tokens (e.g. "windows", "7",
+    "mochitest-1") and we keep the buildernames that contain each token. To
+    find the buildernames containing a word we only look at the tokens (there
+    are a lot less tokens than buildernames) and at the buildernames of the
+    tokens which contain the word.
+    """
+
+    def __init__(self, buildernames):
+        self.counts = collections.Counter(buildernames)
+        self.lowercase = {}
+        self.tokens = collections.defaultdict(set)
+        for buildername in self.counts:
+            self.lowercase[buildername] = buildername.lower()
+            for token in self.lowercase[buildername].split():
+                self.tokens[token].add(buildername)
+
+    def matching(self, word):
+        """Return the set of buildernames which contain word (case insensitive)."""
+        word = word.lower()
+        parts = word.split()
+        if not parts:
+            # An empty word or only spaces; this is not worth indexing
+            return set(b for b, lower in self.lowercase.iteritems() if word in lower)
+
+        candidates = None
+        # If a buildername contains the word, each of the parts of the word has
+        # to be inside of one of the tokens of the buildername
+        for part in sorted(set(parts), key=len, reverse=True):
+            part_candidates = set()
+            for token, buildernames in self.tokens.iteritems():
+                if part in token:
+                    part_candidates.update(buildernames)
+
+            candidates = part_candidates if candidates is None else candidates & part_candidates
+            if not candidates:
+                return set()
+
+        if len(parts) == 1 and parts[0] == word:
+            # The word is inside of a token; no need to check
+            return candidates
+
+        return set(b for b in candidates if word in self.lowercase[b])
+
+    def filter(self, include=[], exclude=[]):
+        """Return every buildername matching the words in include and not in exclude."""
+        selected = None
+        for word in include:
+            matches = self.matching(word)
+            selected = matches if selected is None else selected & matches
+
+        if selected is None:
+            selected = set(self.counts)
+
+        for word in exclude:
+            if not selected:
+                break
+            selected = selected - self.matching(word)
+
+        buildernames = []
+        for buildername in selected:
+            buildernames.extend([buildername] * self.counts[buildername])
+        return buildernames
+
+
+def _get_buildernames_index(buildernames):
+    """Return a BuildernamesIndex for buildernames; we keep the last few ones built."""
+    # Buildernames can be repeated; the index keeps how many times
+    key = frozenset(collections.Counter(buildernames).iteritems())
+    if key in BUILDERNAMES_INDEXES:
+        index = BUILDERNAMES_INDEXES.pop(key)
+        BUILDERNAMES_INDEXES[key] = index
+        return index
+
+    index = BuildernamesIndex(buildernames)
+    BUILDERNAMES_INDEXES[key] = index
+    if len(BUILDERNAMES_INDEXES) > MAX_BUILDERNAMES_INDEXES:
+        BUILDERNAMES_INDEXES.popitem(last=False)
+    return index
+
+
+def _reset_caches():
+    """Drop every structure derived from the allthethings data."""
+    global BUILDERS_METADATA, METADATA_CACHE, BUILDERS_INDEX, CACHE_GENERATION, CACHED_DATA
+    global UPSTREAM_TO_DOWNSTREAM, SETA_DICT
+
+    BUILDERS_METADATA = None
+    METADATA_CACHE = {}
+    BUILDERS_INDEX = None
+    UPSTREAM_TO_DOWNSTREAM = None
+    SETA_DICT = None
+    CACHE_GENERATION = None
+    CACHED_DATA = None
+
+
+def _check_generation():
+    """
+    Bring the caches up to date if the allthethings data has been reloaded since we filled them.
+
+    Only the entries of the builders and schedulers that changed are updated
+    (see _update_caches()).
+    """
+    global CACHE_GENERATION, CACHED_DATA
+
+    if CACHE_GENERATION == allthethings.GENERATION:
+        return
+
+    data = fetch_allthethings_data()
+    old_data = CACHED_DATA
+    if old_data is None:
+        _reset_caches()
+
+    CACHE_GENERATION = allthethings.GENERATION
+    CACHED_DATA = data
+    if old_data is not None:
+        try:
+            _update_caches(old_data, data)
+        except Exception:
+            # We don't want to keep half updated caches
+            _reset_caches()
+            raise
+
+
+def _diff_dicts(old, new):
+    """Return the keys (sorted) added to, removed from and modified in old to obtain new."""
+    added = sorted(key for key in new if key not in old)
+    removed = sorted(key for key in old if key not in new)
+    modified = sorted(key for key in new if key in old and new[key] != old[key])
+    return added, removed, modified
+
+
+def _get_schedulers_tests(schedulers, scheds):
+    """Return the trigger and the SETA interval of the test jobs of some schedulers."""
+    triggers = {}
+    seta = {}
+    for sched in scheds:
+        # We are only interested in test schedulers
+        if not sched.startswith('tests-'):
+            continue
+
+        values = schedulers[sched]
+        for buildername in values['downstream']:
+            triggers[buildername.lower()] = values['triggered_by'][0]
+        seta.update(_get_scheduler_SETA_intervals(sched, values))
+
+    return triggers, seta
+
+
+def _update_caches(old_data, data):
+    """
+    Update the caches computed from old_data to what they would be for data.
+
+    Only the entries of the builders and schedulers that were added, removed or
+    modified are computed again; what changed is stored in BUILDERS_CHANGES.
+    The index of builders (see _get_builders_index()) is built again when needed.
+    """
+    global BUILDERS_INDEX, BUILDERS_CHANGES
+
+    added, removed, modified = _diff_dicts(old_data['builders'], data['builders'])
+    scheds_added, scheds_removed, scheds_modified = _diff_dicts(
+        old_data['schedulers'], data['schedulers'])
+    old_triggers, old_seta = _get_schedulers_tests(
+        old_data['schedulers'], scheds_removed + scheds_modified)
+    new_triggers, new_seta = _get_schedulers_tests(
+        data['schedulers'], scheds_added + scheds_modified)
+
+    seta_changes = {}
+    for buildername in set(old_seta) | set(new_seta):
+        if old_seta.get(buildername) != new_seta.get(buildername):
+            seta_changes[buildername] = (old_seta.get(buildername), new_seta.get(buildername))
+
+    BUILDERS_CHANGES = {
+        'generation': allthethings.GENERATION,
+        'builders_added': added,
+        'builders_removed': removed,
+        'builders_modified': modified,
+        'schedulers_added': scheds_added,
+        'schedulers_removed': scheds_removed,
+        'schedulers_modified': scheds_modified,
+        'seta_changes': seta_changes,
+    }
+    if not (added or removed or modified or scheds_added or scheds_removed or scheds_modified):
+        LOG.debug("The builders and schedulers of allthethings.json have not changed.")
+        return
+
+    LOG.info("allthethings.json has changed: %d builders added, %d removed and %d modified; "
+             "%d SETA intervals changed." % (
+                 len(added), len(removed), len(modified), len(seta_changes)))
+
+    builders = set(added + removed + modified)
+    for buildername in added + removed:
+        # _wanted_builder() for the non pgo talos builders depends on the pgo ones
+        if 'pgo talos' in buildername:
+            builders.add(buildername.replace('pgo talos', 'talos'))
+
+    for buildername in removed + modified:
+        METADATA_CACHE.pop(buildername, None)
+        if BUILDERS_METADATA is not None:
+            BUILDERS_METADATA.pop(buildername, None)
+
+    if BUILDERS_METADATA is not None:
+        for buildername in added + modified:
+            try:
+                BUILDERS_METADATA[buildername] = _get_buildername_metadata(buildername)
+            except (AttributeError, KeyError, TypeError):
+                continue
+        save_index_section('metadata', BUILDERS_METADATA, data)
+
+    BUILDERS_INDEX = None
+    if UPSTREAM_TO_DOWNSTREAM is not None:
+        _update_builders_data(builders, old_data['builders'], old_triggers, new_triggers,
+                              old_seta, new_seta)
+        builders_data = {
+            'shortname_to_name': SHORTNAME_TO_NAME,
+            'buildername_to_trigger': BUILDERNAME_TO_TRIGGER,
+            'build_jobs': BUILD_JOBS,
+            'upstream_builders': UPSTREAM_BUILDERS,
+            'relations': {key: value for key, value in UPSTREAM_TO_DOWNSTREAM.iteritems() if value},
+            'seta': SETA_DICT,
+        }
+        save_index_section('builders-data', builders_data, data)
+
+
+def _update_builders_data(builders, old_builders, old_triggers, new_triggers, old_seta, new_seta):
+    """
+    Update the structures filled by _load_builders_data().
+
+    builders are the buildernames which were added, removed or modified (and the
+    ones whose _wanted_builder() result might have changed); old_triggers and
+    old_seta are the entries of the schedulers which were removed or modified and
+    new_triggers and new_seta are the ones of the schedulers added or modified.
+    """
+    new_builders = fetch_allthethings_data()['builders']
+    # Keys of BUILD_JOBS and BUILDERNAME_TO_TRIGGER which changed
+    changed_keys = set()
+    changed_shortnames = set()
+    for buildername in builders:
+        if BUILD_JOBS.get(buildername.lower()) == buildername:
+            del BUILD_JOBS[buildername.lower()]
+            changed_keys.add(buildername.lower())
+            changed_shortnames.add(old_builders[buildername]['shortname'])
+
+    for buildername in builders:
+        if buildername in new_builders and _is_wanted_builder(buildername) and \
+           not get_buildername_metadata(buildername)['downstream']:
+            BUILD_JOBS[buildername.lower()] = buildername
+            changed_keys.add(buildername.lower())
+            changed_shortnames.add(new_builders[buildername]['shortname'])
+
+    if changed_shortnames:
+        # A few build jobs share their shortname, see _generate_builders_data()
+        for shortname in changed_shortnames:
+            SHORTNAME_TO_NAME.pop(shortname, None)
+        for buildername in BUILD_JOBS.itervalues():
+            shortname = new_builders[buildername]['shortname']
+            if shortname in changed_shortnames and \
+               buildername > SHORTNAME_TO_NAME.get(shortname):
+                SHORTNAME_TO_NAME[shortname] = buildername
+
+    # The entries of the test jobs of the schedulers which changed are computed
+    # again from all the schedulers; an unchanged scheduler can still set them
+    trigger_keys = set(old_triggers) | set(new_triggers)
+    seta_buildernames = set(old_seta) | set(new_seta)
+    previous_triggers = {}
+    for key in trigger_keys:
+        if key in BUILDERNAME_TO_TRIGGER:
+            previous_triggers[key] = BUILDERNAME_TO_TRIGGER.pop(key)
+    for buildername in seta_buildernames:
+        SETA_DICT.pop(buildername, None)
+
+    for sched, values in fetch_allthethings_data()['schedulers'].iteritems():
+        if not sched.startswith('tests-'):
+            continue
+
+        downstream = [b for b in values['downstream']
+                      if b.lower() in trigger_keys or b in seta_buildernames]
+        for buildername in downstream:
+            key = buildername.lower()
+            if key not in trigger_keys:
+                continue
+            if key in BUILDERNAME_TO_TRIGGER:
+                raise MozciError("%s is triggered by more than one scheduler." % buildername)
+            BUILDERNAME_TO_TRIGGER[key] = values['triggered_by'][0]
+
+        if downstream:
+            for buildername, interval in \
+                    _get_scheduler_SETA_intervals(sched, values).iteritems():
+                if buildername in seta_buildernames:
+                    SETA_DICT[buildername] = interval
+
+    for key in trigger_keys:
+        if previous_triggers.get(key) != BUILDERNAME_TO_TRIGGER.get(key):
+            changed_keys.add(key)
+            # See the pgo talos builders in _find_upstream_builder()
+            changed_keys.add(key.replace('pgo talos', 'talos'))
+
+    # The test jobs whose trigger might now activate a different build job
+    triggers = set()
+    for trigger in set(BUILDERNAME_TO_TRIGGER.itervalues()):
+        if changed_shortnames.intersection(_get_trigger_shortnames(trigger)):
+            triggers.add(trigger)
+    for key, trigger in BUILDERNAME_TO_TRIGGER.iteritems():
+        if trigger in triggers:
+            changed_keys.add(key)
+
+    if changed_keys:
+        builders = builders | set(b for b in new_builders if b.lower() in changed_keys)
+
+    for buildername in builders:
+        upstream = UPSTREAM_BUILDERS.pop(buildername, NO_BUILD_JOB)
+        downstream = UPSTREAM_TO_DOWNSTREAM.get(upstream)
+        if downstream and buildername in downstream:
+            downstream.remove(buildername)
+
+        if buildername not in new_builders:
+            continue
+
+        try:
+            upstream = _find_upstream_builder(
+                buildername, SHORTNAME_TO_NAME, BUILDERNAME_TO_TRIGGER, BUILD_JOBS)
+        except MozciError:
+            upstream = NO_BUILD_JOB
+        UPSTREAM_BUILDERS[buildername] = upstream
+
+        if upstream is not NO_BUILD_JOB and _is_wanted_builder(buildername) and \
+           get_buildername_metadata(buildername)['downstream']:
+            UPSTREAM_TO_DOWNSTREAM[upstream].append(buildername)
+
+
+def _is_wanted_builder(buildername):
+    """Like _wanted_builder() but it returns False for builders without metadata."""
+    try:
+        return _wanted_builder(buildername)
+    except (AttributeError, KeyError, TypeError):
+        return False
+
+
+def get_builders_changes():
+    """
+    Return what changed the last time that allthethings.json was reloaded.
+
+    It is a dictionary with the buildernames added, removed and modified, the
+    names of the schedulers added, removed and modified and the SETA intervals
+    which changed ({buildername: (old interval, new interval)}, an interval
+    is None if the builder had or has no SETA interval).
+
+    It returns None if allthethings.json has not been reloaded.
+    """
+    fetch_allthethings_data()
+    _check_generation()
+    return BUILDERS_CHANGES
+
+
+def _load_index_section(name, compute):
+    """
+    Return a structure derived from allthethings.json.
+
+    If the index of allthethings.json already has it we load it from there,
+    otherwise, we call compute() and store its result in the index for the
+    processes that come after us.
+    """
+    data = fetch_allthethings_data()
+    value = load_index_section(name, data)
+    if value is None:
+        LOG.debug("Computing '%s' from allthethings data." % name)
+        value = compute()
+        save_index_section(name, value, data)
+
+    return value
+
+
 def is_upstream(buildername):
     """Determine if a job triggered by any other."""
     return not is_downstream(buildername)
@@ -60,22 +477,68 @@ def is_downstream(buildername):
     return get_buildername_metadata(buildername)['downstream']
 
 
-def _process_data():
-    """Filling the dictionaries used by determine_upstream_builder."""
-    # We check if we already computed before
-    if BUILDERNAME_TO_TRIGGER:
+def _load_builders_data(force=False):
+    """
+    Fill the structures derived from the builders and schedulers of allthethings.json.
+
+    SHORTNAME_TO_NAME, BUILDERNAME_TO_TRIGGER, BUILD_JOBS, UPSTREAM_BUILDERS,
+    UPSTREAM_TO_DOWNSTREAM and SETA_DICT are computed together once per generation
+    of the allthethings data (see _generate_builders_data()). Use force to compute
+    them again.
+    """
+    global UPSTREAM_TO_DOWNSTREAM, SETA_DICT
+
+    data = fetch_allthethings_data()
+    _check_generation()
+    if UPSTREAM_TO_DOWNSTREAM is not None and not force:
         return
 
+    if force:
+        builders_data = _generate_builders_data()
+        save_index_section('builders-data', builders_data, data)
+    else:
+        builders_data = _load_index_section('builders-data', _generate_builders_data)
+
+    # Other modules might hold a reference to these; we update them in place
+    for name, dictionary in (('shortname_to_name', SHORTNAME_TO_NAME),
+                             ('buildername_to_trigger', BUILDERNAME_TO_TRIGGER),
+                             ('build_jobs', BUILD_JOBS),
+                             ('upstream_builders', UPSTREAM_BUILDERS)):
+        dictionary.clear()
+        dictionary.update(builders_data[name])
+
+    # marshal does not support defaultdict; we store a plain dictionary
+    UPSTREAM_TO_DOWNSTREAM = collections.defaultdict(list, builders_data['relations'])
+    SETA_DICT = builders_data['seta']
+
+
+def _generate_builders_data():
+    """
+    Compute the structures filled by _load_builders_data().
+
+    We need a single pass over the builders and another one over the schedulers;
+    the metadata of the builders comes from the cache of get_buildername_metadata().
+    """
     LOG.debug("Computing builders' relations from allthethings data.")
+    wanted_builders = _get_builders_index()['wanted']
+    shortname_to_name = {}
+    buildername_to_trigger = {}
+    build_jobs = {}
+    seta = {}
+
     # We'll look at every builder and if it's a build job we will add it
     # to SHORTNAME_TO_NAME
-    for buildername, builderinfo in fetch_allthethings_data()['builders'].iteritems():
-        if not _wanted_builder(buildername):
-            continue
-
-        if is_upstream(buildername):
-            SHORTNAME_TO_NAME[builderinfo['shortname']] = buildername
-            BUILD_JOBS[buildername.lower()] = buildername
+    builders = fetch_allthethings_data()['builders']
+    downstream_builders = []
+    for buildername in wanted_builders:
+        if get_buildername_metadata(buildername)['downstream']:
+            downstream_builders.append(buildername)
+        else:
+            shortname = builders[buildername]['shortname']
+            # A few build jobs share their shortname; we always pick the same one
+            if buildername > shortname_to_name.get(shortname):
+                shortname_to_name[shortname] = buildername
+            build_jobs[buildername.lower()] = buildername
 
     # data['schedulers'] is a dictionary that maps a scheduler name to a
     # dictionary of it's properties:
@@ -96,8 +559,54 @@ def _process_data():
             continue
 
         for buildername in values['downstream']:
-            assert buildername.lower() not in BUILDERNAME_TO_TRIGGER
-            BUILDERNAME_TO_TRIGGER[buildername.lower()] = values['triggered_by'][0]
+            assert buildername.lower() not in buildername_to_trigger
+            buildername_to_trigger[buildername.lower()] = values['triggered_by'][0]
+
+        seta.update(_get_scheduler_SETA_intervals(sched, values))
+
+    upstream_builders = {}
+    for buildername in builders:
+        try:
+            upstream_builders[buildername] = _find_upstream_builder(
+                buildername, shortname_to_name, buildername_to_trigger, build_jobs)
+        except MozciError:
+            upstream_builders[buildername] = NO_BUILD_JOB
+
+    relations = {}
+    for buildername in downstream_builders:
+        upstream = upstream_builders[buildername]
+        if upstream is NO_BUILD_JOB:
+            LOG.debug("We didn't find a build job matching %s" % buildername)
+            continue
+        relations.setdefault(upstream, []).append(buildername)
+
+    return {
+        'shortname_to_name': shortname_to_name,
+        'buildername_to_trigger': buildername_to_trigger,
+        'build_jobs': build_jobs,
+        'upstream_builders': upstream_builders,
+        'relations': relations,
+        'seta': seta,
+    }
+
+
+def _get_scheduler_SETA_intervals(sched, values):
+    """Return the SETA interval of every builder scheduled by a test scheduler."""
+    # Example scheduler names:
+    # tests-fx-team-snowleopard-debug-unittest-7-3600
+    # tests-fx-team-snowleopard-opt-unittest-7-3600
+    sched_str_list = sched.split('-')
+    # Only schedulers with SETA information have a numeric value
+    # [u'tests', u'fx', u'team', u'snowleopard', u'opt', u'unittest', u'7', u'3600']
+    # [u'tests', u'fx', u'team', u'ubuntu64_vm', u'opt', u'unittest']
+    # We can call isnumeric because it is a unicode value
+    if not sched_str_list[-1].isnumeric():
+        return {}
+
+    pushes = int(sched_str_list[-2])
+    seconds = int(sched_str_list[-1])
+    # Iterate over all the downstream builders this scheduler schedules
+    return {buildername: [pushes, seconds] for buildername in values['downstream']}
 
 
 def get_SETA_interval_dict(force=False):
@@ -114,40 +623,12 @@ def get_SETA_interval_dict(force=False):
     :rtype: dict
 
     """
-    global SETA_DICT
-
-    if SETA_DICT and not force:
-        return SETA_DICT
-
-    SETA_DICT = {}
-    for sched, values in fetch_allthethings_data()['schedulers'].iteritems():
-        # We are only interested in test schedulers
-        # Example scheduler names:
-        # tests-fx-team-snowleopard-debug-unittest-7-3600
-        # tests-fx-team-snowleopard-opt-unittest-7-3600
-        if not sched.startswith('tests-'):
-            continue
-
-        sched_str_list = sched.split('-')
-        # Only schedulers with SETA information have a numeric value
-        # [u'tests', u'fx', u'team', u'snowleopard', u'opt', u'unittest', u'7', u'3600']
-        # [u'tests', u'fx', u'team', u'ubuntu64_vm', u'opt', u'unittest']
-        # We can call isnumeric because it is a unicode value
-        if sched_str_list[-1].isnumeric():
-            pushes = int(sched_str_list[-2])
-            seconds = int(sched_str_list[-1])
-            # Iterate over all the downstream builders this scheduler schedules
-            for buildername in values['downstream']:
-                SETA_DICT[buildername] = [pushes, seconds]
-
+    _load_builders_data(force=force)
     return SETA_DICT
 
 
 def get_SETA_info(buildername):
-    if not SETA_DICT:
-        get_SETA_interval_dict()
-
-    return SETA_DICT.get(buildername, None)
+    return get_SETA_interval_dict().get(buildername, None)
 
 
 def get_max_pushes(buildername):
@@ -179,22 +660,70 @@ def determine_upstream_builder(buildername):
 
     Raises MozciError if no matching build job is found.
     """
-    _process_data()
+    _load_builders_data()
+    upstream = UPSTREAM_BUILDERS.get(buildername)
+    if upstream is None and buildername not in UPSTREAM_BUILDERS:
+        # This is not a builder from allthethings.json (e.g. it is in lower case)
+        try:
+            upstream = _find_upstream_builder(
+                buildername, SHORTNAME_TO_NAME, BUILDERNAME_TO_TRIGGER, BUILD_JOBS)
+        except MozciError:
+            upstream = NO_BUILD_JOB
+
+    if upstream is NO_BUILD_JOB:
+        LOG.error("We didn't find a build job matching %s" % buildername)
+        raise MozciError("No build job matching %s found." % buildername)
+
+    return upstream
+
+
+def get_builders_without_upstream():
+    """
+    Return the test jobs for which we cannot determine the build job triggering them.
+
+    These are the builders returned by list_builders() for which
+    determine_upstream_builder() raises MozciError or returns None.
+    """
+    _load_builders_data()
+    builders = []
+    for buildername in list_builders():
+        if get_buildername_metadata(buildername)['downstream'] and \
+           not UPSTREAM_BUILDERS[buildername]:
+            builders.append(buildername)
+
+    return sorted(builders)
+
 
+def _find_upstream_builder(buildername, shortname_to_name, buildername_to_trigger, build_jobs):
+    """Find the build job of buildername with the dictionaries described at the top."""
     # For some platforms in mozilla-beta and mozilla-aurora there are both
     # talos and pgo talos jobs, only the pgo talos ones are valid.
     if 'mozilla-beta' in buildername or 'mozilla-aurora' in buildername:
         if 'talos' in buildername and 'pgo' not in buildername:
             buildername_with_pgo = buildername.replace('talos', 'pgo talos')
-            if buildername_with_pgo.lower() in BUILDERNAME_TO_TRIGGER:
+            if buildername_with_pgo.lower() in buildername_to_trigger:
                 # The non pgo talos builders don't have a parent to trigger them
                 return
 
     # If a buildername is in BUILD_JOBS, it means that it's a build job
     # and it should be returned unchanged
-    if buildername.lower() in BUILD_JOBS:
-        return str(BUILD_JOBS[buildername.lower()])
+    if buildername.lower() in build_jobs:
+        return str(build_jobs[buildername.lower()])
 
+    # Guess the build job's shortname from the test job's trigger
+    # e.g. from "larch-android-api-11-opt-unittest"
+    # look for "larch-android-api-11" in SHORTNAME_TO_NAME and find
+    # "Android armv7 API 11+ larch build"
+    if buildername.lower() not in buildername_to_trigger:
+        raise MozciError("No build job matching %s found." % buildername)
+
+    for shortname in _get_trigger_shortnames(buildername_to_trigger[buildername.lower()]):
+        if shortname in shortname_to_name:
+            return str(shortname_to_name[shortname])
+
+
+def _get_trigger_shortnames(trigger):
+    """Return the shortnames that the build job activating trigger might have (in order)."""
     # For some (but not all) platforms and repos, -pgo is explicit in
     # the trigger but not in the shortname, e.g. "Linux
     # mozilla-release build" shortname is "mozilla-release-linux" but
@@ -202,25 +731,16 @@ def determine_upstream_builder(buildername):
     # "mozilla-release-linux-pgo-unittest"
     SUFFIXES = ['-opt-unittest', '-unittest', '-talos', '-pgo']
 
-    # Guess the build job's shortname from the test job's trigger
-    # e.g. from "larch-android-api-11-opt-unittest"
-    # look for "larch-android-api-11" in SHORTNAME_TO_NAME and find
-    # "Android armv7 API 11+ larch build"
-    if buildername.lower() not in BUILDERNAME_TO_TRIGGER:
-        LOG.error("We didn't find a build job matching %s" % buildername)
-        raise MozciError("No build job matching %s found." % buildername)
-
-    shortname = BUILDERNAME_TO_TRIGGER[buildername.lower()]
+    shortnames = []
+    shortname = trigger
     for suffix in SUFFIXES:
         if shortname.endswith(suffix):
             shortname = shortname[:-len(suffix)]
-            if shortname in SHORTNAME_TO_NAME:
-                return str(SHORTNAME_TO_NAME[shortname])
+            shortnames.append(shortname)
 
     # B2G jobs are weird
-    shortname = "b2g_" + shortname.replace('-emulator', '_emulator') + "_dep"
-    if shortname in SHORTNAME_TO_NAME:
-        return str(SHORTNAME_TO_NAME[shortname])
+    shortnames.append("b2g_" + shortname.replace('-emulator', '_emulator') + "_dep")
+    return shortnames
 
 
 def _get_raw_builder_metadata(buildername):
@@ -233,6 +753,20 @@ def _get_repo_name(repo_path):
     return os.path.basename(repo_path) if '/' in repo_path else repo_path
 
 
+def _generate_builders_metadata():
+    """Create a dictionary with the metadata of every builder in allthethings.json."""
+    metadata = {}
+    for buildername in fetch_allthethings_data()['builders']:
+        try:
+            metadata[buildername] = _get_buildername_metadata(buildername)
+        except (AttributeError, KeyError, TypeError):
+            # Some builders (e.g. release builders) lack the properties we need;
+            # get_buildername_metadata() will raise the error if asked about them
+            continue
+
+    return metadata
+
+
 def get_buildername_metadata(buildername):
     """Return metadata associated to a buildername.
 
@@ -246,11 +780,33 @@ def get_buildername_metadata(buildername):
         * suite_name - talos & test jobs have an associated suite name (e.g chromez)
         * nightly - Tells us whether a job is a nightly job
     """
-    if buildername not in fetch_allthethings_data()['builders']:
+    global BUILDERS_METADATA
+
+    builders = fetch_allthethings_data()['builders']
+    if buildername not in builders:
         raise MissingBuilderError("Builder '{}' is missing. All builders' length: {}".format(
-            buildername, len(fetch_allthethings_data()['builders']))
+            buildername, len(builders))
         )
 
+    _check_generation()
+    meta = METADATA_CACHE.get(buildername)
+    if meta is not None:
+        return meta
+
+    if BUILDERS_METADATA is None:
+        BUILDERS_METADATA = _load_index_section('metadata', _generate_builders_metadata)
+
+    if buildername in BUILDERS_METADATA:
+        meta = BuilderMetadata(BUILDERS_METADATA[buildername])
+    else:
+        meta = BuilderMetadata(_get_buildername_metadata(buildername))
+
+    METADATA_CACHE[buildername] = meta
+    return meta
+
+
+def _get_buildername_metadata(buildername):
+    """Compute the metadata of a buildername from its properties in allthethings.json."""
     props = _get_raw_builder_metadata(buildername)['properties']
 
     meta = {
@@ -481,37 +1037,28 @@ def find_buildernames(repo, suite_name=None, platform=None, job_type='opt'):
         'suite_name and platform cannot both be None.'
 
     buildernames = list_builders(repo)
+    index = _get_builders_index()
 
     if suite_name is not None:
-        buildernames = filter(
-            lambda x:
-            get_buildername_metadata(x)['suite_name'] == suite_name,
-            buildernames)
+        matching = index['suite_name'].get(suite_name, set())
     # If no specific suite has been chosen we should then select all tests jobs
     else:
-        buildernames = filter(lambda x: is_downstream(x), buildernames)
+        matching = index['downstream'].get(True, set())
 
     if platform is not None:
-        buildernames = filter(lambda x:
-                              get_associated_platform_name(x) == platform,
-                              buildernames)
+        matching = matching & index['platform_name'].get(platform, set())
 
     if job_type is not None:
-        buildernames = filter(lambda x: _get_job_type(x) == job_type, buildernames)
+        matching = matching & index['build_type'].get(job_type, set())
 
-    return buildernames
+    return [b for b in buildernames if b in matching]
 
 
 def filter_buildernames(buildernames, include=[], exclude=[]):
     """Return every builder matching the words in include and not in exclude."""
-
-    for word in include:
-        buildernames = filter(lambda x: word.lower() in x.lower(), buildernames)
-
-    for word in exclude:
-        buildernames = filter(lambda x: word.lower() not in x.lower(), buildernames)
-
-    return sorted(buildernames)
+    buildernames = list(buildernames)
+    index = _get_buildernames_index(buildernames)
+    return sorted(index.filter(include=include, exclude=exclude))
 
 
 def _wanted_builder(builder, filter=True):
@@ -545,38 +1092,81 @@ def _wanted_builder(builder, filter=True):
     return True
 
 
+def _get_builders_index():
+    """
+    Return an index of the builders in allthethings.json.
+
+    It is built once per generation of allthethings data and it contains:
+        * builders - every builder (in the order of allthethings.json)
+        * wanted - the builders for which _wanted_builder() is True (same order)
+        * broken - the builders we cannot determine the metadata of
+        * one dictionary per key in INDEXED_KEYS mapping every value of that
+          metadata key to the set of builders with such value
+        * queries - results of list_builders() for each repo_name & filter
+    """
+    global BUILDERS_INDEX
+
+    fetch_allthethings_data()
+    _check_generation()
+    if BUILDERS_INDEX is not None:
+        return BUILDERS_INDEX
+
+    LOG.debug("Indexing the builders of allthethings data.")
+    index = {key: collections.defaultdict(set) for key in INDEXED_KEYS}
+    index.update({
+        'builders': list(fetch_allthethings_data()['builders']),
+        'wanted': [],
+        'broken': set(),
+        'queries': {},
+    })
+    for buildername in index['builders']:
+        try:
+            meta = get_buildername_metadata(buildername)
+        except (AttributeError, KeyError, TypeError):
+            meta = None
+        else:
+            for key in INDEXED_KEYS:
+                index[key][meta[key]].add(buildername)
+
+        # See _wanted_builder() to understand why we check release builders first
+        if buildername.startswith('release-') or buildername.endswith('bundle'):
+            continue
+
+        if meta is None:
+            index['broken'].add(buildername)
+        elif _wanted_builder(buildername):
+            index['wanted'].append(buildername)
+
+    BUILDERS_INDEX = index
+    return BUILDERS_INDEX
+
+
 def list_builders(repo_name=None, filter=True):
     """Return a list of all builders running in the buildbot CI."""
-    all_builders = fetch_allthethings_data()['builders']
-    assert len(all_builders) > 0, "The list of builders cannot be empty."
+    index = _get_builders_index()
+    assert len(index['builders']) > 0, "The list of builders cannot be empty."
 
     # Let's filter out builders which are not triggered per push
     # and are not associated to a repo_name if set
-    builders_list = []
-    for builder in all_builders.keys():
-        if repo_name and repo_name not in builder:
-            continue
-        if _wanted_builder(builder=builder, filter=filter):
-            builders_list.append(builder)
+    key = (repo_name, filter)
+    if key not in index['queries']:
+        if filter:
+            for builder in index['broken']:
+                if not repo_name or repo_name in builder:
+                    # This raises the error which prevents us from using this builder
+                    get_buildername_metadata(builder)
 
-    return builders_list
+        builders_list = index['wanted'] if filter else index['builders']
+        if repo_name:
+            builders_list = [b for b in builders_list if repo_name in b]
+        index['queries'][key] = builders_list
 
-
-def _generate_builders_relations_dictionary():
-    """Create a dictionary that maps every upstream job to its downstream jobs."""
-    builders = list_builders()
-    relations = collections.defaultdict(list)
-    for buildername in builders:
-        if is_downstream(buildername):
-            relations[determine_upstream_builder(buildername)].append(buildername)
-    return relations
+    return list(index['queries'][key])
 
 
 def load_relations():
     """Loads upstream to downstream mapping."""
-    global UPSTREAM_TO_DOWNSTREAM
-    if UPSTREAM_TO_DOWNSTREAM is None:
-        UPSTREAM_TO_DOWNSTREAM = _generate_builders_relations_dictionary()
+    _load_builders_data()
 
 
 def get_downstream_jobs(upstream_job):
@@ -10,7 +10,14 @@ from thclient import TreeherderClient
 from mozci.errors import TreeherderError, BuildapiError, BuildjsonError
 from mozci.utils.authentication import get_credentials
 from mozci.platforms import list_builders
-from mozci.sources.buildjson import query_job_data
+from mozci.sources.buildjson import (
+    REVISION_LENGTH,
+    cached_dates,
+    find_jobs_by_date,
+    index_revisions,
+    query_job_data,
+    query_jobs_data
+)
 
 
 LOG = logging.getLogger('mozci')
@@ -58,9 +65,32 @@ class QueryApi(object):
         pass
 
     @abstractmethod
-    def get_job_status(self, job):
+    def get_job_status(self, job, jobs_data=None):
         pass
 
+    def get_jobs_data(self, jobs):
+        """
+        Return what get_job_status() needs to determine the status of several jobs.
+
+        The value returned has to be passed to get_job_status() through jobs_data.
+        It allows sources to fetch the data of many jobs at once.
+        """
+        return None
+
+    def get_jobs_data_or_none(self, jobs):
+        """
+        Return get_jobs_data() for jobs or None if we cannot get it.
+
+        With None, get_job_status() looks up every job on its own; a job we
+        cannot find does not prevent us from getting the status of the others.
+        """
+        try:
+            return self.get_jobs_data(jobs)
+        except BuildjsonError as e:
+            LOG.info("We could not get the status information of the jobs at once (%s)."
+                     % str(e))
+            return None
+
     def determine_missing_jobs(self, repo_name, revision, considered_list_of_builders=None):
         if considered_list_of_builders is None:
             considered_list_of_builders = list_builders(repo_name=repo_name)
@@ -109,12 +139,13 @@ class QueryApi(object):
 
         """
         all_jobs = self.get_all_jobs(repo_name, revision)
+        jobs_data = self.get_jobs_data_or_none(all_jobs)
         wrong_status_builders = set()
         correct_status_builders = set()
         for job in all_jobs:
             buildername = job["buildername"]
             try:
-                if self.get_job_status(job) != status:
+                if self.get_job_status(job, jobs_data) != status:
                     wrong_status_builders.add(buildername)
                 else:
                     if buildername in considered_list_of_builders:
@@ -126,6 +157,33 @@ class QueryApi(object):
         correct_status_builders = correct_status_builders - wrong_status_builders
         return list(correct_status_builders)
 
+    def find_all_jobs_by_status(self, repo_name, revision, status):
+        """
+        Find all jobs with status 'status' in a given branch and revision.
+
+        Returns a list with the request_ids of the jobs whose only status is 'status'.
+        """
+        all_jobs = self.get_all_jobs(repo_name, revision)
+        jobs_data = self.get_jobs_data_or_none(all_jobs)
+        request_id_by_buildername = {}
+        right_status_buildernames = set()
+        wrong_status_buildernames = set()
+        for job in all_jobs:
+            buildername = job["buildername"]
+            try:
+                if self.get_job_status(job, jobs_data) == status:
+                    request_id = self.get_buildapi_request_id(repo_name, job)
+                    request_id_by_buildername[buildername] = request_id
+                    right_status_buildernames.add(buildername)
+                else:
+                    wrong_status_buildernames.add(buildername)
+            except BuildjsonError:
+                LOG.info('We were not able to find status information for "%s"'
+                         % buildername)
+
+        buildernames = right_status_buildernames - wrong_status_buildernames
+        return sorted([request_id_by_buildername[b] for b in buildernames])
+
 
 class BuildApi(QueryApi):
 
@@ -170,10 +228,21 @@ class BuildApi(QueryApi):
                   (len(matching_jobs), buildername))
         return matching_jobs
 
-    def get_job_status(self, job):
+    def get_jobs_data(self, jobs):
+        """Return the buildjson data of the successful jobs (see _is_coalesced())."""
+        requests = [job["requests"][0] for job in jobs if job.get("status") == SUCCESS]
+        if not requests:
+            return {}
+
+        return query_jobs_data([(req["complete_at"], req["request_id"]) for req in requests])
+
+    def get_job_status(self, job, jobs_data=None):
         """
         Helper to determine the scheduling status of a job from self-serve.
 
+        jobs_data can be the value returned by get_jobs_data() for a list of
+        jobs including job.
+
         Raises BuildapiError on an unexpected status.
         """
         if "status" not in job:
@@ -190,19 +259,22 @@ class BuildApi(QueryApi):
 
         if status == SUCCESS:
             # The success status for self-serve can actually be a coalesced job
-            return self._is_coalesced(job)
+            return self._is_coalesced(job, jobs_data)
 
         LOG.debug(job)
         raise BuildapiError("Unexpected status")
 
-    def _is_coalesced(self, job):
+    def _is_coalesced(self, job, jobs_data=None):
         """Helper method to determine if a job with status 'SUCCESS' is coalesced.
            Bug: https://bugzilla.mozilla.org/show_bug.cgi?id=1175611
         """
         assert job["status"] == SUCCESS
 
         req = job["requests"][0]
-        status_data = query_job_data(req["complete_at"], req["request_id"])
+        if jobs_data is not None and req["request_id"] in jobs_data:
+            status_data = jobs_data[req["request_id"]]
+        else:
+            status_data = query_job_data(req["complete_at"], req["request_id"])
         if not status_data:
             LOG.info("We have not found the job. We assume the job to be running.")
             return RUNNING
@@ -212,31 +284,98 @@ class BuildApi(QueryApi):
         else:
             return SUCCESS
 
-    def find_all_jobs_by_status(self, repo_name, revision, status):
+
+class BuildjsonApi(QueryApi):
+    """
+    Query the jobs of the day files of buildjson in our cache; it never goes online.
+
+    The day files from start_date to end_date (e.g. 2015-06-22; all of them by
+    default) which are in the cache directory are indexed by revision the
+    first time we need them (see buildjson.prefetch() to download a range).
+
+    Jobs are the ones of buildjson (see buildjson.query_job_data()) with an
+    additional "buildername" key. A job is not on the day files under the
+    revision it was requested for if it was coalesced into a later one; those
+    jobs are missing jobs for this source and it finds no COALESCED jobs.
+    """
+
+    def __init__(self, start_date=None, end_date=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self._dates_by_revision = None
+
+    def _get_dates(self, revision):
+        """Return the dates of the day files with jobs of revision."""
+        if self._dates_by_revision is None:
+            dates = cached_dates(self.start_date, self.end_date)
+            LOG.debug("Indexing the revisions of %d day file(s)." % len(dates))
+            self._dates_by_revision = index_revisions(dates)
+
+        return self._dates_by_revision.get(revision[:REVISION_LENGTH], [])
+
+    def invalidate_index(self):
+        """Index the day files again the next time we need them (e.g. after a prefetch)."""
+        self._dates_by_revision = None
+
+    def _find_jobs(self, repo_name, revision, buildername=None):
+        jobs = []
+        for date in self._get_dates(revision):
+            for job in find_jobs_by_date(date, buildername=buildername, revision=revision,
+                                         offline=True):
+                # The same revision can be pushed to several repositories
+                repo_path = job["properties"].get("repo_path")
+                if repo_path and repo_path.rstrip("/").split("/")[-1] != repo_name:
+                    continue
+
+                jobs.append(dict(job, buildername=job["properties"].get("buildername")))
+
+        return jobs
+
+    def get_all_jobs(self, repo_name, revision):
         """
-        Find all jobs with status 'status' in a given branch and revision.
+        Return a list with all jobs for that revision.
 
-        Returns a list with the request_ids of the jobs whose only status is 'status'.
+        If none of the day files in our cache has jobs of this revision we return an empty list.
         """
-        all_jobs = self.get_all_jobs(repo_name, revision)
-        request_id_by_buildername = {}
-        right_status_buildernames = set()
-        wrong_status_buildernames = set()
-        for job in all_jobs:
-            buildername = job["buildername"]
-            try:
-                if self.get_job_status(job) == status:
-                    request_id = self.get_buildapi_request_id(repo_name, job)
-                    request_id_by_buildername[buildername] = request_id
-                    right_status_buildernames.add(buildername)
-                else:
-                    wrong_status_buildernames.add(buildername)
-            except BuildjsonError:
-                LOG.info('We were not able to find status information for "%s"'
-                         % buildername)
+        return self._find_jobs(repo_name, revision)
 
-        buildernames = right_status_buildernames - wrong_status_buildernames
-        return sorted([request_id_by_buildername[b] for b in buildernames])
+    def get_matching_jobs(self, repo_name, revision, buildername):
+        """Return all jobs that matched the criteria."""
+        LOG.debug("Find jobs matching '%s'" % buildername)
+        matching_jobs = self._find_jobs(repo_name, revision, buildername)
+        LOG.debug("We have found %d job(s) of '%s'." %
+                  (len(matching_jobs), buildername))
+        return matching_jobs
+
+    def get_buildapi_request_id(self, repo_name, job):
+        """
+        Method to return buildapi's request_id for a job.
+
+        Raises BuildjsonError if the job has no request ids.
+        """
+        # XXX: Issue 104 - request ids can be in the job or in its properties
+        request_ids = job.get("request_ids") or job["properties"].get("request_ids")
+        if not request_ids:
+            raise BuildjsonError("The job of '%s' has no request ids." % job.get("buildername"))
+        return request_ids[0]
+
+    def get_job_status(self, job, jobs_data=None):
+        """
+        Helper to determine the status of a job of buildjson.
+
+        Day files only have jobs which have completed.
+
+        Raises BuildjsonError on an unexpected result.
+        """
+        status = job.get("result")
+        if status is None:
+            return UNKNOWN
+
+        if status in (SUCCESS, WARNING, FAILURE, SKIPPED, EXCEPTION, RETRY, CANCELLED):
+            return status
+
+        LOG.debug(job)
+        raise BuildjsonError("Unexpected result")
 
 
 class TreeherderApi(QueryApi):
@@ -297,7 +436,7 @@ class TreeherderApi(QueryApi):
                   (len(matching_jobs), buildername))
         return matching_jobs
 
-    def get_job_status(self, job):
+    def get_job_status(self, job, jobs_data=None):
         """
         Helper to determine the scheduling status of a job from treeherder.
 
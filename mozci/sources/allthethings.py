@@ -45,14 +45,42 @@ It contains a dictionary with 4 keys:
 
 * **master_builders**
 * **slavepools**
+
+Decoding the whole file with json.load() takes most of the start up time of a
+short lived process. Because of this, the first process that loads a given
+allthethings.json writes a binary index (marshal) next to it. The index holds
+the sections mozci uses (builders and schedulers) and any structure that
+mozci.platforms derives from them (e.g. the metadata of every builder). The
+index is tied to the size and modification time of allthethings.json, thus, it
+is rebuilt as soon as a new allthethings.json is downloaded.
+
+We only ask the server for a newer allthethings.json once every CACHE_TTL
+seconds; we send the ETag and Last-Modified values of the copy we have and a
+new file only replaces it after it has been completely downloaded. Set OFFLINE
+to True to always use the last good copy on disk.
+
+Set MEMORY_SAVING_MODE to True to stream allthethings.json with ijson instead
+of decoding it all at once. In that mode we only keep the builders (with the
+properties that mozci uses) and the schedulers.
 """
 import json
 import logging
+import marshal
 import os
+import sys
+import time
 
 import requests
 
-from mozci.utils.transfer import path_to_file
+from mozci.errors import MozciError
+from mozci.utils import network
+from mozci.utils.transfer import (
+    build_ijson_value,
+    ijson,
+    path_to_file,
+    replace_file,
+    skip_ijson_value
+)
 
 LOG = logging.getLogger('mozci')
 
@@ -60,71 +88,330 @@ FILENAME = path_to_file("allthethings.json")
 ALLTHETHINGS = \
     "https://secure.pub.build.mozilla.org/builddata/reports/allthethings.json"
 
+# Number of seconds during which we use the file on disk without asking the server
+CACHE_TTL = 60 * 60
+# If True, we never reach the network and we use the last good copy on disk
+OFFLINE = False
+MAX_DOWNLOAD_ATTEMPTS = 3
+
 DATA = None
+# It is increased every time DATA is (re)loaded. Modules which derive data from
+# DATA can use it to know when their derived data is stale.
+GENERATION = 0
 
+# Bump this value if the format of the index changes
+INDEX_VERSION = 1
+# These keys are never read by mozci; we don't keep them in memory nor in the index
+UNUSED_KEYS = ('master_builders', 'slavepools')
 
-def fetch_allthethings_data(no_caching=False, verify=True):
+MEMORY_SAVING_MODE = False
+# What we keep of every builder in memory saving mode
+BUILDER_KEYS = ('properties', 'shortname')
+# The builder properties get_buildername_metadata() needs
+BUILDER_PROPERTIES = ('branch', 'platform', 'product', 'slavebuilddir', 'stage_platform')
+# Signature of allthethings.json when DATA was loaded; None if DATA is not backed by it
+_DATA_SIGNATURE = None
+
+
+def _index_path(section):
+    """Return the path of the index file for a section of allthethings.json."""
+    return "%s.%s.idx" % (FILENAME, section)
+
+
+def _file_signature():
+    """Return what identifies the current allthethings.json on disk (None if missing)."""
+    if not os.path.exists(FILENAME):
+        return None
+
+    statinfo = os.stat(FILENAME)
+    return (INDEX_VERSION, tuple(sys.version_info[:2]), statinfo.st_size, statinfo.st_mtime)
+
+
+def _read_index_file(section, signature):
+    """Return the contents of an index file if it was generated for signature."""
+    path = _index_path(section)
+    if signature is None or not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as fd:
+            if marshal.load(fd) != signature:
+                LOG.debug("%s is outdated." % path)
+                return None
+            return marshal.load(fd)
+    except (EOFError, IOError, ValueError, TypeError) as e:
+        LOG.debug("%s is corrupted (%s)." % (path, str(e)))
+        return None
+
+
+def _write_index_file(section, value, signature):
+    """Write atomically an index file; a concurrent reader never sees half of it."""
+    path = _index_path(section)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fd:
+            marshal.dump(signature, fd)
+            marshal.dump(value, fd)
+        replace_file(tmp_path, path)
+    except (IOError, OSError, ValueError) as e:
+        # The index is an optimization; not being able to write it is not fatal
+        LOG.debug("We could not write %s (%s)." % (path, str(e)))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_index_section(name, data):
     """
-    It fetches the allthethings.json file.
+    Return a section from the index of allthethings.json or None if not available.
 
-    If no_caching is True, we fetch it every time without creating a file.
-    If verify is False, we load from disk without checking. This should only be used if
-    allthethings.json exists and it's trusted.
+    Sections are only available for data, if data is what fetch_allthethings_data()
+    loaded from allthethings.json.
+    """
+    if data is None or data is not DATA or _DATA_SIGNATURE is None:
+        return None
+
+    if _file_signature() != _DATA_SIGNATURE:
+        # allthethings.json has been replaced since we loaded data
+        return None
+
+    return _read_index_file(name, _DATA_SIGNATURE)
+
+
+def save_index_section(name, value, data):
+    """
+    Store in the index of allthethings.json a value derived from data.
+
+    Nothing is stored unless data is what fetch_allthethings_data() loaded from
+    allthethings.json. The value must be of a type supported by marshal.
+    """
+    if data is None or data is not DATA or _DATA_SIGNATURE is None:
+        return
+
+    if _file_signature() != _DATA_SIGNATURE:
+        return
+
+    _write_index_file(name, value, _DATA_SIGNATURE)
+
+
+def _lean_load_file():
+    """
+    Stream allthethings.json and keep only what mozci uses.
+
+    Builders are built one at a time and only BUILDER_KEYS and BUILDER_PROPERTIES
+    are kept; schedulers are kept as they are; anything else is skipped.
+    """
+    LOG.debug("About to stream %s." % FILENAME)
+    data = {}
+    with open(FILENAME, 'rb') as fd:
+        events = ijson.parse(fd)
+        for prefix, event, value in events:
+            if prefix != '' or event != 'map_key':
+                continue
+
+            if value == 'builders':
+                builders = {}
+                for prefix, event, buildername in events:
+                    if event == 'end_map' and prefix == 'builders':
+                        break
+                    if event != 'map_key':
+                        continue
+
+                    info = build_ijson_value(events)
+                    builder = {key: info[key] for key in BUILDER_KEYS if key in info}
+                    if 'properties' in builder:
+                        builder['properties'] = {
+                            key: builder['properties'][key] for key in BUILDER_PROPERTIES
+                            if key in builder['properties']
+                        }
+                    builders[buildername] = builder
+
+                data['builders'] = builders
+
+            elif value == 'schedulers':
+                data['schedulers'] = build_ijson_value(events)
+
+            else:
+                skip_ijson_value(events)
+
+    return data
+
+
+def _load_file():
+    """Load allthethings.json from disk; use the index if it is current."""
+    global _DATA_SIGNATURE
+
+    signature = _file_signature()
+    # The index of each mode holds different data
+    section = 'lean-data' if MEMORY_SAVING_MODE else 'data'
+    data = _read_index_file(section, signature)
+    if data is not None:
+        LOG.debug("Loaded allthethings.json from its index.")
+    elif MEMORY_SAVING_MODE:
+        LOG.debug("Running in memory saving mode.")
+        data = _lean_load_file()
+        _write_index_file(section, data, signature)
+    else:
+        with open(FILENAME) as fd:
+            data = json.load(fd)
+
+        for key in UNUSED_KEYS:
+            data.pop(key, None)
+
+        _write_index_file(section, data, signature)
+
+    _DATA_SIGNATURE = signature
+    return data
+
+
+def _cache_info_path():
+    """Return the path of the file which describes the copy of allthethings.json on disk."""
+    return "%s.cache" % FILENAME
+
+
+def _read_cache_info():
+    """Return what we know about the copy on disk (ETag, Last-Modified, last check)."""
+    try:
+        with open(_cache_info_path()) as fd:
+            return json.load(fd)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_cache_info(info):
+    tmp_path = "%s.%d.tmp" % (_cache_info_path(), os.getpid())
+    with open(tmp_path, "w") as fd:
+        json.dump(info, fd)
+    replace_file(tmp_path, _cache_info_path())
+
+
+def _is_fresh(info):
+    """Determine if we can use the file on disk without asking the server."""
+    if not os.path.exists(FILENAME) or not info:
+        return False
+
+    if os.stat(FILENAME).st_size != info.get('size'):
+        LOG.debug("allthethings.json's size differs from the one we downloaded.")
+        return False
+
+    age = time.time() - info.get('checked_at', 0)
+    return 0 <= age < CACHE_TTL
+
+
+def _fetch(conditional=True):
     """
-    def _fetch():
+    Download allthethings.json unless the copy on disk is still current.
+
+    When conditional is True we send the ETag and Last-Modified values of the
+    copy on disk; the server replies 304 if it has not changed. A new file is
+    written to a temporary file and only replaces the current one once its
+    size matches the Content-Length sent by the server.
+
+    Raises MozciError if we cannot get a valid file.
+    """
+    info = _read_cache_info() if os.path.exists(FILENAME) else {}
+
+    headers = {}
+    if conditional:
+        if info.get('etag'):
+            headers['If-None-Match'] = info['etag']
+        if info.get('last_modified'):
+            headers['If-Modified-Since'] = info['last_modified']
+
+    for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
         LOG.debug("Fetching allthethings.json %s" % ALLTHETHINGS)
-        req = requests.get(ALLTHETHINGS, stream=True)
+        req = network.get(ALLTHETHINGS, stream=True, headers=headers)
+
+        if req.status_code == 304:
+            LOG.debug("allthethings.json on disk is current.")
+            info['checked_at'] = time.time()
+            _write_cache_info(info)
+            return
 
-        # This automatically erases the previous cached file.
-        with open(FILENAME, "wb") as fd:
-            for chunk in req.iter_content(chunk_size=1024):
+        if req.status_code != 200:
+            raise MozciError("We received %s which is unexpected." % req.status_code)
+
+        tmp_path = "%s.%d.tmp" % (FILENAME, os.getpid())
+        size = 0
+        with open(tmp_path, "wb") as fd:
+            for chunk in req.iter_content(chunk_size=10 * 1024):
                 if chunk:  # filter out keep-alive new chunks
                     fd.write(chunk)
-                    fd.flush()
+                    size += len(chunk)
 
-        # If the file is valid load it.
-        if _verify_file_integrity():
-            fd = open(FILENAME, "r")
-            data = json.load(fd)
-            LOG.debug("allthethings.json seems to load good json data.")
-            return data
-        else:
-            LOG.debug('File integrity failed. Retrying fetching the file.')
-            return _fetch()
-
-    def _verify_file_integrity():
-        ''' Check that the file does not exist and the size matches with remote.'''
+        content_length = req.headers.get('content-length')
+        if content_length is None or int(content_length) == size:
+            replace_file(tmp_path, FILENAME)
+            _write_cache_info({
+                'etag': req.headers.get('etag'),
+                'last_modified': req.headers.get('last-modified'),
+                'checked_at': time.time(),
+                'size': size,
+            })
+            return
+
+        os.remove(tmp_path)
+        LOG.debug("File integrity failed (attempt %d). Retrying fetching the file." % attempt)
+
+    raise MozciError("We could not download a valid allthethings.json.")
+
+
+def refresh_allthethings_file(verify=True):
+    """
+    Make sure that the allthethings.json on disk is current without loading it.
+
+    The same rules as in fetch_allthethings_data() apply: we only ask the server
+    for a newer file once every CACHE_TTL seconds and never if OFFLINE is True.
+
+    Returns a value which identifies the file on disk; it changes every time
+    allthethings.json is replaced.
+    """
+    if not verify:
+        assert os.path.exists(FILENAME), \
+            "verify=False should only be used if allthethings.json exists."
+    elif OFFLINE:
         if not os.path.exists(FILENAME):
-            LOG.debug("allthethings.json is not on disk.")
-            return False
-
-        statinfo = os.stat(FILENAME)
-        file_size = statinfo.st_size
-        response = requests.head(ALLTHETHINGS)
-        content_length = int(response.headers['content-length'])
-        if file_size != content_length:
-            LOG.debug("allthethings.json's file size differnts from the content length.")
-            return False
-        else:
-            LOG.debug("allthethings.json is valid.")
-            return True
-
-    global DATA
+            raise MozciError("We are offline and there is no allthethings.json on disk.")
+        LOG.debug("We are offline; we will use the allthethings.json we have on disk.")
+    elif not _is_fresh(_read_cache_info()):
+        try:
+            _fetch()
+        except (requests.exceptions.RequestException, MozciError) as e:
+            # Error statuses and truncated downloads are handled like network failures
+            if not os.path.exists(FILENAME):
+                raise MozciError("We cannot fetch allthethings.json: %s" % str(e))
+            LOG.warning("We cannot get allthethings.json from the server (%s); we will use "
+                        "the last allthethings.json that we have on disk." % str(e))
+
+    return _file_signature()
+
+
+def fetch_allthethings_data(no_caching=False, verify=True):
+    """
+    It fetches the allthethings.json file.
+
+    If no_caching is True, we fetch it every time.
+    If verify is False, we load from disk without checking. This should only be used if
+    allthethings.json exists and it's trusted.
+
+    Otherwise, we only go to the network if we have not checked the file on disk in the
+    last CACHE_TTL seconds; in that case we ask the server if it has a newer one.
+    If OFFLINE is True or the server cannot be reached, we use the last good copy on disk.
+
+    Raises MozciError if there is no way to get allthethings.json.
+    """
+    global DATA, GENERATION
 
     if no_caching:
         LOG.debug("No caching of allthethings.json.")
-        DATA = _fetch()
+        _fetch(conditional=False)
+        DATA = _load_file()
+        GENERATION += 1
     # If we do not have an in-memory cache, try to use the file cache.
     elif DATA is None:
         LOG.debug("allthethings.json is not loaded in memory.")
-        # Only use the file cache if it is up-to-date and not corrupted.
-        if not verify or _verify_file_integrity():
-            assert os.path.exists(FILENAME), \
-                "verify=False should only be used if allthethings.json exists."
-            fd = open(FILENAME)
-            DATA = json.load(fd)
-        else:
-            DATA = _fetch()
+        refresh_allthethings_file(verify)
+        DATA = _load_file()
+        GENERATION += 1
 
     return DATA
 
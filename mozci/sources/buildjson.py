@@ -3,11 +3,30 @@
 This module helps with the buildjson data generated by the Release Engineering
 systems: http://builddata.pub.build.mozilla.org/builddata/buildjson
 """
+import collections
+import datetime
 import logging
+import multiprocessing
 import os
+import re
+import threading
+import time
 
+from multiprocessing.pool import ThreadPool
+
+from progressbar import Bar, ProgressBar, SimpleProgress, Timer
+
+from mozci.errors import BuildjsonError, MozciError
+from mozci.sources.buildjson_store import JobsStore
+from mozci.utils import cache, transfer
 from mozci.utils.tzone import utc_dt, utc_time, utc_day
-from mozci.utils.transfer import load_file, path_to_file
+from mozci.utils.transfer import (
+    fetch_file,
+    load_file,
+    path_to_file,
+    read_sidecar,
+    write_sidecar
+)
 
 LOG = logging.getLogger('mozci')
 
@@ -15,27 +34,96 @@ SELFSERVE = "https://secure.pub.build.mozilla.org/buildapi/self-serve"
 BUILDJSON_DATA = "http://builddata.pub.build.mozilla.org/builddata/buildjson"
 BUILDS_4HR_FILE = "builds-4hr.js"
 BUILDS_DAY_FILE = "builds-%s.js"
-
-# This helps us read into memory and load less from disk
-BUILDS_CACHE = {}
-
-
-def fetch_by_date(date):
+# Day files as they are named in the cache directory
+DAY_FILE_RE = re.compile(r'^builds-(\d{4}-\d{2}-\d{2})\.js$')
+
+# This helps us read into memory and load less from disk. The least recently
+# used day files are dropped once they hold more than MAX_CACHED_JOBS jobs.
+# Files loaded with a projection are keyed by (filename, projection).
+BUILDS_CACHE = collections.OrderedDict()
+MAX_CACHED_JOBS = 500000
+# Number of jobs of the day files in BUILDS_CACHE
+CACHED_JOBS = 0
+# The 4 hour file is not part of MAX_CACHED_JOBS; we load it again once it
+# is older than BUILDS_4HR_TTL seconds (the server updates it every minute)
+BUILDS_4HR_TTL = 5 * 60
+# When we loaded the 4 hour file (per key of BUILDS_CACHE)
+BUILDS_4HR_LOADED_AT = {}
+# When we cannot find a job in the 4 hour file we download it again, but not
+# more than once every BUILDS_4HR_MIN_REFRESH seconds; the request ids that we
+# still cannot find are not looked for again for BUILDS_4HR_NEGATIVE_TTL seconds
+BUILDS_4HR_MIN_REFRESH = 60
+BUILDS_4HR_NEGATIVE_TTL = 60
+# request_id -> when we gave up looking for it in the 4 hour file
+MISSING_REQUEST_IDS = {}
+# Only one thread downloads the 4 hour file at a time; the others wait for it
+BUILDS_4HR_LOCK = threading.Lock()
+# Guards the changes to BUILDS_CACHE (including moving a file to the end of it)
+BUILDS_CACHE_LOCK = threading.RLock()
+CACHE_STATS = {'hits': 0, 'misses': 0, 'evictions': 0}
+# For every file in BUILDS_CACHE, the jobs we indexed and their index (see _index_jobs())
+JOBS_INDEX = {}
+# Revisions are indexed by their short form
+REVISION_LENGTH = 12
+# Number of day files prefetch() downloads at once
+PREFETCH_DOWNLOADS = 4
+# Keep the jobs of day files in a JobsStore instead of a list of dictionaries;
+# it takes a fraction of the memory and returns the same jobs (see query_job_data())
+USE_JOBS_STORE = True
+
+
+def fetch_by_date(date, projection=None):
     """ Helper method to download a buildjson file by providing a date."""
-    return _fetch_data(BUILDS_DAY_FILE % date)
+    return _fetch_data(BUILDS_DAY_FILE % date, projection)
 
 
-def _fetch_data(filename):
+def _fetch_data(filename, projection=None, offline=False):
     """
     Helper method to fetch the buildjson data we need.
 
     This function caches the uncompressed gzip files requested in the past.
 
+    If projection is set (e.g. ['endtime', 'properties.buildername']), the
+    file is streamed and only those fields of every job are kept (see
+    transfer.normalize_projection()). The jobs are cached per (file, projection).
+
+    If offline is set, a day file is loaded from the cache directory as it is
+    (see _load_day_file()); it cannot be combined with a projection.
+
     Returns all jobs inside of this buildjson file.
     """
-    global BUILDS_CACHE
-    if filename in BUILDS_CACHE:
-        return BUILDS_CACHE[filename]
+    assert not offline or (projection is None and not _is_4hr_file(filename))
+    key = _cache_key(filename, projection)
+    jobs = _get_cached_jobs(key)
+    if jobs is not None:
+        return jobs
+
+    url, filepath = _get_url_and_path(filename)
+    if projection is not None:
+        # These jobs are not indexed nor merged; they are used as they are
+        jobs = load_file(filepath, url, projection,
+                         decoded_copy=not _is_4hr_file(filename))["builds"]
+        if USE_JOBS_STORE and not _is_4hr_file(filename):
+            jobs = JobsStore(jobs)
+    elif _is_4hr_file(filename):
+        return _refresh_4hr_jobs(filename, BUILDS_4HR_TTL)
+    else:
+        jobs = _load_day_file(filename, filepath, url, offline)
+
+    _cache_jobs(key, jobs)
+    return jobs
+
+
+def _cache_key(filename, projection):
+    """Return the key of BUILDS_CACHE for the jobs of a file loaded with a projection."""
+    if projection is None:
+        return filename
+
+    return (filename, transfer.normalize_projection(projection))
+
+
+def _get_url_and_path(filename):
+    """Return the URL of a buildjson file and its path on disk."""
     url = "%s/%s.gz" % (BUILDJSON_DATA, filename)
 
     if not os.path.isabs(filename):
@@ -43,28 +131,452 @@ def _fetch_data(filename):
     else:
         filepath = filename
 
-    # If the file exists and is valid we won't download it again
-    json_contents = load_file(filepath, url)
-    BUILDS_CACHE[filename] = json_contents["builds"]
-    return json_contents["builds"]
+    return url, filepath
+
+
+def _refresh_4hr_jobs(filename, min_age):
+    """
+    Download the 4 hour file unless we loaded it less than min_age seconds ago.
+
+    The jobs of the new file are merged into the ones we have (see
+    _merge_4hr_jobs()). If several threads ask for a refresh at once, only one
+    of them downloads the file.
+
+    Returns the jobs of the 4 hour file.
+    """
+    loaded_at = BUILDS_4HR_LOADED_AT.get(filename)
+    with BUILDS_4HR_LOCK:
+        jobs = BUILDS_CACHE.get(filename)
+        if jobs is not None:
+            if BUILDS_4HR_LOADED_AT[filename] != loaded_at:
+                # Someone else refreshed it while we were waiting
+                return jobs
+            if time.time() - BUILDS_4HR_LOADED_AT[filename] < min_age:
+                return jobs
+
+        url, filepath = _get_url_and_path(filename)
+        # If the file exists and is valid we won't download it again; it changes
+        # every few minutes, thus, a decoded copy of it would hardly be read
+        jobs = _merge_4hr_jobs(filename, load_file(filepath, url, decoded_copy=False)["builds"])
+        _cache_jobs(filename, jobs)
+        return jobs
+
+
+def _merge_4hr_jobs(filename, new_jobs):
+    """
+    Add the jobs of a new copy of the 4 hour file to the jobs we have and to their index.
+
+    Jobs which are not in the 4 hour file anymore are kept until we hold twice
+    as many jobs as the new copy has; then we start over with the new copy.
+    """
+    jobs, index = JOBS_INDEX.get(filename, (None, None))
+    if jobs is None or jobs is not BUILDS_CACHE.get(filename) or \
+       len(jobs) > 2 * len(new_jobs):
+        JOBS_INDEX[filename] = (new_jobs, _index_jobs(new_jobs))
+        return new_jobs
+
+    # Jobs without request ids are told apart by their builder and start time
+    without_request_ids = set(_get_job_key(job) for job in jobs if not _get_request_ids(job))
+    merged = 0
+    for job in new_jobs:
+        request_ids = _get_request_ids(job)
+        if request_ids and all(r in index['request_ids'] for r in request_ids):
+            # We already have this job
+            continue
+        if not request_ids:
+            if _get_job_key(job) in without_request_ids:
+                continue
+            without_request_ids.add(_get_job_key(job))
+
+        _index_job(index, len(jobs), job)
+        jobs.append(job)
+        merged += 1
+
+    LOG.debug("We merged %d new jobs from %s." % (merged, filename))
+    return jobs
+
+
+def _get_job_key(job):
+    """Return what identifies a job which has no request ids."""
+    return job["properties"].get("buildername"), job.get("starttime")
+
+
+def _is_4hr_file(key):
+    """Return True if a key of BUILDS_CACHE is the one of the 4 hour file."""
+    filename = key[0] if isinstance(key, tuple) else key
+    return os.path.basename(filename) == BUILDS_4HR_FILE
+
+
+def _get_cached_jobs(key):
+    """Return the jobs of a file from BUILDS_CACHE or None if we need to load them."""
+    jobs = BUILDS_CACHE.get(key)
+    if jobs is not None and _is_4hr_file(key) and \
+       time.time() - BUILDS_4HR_LOADED_AT[key] >= BUILDS_4HR_TTL:
+        # _refresh_4hr_jobs() will merge a new copy into it (projected copies are replaced)
+        LOG.debug("Our copy of %s is too old." % str(key))
+        jobs = None
+
+    if jobs is None:
+        CACHE_STATS['misses'] += 1
+        return None
+
+    CACHE_STATS['hits'] += 1
+    with BUILDS_CACHE_LOCK:
+        # This is now the most recently used file (unless another thread evicted it)
+        if BUILDS_CACHE.get(key) is jobs:
+            BUILDS_CACHE[key] = BUILDS_CACHE.pop(key)
+    return jobs
+
+
+def _cache_jobs(key, jobs):
+    """Add the jobs of a file to BUILDS_CACHE and evict the least recently used files."""
+    global CACHED_JOBS
+
+    with BUILDS_CACHE_LOCK:
+        previous_jobs = BUILDS_CACHE.pop(key, None)
+        if previous_jobs is not None and not _is_4hr_file(key):
+            CACHED_JOBS -= len(previous_jobs)
+
+        BUILDS_CACHE[key] = jobs
+        if _is_4hr_file(key):
+            BUILDS_4HR_LOADED_AT[key] = time.time()
+            return
+
+        CACHED_JOBS += len(jobs)
+        for cached_key in list(BUILDS_CACHE):
+            if CACHED_JOBS <= MAX_CACHED_JOBS or cached_key == key:
+                # We always keep the file we have just loaded
+                break
+            if _is_4hr_file(cached_key):
+                continue
+
+            LOG.debug("Evicting %s from our cache." % str(cached_key))
+            _uncache_jobs(cached_key)
+            CACHE_STATS['evictions'] += 1
+
+
+def _uncache_jobs(key):
+    """Remove a file from BUILDS_CACHE (if present)."""
+    global CACHED_JOBS
+
+    with BUILDS_CACHE_LOCK:
+        jobs = BUILDS_CACHE.pop(key, None)
+        JOBS_INDEX.pop(key, None)
+        if jobs is not None and not _is_4hr_file(key):
+            CACHED_JOBS -= len(jobs)
+
+
+def _reset_cache():
+    """Drop every file from BUILDS_CACHE and reset its counters."""
+    global CACHED_JOBS
+
+    BUILDS_CACHE.clear()
+    JOBS_INDEX.clear()
+    CACHED_JOBS = 0
+    BUILDS_4HR_LOADED_AT.clear()
+    MISSING_REQUEST_IDS.clear()
+    for key in CACHE_STATS:
+        CACHE_STATS[key] = 0
+
+
+def get_cache_stats():
+    """
+    Return the counters of BUILDS_CACHE.
+
+    Returns a dictionary with the number of hits, misses and evictions, the
+    number of files and the number of jobs of the day files in the cache.
+    """
+    stats = dict(CACHE_STATS)
+    stats['files'] = len(BUILDS_CACHE)
+    stats['jobs'] = CACHED_JOBS
+    return stats
+
+
+def _load_day_file(filename, filepath, url, offline=False):
+    """
+    Return the jobs of a day file.
+
+    The first process which loads a day file writes next to it a sidecar file
+    with the index of its jobs. The processes which come after use the index
+    of the sidecar file instead of indexing the jobs again; the jobs themselves
+    come from load_file() (which keeps a decoded copy of the day file).
+
+    If USE_JOBS_STORE is set, the jobs are kept in a JobsStore.
+
+    If offline is set, we use the copy of the day file in the cache without
+    checking whether the server has a newer one.
+
+    Raises BuildjsonError if we are offline and there is no copy.
+    """
+    if offline and not os.path.exists(filepath):
+        raise BuildjsonError("We do not have %s in our cache." % filename)
+
+    # If the copy on disk is replaced, load_file() removes its sidecar file
+    jobs = load_file(filepath, url, offline=offline)["builds"]
+    sidecar = read_sidecar(filepath)
+    if sidecar is not None:
+        index = sidecar['index']
+    else:
+        index = _index_jobs(jobs)
+        write_sidecar(filepath, {'count': len(jobs), 'index': index})
+
+    if USE_JOBS_STORE:
+        jobs = JobsStore(jobs)
+    JOBS_INDEX[filename] = (jobs, index)
+    return jobs
+
+
+def _index_day_file(filepath):
+    """
+    Parse a day file on disk and write its sidecar file (see _load_day_file()).
+
+    The decoded copy of load_file() is written as well (if KEEP_DECODED_COPIES
+    is set), thus, loading the day file later on does not parse it either.
+
+    Returns the number of jobs of the day file or None if we could not parse it.
+    """
+    sidecar = read_sidecar(filepath)
+    if sidecar is not None:
+        return sidecar['count']
+
+    try:
+        data = transfer._load_json_file(filepath)
+    except IOError as e:
+        LOG.warning("We could not parse %s (%s)." % (filepath, str(e)))
+        return None
+    except ValueError as e:
+        # The corrupted file is downloaded again the next time we need it
+        transfer._move_corrupted_file(filepath, e)
+        return None
+
+    jobs = data["builds"]
+    write_sidecar(filepath, {'count': len(jobs), 'index': _index_jobs(jobs)})
+    if transfer.KEEP_DECODED_COPIES:
+        write_sidecar(filepath, (None, data), transfer.decoded_copy_path(filepath))
+    return len(jobs)
+
+
+def _fetch_day_file(date):
+    """Download the day file of date unless we have a current copy; return its path."""
+    url, filepath = _get_url_and_path(BUILDS_DAY_FILE % date)
+    try:
+        return fetch_file(filepath, url)
+    except MozciError as e:
+        LOG.warning("We could not download the day file of %s (%s)." % (date, str(e)))
+        return None
+
+
+def _date_range(start_date, end_date):
+    """Return the dates (YYYY-MM-DD) from start_date to end_date (both included)."""
+    start = datetime.datetime.strptime(str(start_date), '%Y-%m-%d').date()
+    end = datetime.datetime.strptime(str(end_date), '%Y-%m-%d').date()
+    return [str(start + datetime.timedelta(days=days))
+            for days in range((end - start).days + 1)]
+
+
+def prefetch(start_date, end_date, downloads=PREFETCH_DOWNLOADS, processes=None):
+    """
+    Download and index the day files from start_date to end_date (e.g. 2015-06-22).
+
+    Up to `downloads` files are downloaded at once; the files that we have and
+    are still current are not downloaded again (see transfer.fetch_file()).
+    The files are then parsed by `processes` processes (as many as CPUs by
+    default) which write their sidecar files; fetch_by_date() and
+    query_job_data() load them without parsing the day files again.
+
+    A single progress bar counts downloaded and indexed files.
+
+    Returns a dictionary mapping every date to the path of its day file (None
+    if we could not download or parse it).
+    """
+    dates = _date_range(start_date, end_date)
+    pbar = None
+    if transfer.SHOW_PROGRESS_BAR and dates:
+        widgets = ["Prefetching day files: ", Bar(marker=">", left="[", right="]"), ' ',
+                   SimpleProgress(), ' ', Timer()]
+        pbar = ProgressBar(widgets=widgets, maxval=2 * len(dates)).start()
+
+    # The progress bar above replaces the one of every download
+    show_progress_bar = transfer.SHOW_PROGRESS_BAR
+    transfer.SHOW_PROGRESS_BAR = False
+    filepaths = {}
+    try:
+        pool = ThreadPool(downloads)
+        try:
+            for date, filepath in zip(dates, pool.imap(_fetch_day_file, dates)):
+                filepaths[date] = filepath
+                if pbar:
+                    pbar.update(len(filepaths))
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        transfer.SHOW_PROGRESS_BAR = show_progress_bar
+
+    to_index = [(date, filepath) for date, filepath in sorted(filepaths.iteritems())
+                if filepath is not None]
+    done = len(dates) * 2 - len(to_index)
+    if pbar:
+        pbar.update(done)
+
+    if to_index:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.imap(_index_day_file, [filepath for _, filepath in to_index])
+            for (date, _), jobs_count in zip(to_index, results):
+                if jobs_count is None:
+                    filepaths[date] = None
+                done += 1
+                if pbar:
+                    pbar.update(done)
+        finally:
+            pool.close()
+            pool.join()
+
+    if pbar:
+        pbar.finish()
+
+    return filepaths
+
+
+def _index_jobs(jobs):
+    """
+    Return the positions of a list of jobs per request_id, buildername and revision.
+
+    The index has the following keys:
+        * request_ids - the position of the job of every request_id
+        * buildernames - the positions of the jobs of every buildername
+        * revisions - the positions of the jobs of every revision (first 12 characters)
+    """
+    index = {'request_ids': {}, 'buildernames': {}, 'revisions': {}}
+    for position, job in enumerate(jobs):
+        _index_job(index, position, job)
+
+    return index
 
 
-def _find_job(request_id, jobs, loaded_from):
+def _get_request_ids(job):
+    # XXX: Issue 104 - We have an unclear source of request ids
+    return job["request_ids"] + job["properties"].get("request_ids", [])
+
+
+def _index_job(index, position, job):
+    """Add the job at position to an index (see _index_jobs())."""
+    for request_id in _get_request_ids(job):
+        # Like a scan of the jobs, the first job with a request_id wins
+        index['request_ids'].setdefault(request_id, position)
+
+    buildername = job["properties"].get("buildername")
+    if buildername is not None:
+        index['buildernames'].setdefault(buildername, []).append(position)
+
+    revision = job["properties"].get("revision")
+    if revision:
+        index['revisions'].setdefault(revision[:REVISION_LENGTH], []).append(position)
+
+
+def _get_jobs_index(filename, offline=False):
+    """
+    Return the jobs of a buildjson file and their index (see _index_jobs()).
+
+    The index is built the first time we look into the jobs of a file and it
+    is kept as long as the same jobs are in BUILDS_CACHE.
+    """
+    jobs = _fetch_data(filename, offline=offline)
+    indexed_jobs, index = JOBS_INDEX.get(filename, (None, None))
+    if indexed_jobs is not jobs:
+        LOG.debug("Indexing the jobs of %s." % filename)
+        index = _index_jobs(jobs)
+        JOBS_INDEX[filename] = (jobs, index)
+
+    return jobs, index
+
+
+def _find_job(request_id, filename):
+    """Look for request_id in the jobs of a buildjson file."""
+    LOG.debug("We are going to look for %s in %s." % (request_id, filename))
+    jobs, index = _get_jobs_index(filename)
+    position = index['request_ids'].get(request_id)
+    return None if position is None else jobs[position]
+
+
+def find_jobs_by_date(date, buildername=None, revision=None, offline=False):
     """
-    Look for request_id in a list of jobs.
+    Return the jobs of the day file of date (e.g. 2015-06-22).
 
-    loaded_from is simply to indicate where those jobs were loaded from.
+    If buildername and/or revision are set, only the jobs matching them are returned.
+    If offline is set, only the copy of the day file in our cache is used.
     """
-    LOG.debug("We are going to look for %s in %s." % (request_id, loaded_from))
+    jobs, index = _get_jobs_index(BUILDS_DAY_FILE % date, offline)
+    positions = None
+    if buildername is not None:
+        positions = set(index['buildernames'].get(buildername, []))
+    if revision is not None:
+        matching = set(index['revisions'].get(revision[:REVISION_LENGTH], []))
+        positions = matching if positions is None else positions & matching
+
+    if positions is None:
+        return list(jobs)
+
+    return [jobs[position] for position in sorted(positions)]
+
 
-    for job in jobs:
-        # XXX: Issue 104 - We have an unclear source of request ids
-        prop_req_ids = job["properties"].get("request_ids", [])
-        root_req_ids = job["request_ids"]
-        if request_id in list(set(prop_req_ids + root_req_ids)):
-            return job
+def cached_dates(start_date=None, end_date=None):
+    """
+    Return the dates (YYYY-MM-DD) of the day files in the cache directory.
+
+    If start_date and/or end_date are set, only the dates between them (both
+    included) are returned.
+    """
+    if not os.path.isdir(cache.CACHE_DIR):
+        return []
 
-    return None
+    dates = []
+    for filename in os.listdir(cache.CACHE_DIR):
+        match = DAY_FILE_RE.match(filename)
+        if match is None:
+            continue
+
+        date = match.group(1)
+        if start_date is not None and date < str(start_date) or \
+           end_date is not None and date > str(end_date):
+            continue
+        dates.append(date)
+
+    return sorted(dates)
+
+
+def index_revisions(dates):
+    """
+    Return which of the day files of dates have jobs of every revision.
+
+    Only the copies of the day files in our cache are used; the ones without
+    a sidecar file are parsed and get one (see _index_day_file()).
+
+    Returns a dictionary mapping revisions (first REVISION_LENGTH characters)
+    to the sorted list of dates of the day files with jobs of them.
+    """
+    dates_by_revision = {}
+    for date in dates:
+        filename = BUILDS_DAY_FILE % date
+        if filename in JOBS_INDEX:
+            index = JOBS_INDEX[filename][1]
+        else:
+            filepath = path_to_file(filename)
+            sidecar = read_sidecar(filepath)
+            if sidecar is None and _index_day_file(filepath) is not None:
+                sidecar = read_sidecar(filepath)
+            if sidecar is None:
+                LOG.warning("We could not index the jobs of %s." % filename)
+                continue
+            index = sidecar['index']
+
+        for revision in index['revisions']:
+            dates_by_revision.setdefault(revision, []).append(date)
+
+    for revision_dates in dates_by_revision.itervalues():
+        revision_dates.sort()
+    return dates_by_revision
 
 
 def query_job_data(complete_at, request_id):
@@ -106,17 +618,43 @@ def query_job_data(complete_at, request_id):
         }
 
     """
-    global BUILDS_CACHE
-
     assert type(request_id) is int
     assert type(complete_at) is int
 
+    return query_jobs_data([(complete_at, request_id)])[request_id]
+
+
+def query_jobs_data(pairs):
+    """
+    Look for several jobs at once; see query_job_data().
+
+    pairs is a list of (complete_at, request_id) tuples. The request ids are
+    grouped by the buildjson file they belong to; every file is loaded once and
+    refreshed at most once.
+
+    Returns a dictionary mapping every request_id to its job (None if not found).
+    """
+    now = utc_dt()
+    request_ids_per_file = collections.OrderedDict()
+    for complete_at, request_id in pairs:
+        filename = _get_filename(complete_at, now)
+        request_ids_per_file.setdefault(filename, []).append(request_id)
+
+    jobs = {}
+    for filename, request_ids in request_ids_per_file.iteritems():
+        jobs.update(_find_jobs(request_ids, filename))
+
+    return jobs
+
+
+def _get_filename(complete_at, now):
+    """Return the buildjson file which has the jobs completed at complete_at."""
     date = utc_day(complete_at)
     LOG.debug("Job identified with complete_at value: %d run on %s UTC." %
               (complete_at, date))
 
     then = utc_dt(complete_at)
-    hours_ago = (utc_dt() - then).total_seconds() / (60 * 60)
+    hours_ago = (now - then).total_seconds() / (60 * 60)
     LOG.debug("The job completed at %s (%d hours ago)." %
               (utc_time(complete_at), hours_ago))
 
@@ -124,25 +662,69 @@ def query_job_data(complete_at, request_id):
     if hours_ago < 4:
         # We might be able to grab information about pending and running jobs
         # from builds-running.js and builds-pending.js
-        filename = BUILDS_4HR_FILE
-    else:
-        filename = BUILDS_DAY_FILE % date
-    job = _find_job(request_id, _fetch_data(filename), filename)
+        return BUILDS_4HR_FILE
+
+    return BUILDS_DAY_FILE % date
+
+
+def _find_jobs(request_ids, filename):
+    """Return a dictionary with the job of every request_id in a buildjson file."""
+    jobs = {request_id: _find_job(request_id, filename) for request_id in request_ids}
+    missing = [request_id for request_id, job in jobs.iteritems() if job is None]
+    if not missing:
+        return jobs
 
-    if job:
-        return job
+    if filename == BUILDS_4HR_FILE:
+        jobs.update(_find_recent_jobs(missing, filename))
+        return jobs
 
-    # If we have not found the job, it might be that our cache for this
-    # file is old. We will clean the cache and try one more time. If
-    # it fails, we will raise an Exception
-    LOG.info("We did not find %d in %s, we'll clear our cache and try again." % (
-        request_id, filename))
-    del BUILDS_CACHE[filename]
+    # If we have not found the jobs, it might be that our cache for this
+    # file is old. We will clean the cache and try one more time.
+    LOG.info("We did not find %d job(s) in %s, we'll clear our cache and try again." % (
+        len(missing), filename))
+    _uncache_jobs(filename)
 
-    job = _find_job(request_id, _fetch_data(filename), filename)
-    if job:
-        return job
+    for request_id in missing:
+        jobs[request_id] = _find_job(request_id, filename)
+        if jobs[request_id] is None:
+            LOG.warning("We have not found the job with request_id %s in %s" %
+                        (request_id, filename))
 
-    LOG.warning("We have not found the job with request_id %s in %s" %
-                (request_id, filename))
-    return None
+    return jobs
+
+
+def _find_recent_jobs(request_ids, filename):
+    """
+    Look for jobs that we could not find in our copy of the 4 hour file.
+
+    We refresh the 4 hour file (at most once every BUILDS_4HR_MIN_REFRESH
+    seconds) unless we already gave up on all the request ids in the last
+    BUILDS_4HR_NEGATIVE_TTL seconds.
+
+    Returns a dictionary with the job of every request_id (None if not found).
+    """
+    now = time.time()
+    jobs = dict.fromkeys(request_ids)
+    missing = [request_id for request_id in request_ids
+               if now - MISSING_REQUEST_IDS.get(request_id, 0) >= BUILDS_4HR_NEGATIVE_TTL]
+    if not missing:
+        LOG.debug("We recently looked for %s in %s without luck." % (request_ids, filename))
+        return jobs
+
+    LOG.info("We did not find %d job(s) in %s, we'll refresh our copy and try again." % (
+        len(missing), filename))
+    _refresh_4hr_jobs(filename, BUILDS_4HR_MIN_REFRESH)
+
+    # Forget the request ids we gave up on a while ago
+    for missing_request_id, missing_since in MISSING_REQUEST_IDS.items():
+        if now - missing_since >= BUILDS_4HR_NEGATIVE_TTL:
+            del MISSING_REQUEST_IDS[missing_request_id]
+
+    for request_id in missing:
+        jobs[request_id] = _find_job(request_id, filename)
+        if jobs[request_id] is None:
+            MISSING_REQUEST_IDS[request_id] = now
+            LOG.warning("We have not found the job with request_id %s in %s" %
+                        (request_id, filename))
+
+    return jobs
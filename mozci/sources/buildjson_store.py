@@ -0,0 +1,234 @@
+"""
+This module holds a compact in-memory store for the jobs of a buildjson file.
+
+Every job of a buildjson file is decoded into a dictionary with a dictionary of
+properties and lists of request ids; a day of jobs takes far more memory than
+the values it holds. JobsStore keeps the jobs as columns instead:
+
+* the numeric keys of a job (INT_KEYS) in typed arrays
+* buildernames and revisions (CODED_PROPERTIES) as the position of the value in
+  a list of distinct values
+* request ids in typed arrays
+* anything else as (key, value) pairs with interned strings
+
+store[position] builds a new dictionary equal to the job that was added, thus,
+a store can be used wherever a list of jobs is expected (e.g. the jobs that
+buildjson.query_job_data() looks into).
+"""
+import sys
+
+from array import array
+
+# Keys of a job which are kept in typed arrays
+INT_KEYS = ('builder_id', 'endtime', 'requesttime', 'result', 'slave_id', 'starttime')
+# Properties of a job which are dictionary-encoded
+CODED_PROPERTIES = ('buildername', 'revision')
+# Values of the typed arrays which are not values of a job
+MISSING = -sys.maxint - 1
+# The value is not an integer we can store in an array (e.g. None); see _IntColumn
+OTHER = -sys.maxint
+# Codes of the dictionary-encoded columns which are not positions
+MISSING_CODE = -1
+OTHER_CODE = -2
+# Used instead of None for keys that a job does not have (None is a valid value)
+_ABSENT = object()
+
+
+class _IntColumn(object):
+    """Integers in a typed array; any other value is kept aside."""
+
+    def __init__(self):
+        self.values = array('l')
+        self.others = {}
+
+    def append(self, value):
+        if value is _ABSENT:
+            self.values.append(MISSING)
+            return
+
+        if type(value) in (int, long) and value > OTHER:
+            try:
+                self.values.append(value)
+                return
+            except OverflowError:
+                pass
+
+        self.others[len(self.values)] = value
+        self.values.append(OTHER)
+
+    def get(self, position):
+        value = self.values[position]
+        if value == MISSING:
+            return _ABSENT
+        if value == OTHER:
+            return self.others[position]
+        return value
+
+
+class _CodedColumn(object):
+    """Values stored once; every job holds the position of its value."""
+
+    def __init__(self, intern):
+        self.intern = intern
+        self.distinct_values = []
+        self.codes = {}
+        self.values = array('l')
+        self.others = {}
+
+    def append(self, value):
+        if value is _ABSENT:
+            self.values.append(MISSING_CODE)
+            return
+
+        try:
+            code = self.codes.get(value)
+        except TypeError:
+            # Not hashable
+            self.others[len(self.values)] = value
+            self.values.append(OTHER_CODE)
+            return
+
+        if code is None:
+            code = len(self.distinct_values)
+            self.codes[value] = code
+            self.distinct_values.append(self.intern(value))
+        self.values.append(code)
+
+    def get(self, position):
+        code = self.values[position]
+        if code == MISSING_CODE:
+            return _ABSENT
+        if code == OTHER_CODE:
+            return self.others[position]
+        return self.distinct_values[code]
+
+
+class _IdsColumn(object):
+    """Lists of integers (e.g. request ids) in a single typed array."""
+
+    def __init__(self):
+        self.ids = array('l')
+        self.starts = array('l')
+        # MISSING if the job does not have the list, OTHER if it is kept aside
+        self.lengths = array('l')
+        self.others = {}
+
+    def append(self, value):
+        self.starts.append(len(self.ids))
+        if value is _ABSENT:
+            self.lengths.append(MISSING)
+            return
+
+        if type(value) is list and all(type(i) in (int, long) for i in value):
+            try:
+                self.ids.extend(value)
+                self.lengths.append(len(value))
+                return
+            except OverflowError:
+                del self.ids[self.starts[-1]:]
+
+        self.others[len(self.lengths)] = value
+        self.lengths.append(OTHER)
+
+    def get(self, position):
+        length = self.lengths[position]
+        if length == MISSING:
+            return _ABSENT
+        if length == OTHER:
+            return self.others[position]
+        start = self.starts[position]
+        return self.ids[start:start + length].tolist()
+
+
+class JobsStore(object):
+    """
+    Compact list of buildjson jobs.
+
+    Jobs can be appended but not modified; the dictionaries returned are
+    built on every access, thus, changing them does not change the store.
+    """
+
+    def __init__(self, jobs=()):
+        self._strings = {}
+        self._ints = {key: _IntColumn() for key in INT_KEYS}
+        self._coded = {key: _CodedColumn(self._intern) for key in CODED_PROPERTIES}
+        self._request_ids = _IdsColumn()
+        self._property_request_ids = _IdsColumn()
+        # Other keys of every job and of its properties as tuples of (key, value)
+        self._extra_keys = []
+        # None if the properties of the job are not a dictionary (or it has none)
+        self._extra_properties = []
+        self.extend(jobs)
+
+    def _intern(self, value):
+        """Return the copy of a string that we keep (the first one we saw)."""
+        if isinstance(value, basestring):
+            return self._strings.setdefault(value, value)
+        return value
+
+    def _pairs(self, values, skip):
+        return tuple((self._intern(key), self._intern(value))
+                     for key, value in values.iteritems() if key not in skip)
+
+    def append(self, job):
+        for key in INT_KEYS:
+            self._ints[key].append(job.get(key, _ABSENT))
+        self._request_ids.append(job.get('request_ids', _ABSENT))
+
+        properties = job.get('properties')
+        if not isinstance(properties, dict):
+            # Kept with the other keys (if any)
+            self._extra_keys.append(self._pairs(job, INT_KEYS + ('request_ids',)))
+            properties = {}
+            self._extra_properties.append(None)
+        else:
+            self._extra_keys.append(self._pairs(job, INT_KEYS + ('properties', 'request_ids')))
+            self._extra_properties.append(
+                self._pairs(properties, CODED_PROPERTIES + ('request_ids',)))
+        for key in CODED_PROPERTIES:
+            self._coded[key].append(properties.get(key, _ABSENT))
+        self._property_request_ids.append(properties.get('request_ids', _ABSENT))
+
+    def extend(self, jobs):
+        for job in jobs:
+            self.append(job)
+
+    def __len__(self):
+        return len(self._extra_keys)
+
+    def __iter__(self):
+        for position in xrange(len(self)):
+            yield self[position]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[p] for p in xrange(*position.indices(len(self)))]
+
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("JobsStore index out of range")
+
+        job = dict(self._extra_keys[position])
+        for key in INT_KEYS:
+            value = self._ints[key].get(position)
+            if value is not _ABSENT:
+                job[key] = value
+        request_ids = self._request_ids.get(position)
+        if request_ids is not _ABSENT:
+            job['request_ids'] = request_ids
+
+        extra_properties = self._extra_properties[position]
+        if extra_properties is None:
+            return job
+
+        properties = dict(extra_properties)
+        for key in CODED_PROPERTIES:
+            value = self._coded[key].get(position)
+            if value is not _ABSENT:
+                properties[key] = value
+        request_ids = self._property_request_ids.get(position)
+        if request_ids is not _ABSENT:
+            properties['request_ids'] = request_ids
+        job['properties'] = properties
+        return job
@@ -10,7 +10,6 @@ import os
 import yaml
 
 # 3rd party modules
-import requests
 import taskcluster as taskcluster_client
 from taskcluster.utils import slugId, fromNow
 from jsonschema import (
@@ -25,6 +24,7 @@ from mozci.errors import (
     TaskClusterError
 )
 from mozci.repositories import query_repo_url
+from mozci.utils import network
 from mozhginfo.pushlog_client import query_push_by_revision
 
 
@@ -423,7 +423,7 @@ def generate_task_graph(scopes, tasks, metadata):
 def validate_schema(instance, schema_url):
     """ This function tests the graph with a JSON schema
     """
-    schema = requests.get(schema_url).json()
+    schema = network.get(schema_url).json()
 
     # validate() does not return a value if valid, thus, not keeping track of it.
     validate(instance=instance, schema=schema, format_checker=FormatChecker())
@@ -446,7 +446,7 @@ def get_latest_full_task(repo_name="mozilla-inbound"):
     """
     namespace = "gecko.v2." + repo_name + ".latest.firefox.decision"
     full_tasks_url = TC_INDEX_URL + namespace + "/artifacts/public/full-task-graph.json"
-    full_tasks = requests.get(full_tasks_url).json()
+    full_tasks = network.get(full_tasks_url).json()
     return full_tasks
 
 
@@ -457,7 +457,7 @@ def get_artifact_for_task_id(task_id, artifact_path):
     if task_id is None or len(task_id) == 0:
         raise TaskClusterError("Please input a valid Task ID to fetch the artifact.")
     url = TC_QUEUE_URL + task_id + "/artifacts/" + artifact_path
-    resp = requests.get(url)
+    resp = network.get(url)
     if resp.status_code != 200:
         raise TaskClusterArtifactError("Please check your Task ID and artifact path.")
     return resp.text
@@ -11,8 +11,8 @@ import logging
 import os
 
 import keyring
-import requests
 
+from mozci.utils import network
 from mozci.utils.transfer import path_to_file
 
 AUTH = None
@@ -115,7 +115,7 @@ def valid_credentials():
     Raises an AuthenticationError if the credentials are invalid.
     """
     LOG.debug("Determine if the user's credentials are valid.")
-    req = requests.get(LDAP_HOST, auth=get_credentials())
+    req = network.get(LDAP_HOST, auth=get_credentials())
     if req.status_code == 401:
         remove_credentials()
         return False
@@ -0,0 +1,265 @@
+"""
+This module manages the files that mozci keeps in its cache directory.
+
+Every file belongs to a class (see FILE_CLASSES) which says for how long we
+keep it. On top of that, the least recently used files are removed once the
+cache takes more than QUOTA bytes; the files of KEEP_CLASSES are never removed
+to honour the quota and the files of EVICT_FIRST_CLASSES go before the others.
+
+The size, modified time and last use of every file are kept in a small
+manifest (MANIFEST_FILENAME), thus, we don't list the directory every time:
+
+* record_use() writes down every use of a file; the uses are added to the
+  manifest at most once every FLUSH_INTERVAL seconds (and on exit)
+* maybe_evict() only looks for files to remove once every EVICTION_INTERVAL
+  seconds and the directory is only listed once every RESCAN_INTERVAL seconds
+
+Files which do not belong to mozci (e.g. files written by scripts) are
+never removed.
+"""
+import atexit
+import errno
+import fnmatch
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+LOG = logging.getLogger('mozci')
+
+CACHE_DIR = os.path.expanduser('~/.mozilla/mozci/')
+MANIFEST_FILENAME = 'cache-manifest.json'
+# Bump this value if the format of the manifest changes
+MANIFEST_VERSION = 1
+QUOTA = 4 * 1024 * 1024 * 1024
+EVICTION_INTERVAL = 60 * 60
+RESCAN_INTERVAL = 24 * 60 * 60
+FLUSH_INTERVAL = 60
+# (class, patterns, maximum age in days); a file belongs to the first class
+# with a pattern matching its name; files are never too old if there is no maximum age
+FILE_CLASSES = (
+    ('protected', ('credentials.cfg', 'mozci-debug.log*', MANIFEST_FILENAME + '*'), None),
+    # Decoded copies of files (see transfer.load_file()); we can parse the files again
+    ('decoded', ('*.marshal',), 7),
+    ('indexes', ('*.idx', '*.mmap'), 30),
+    ('buildjson', ('builds-*',), 120),
+    ('allthethings', ('allthethings.json*',), None),
+)
+# The class of the files which do not match any pattern of FILE_CLASSES
+UNKNOWN_CLASS = 'unknown'
+KEEP_CLASSES = ('protected', 'allthethings', UNKNOWN_CLASS)
+# Classes of the files we remove first to honour the quota
+EVICT_FIRST_CLASSES = ('decoded',)
+
+# Guards the manifest and _PENDING_USES against the threads of this process
+_LOCK = threading.RLock()
+# Uses recorded by record_use() which have not been added to the manifest yet
+_PENDING_USES = {}
+# When _PENDING_USES was last added to the manifest
+_LAST_FLUSH = 0
+
+
+def replace_file(tmp_path, path):
+    """Rename tmp_path to path; readers see either the old file or the new one."""
+    if os.name == 'nt' and os.path.exists(path):
+        # os.rename() does not overwrite files on Windows
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def get_file_class(filename):
+    """Return the class of a file of the cache (see FILE_CLASSES) and its maximum age."""
+    for file_class, patterns, max_age in FILE_CLASSES:
+        if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+            return file_class, max_age
+
+    return UNKNOWN_CLASS, None
+
+
+def _manifest_path():
+    return os.path.join(CACHE_DIR, MANIFEST_FILENAME)
+
+
+def _read_manifest():
+    """
+    Return the manifest of the cache.
+
+    'files' maps the name of every file to its size, modified time and last use.
+    """
+    try:
+        with open(_manifest_path()) as fd:
+            manifest = json.load(fd)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (IOError, ValueError):
+        pass
+
+    return {'version': MANIFEST_VERSION, 'scanned_at': 0, 'evicted_at': 0, 'files': {}}
+
+
+def _write_manifest(manifest):
+    path = _manifest_path()
+    tmp_path = None
+    try:
+        # The name of the temporary file is unique to every writer
+        fd, tmp_path = tempfile.mkstemp(prefix=MANIFEST_FILENAME + '.', suffix='.tmp',
+                                        dir=CACHE_DIR)
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(manifest, tmp_file)
+        replace_file(tmp_path, path)
+    except (IOError, OSError) as e:
+        # We will find out about the files we use when we list the directory again
+        LOG.debug("We could not write %s (%s)." % (path, str(e)))
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def record_use(filepath):
+    """
+    Write down that we have just used a file of the cache.
+
+    The uses are added to the manifest by flush(); we call it if the last time
+    was more than FLUSH_INTERVAL seconds ago.
+    """
+    if os.path.dirname(os.path.abspath(filepath)) != os.path.abspath(CACHE_DIR):
+        return
+
+    try:
+        statinfo = os.stat(filepath)
+    except OSError:
+        return
+
+    with _LOCK:
+        _PENDING_USES[os.path.basename(filepath)] = \
+            [statinfo.st_size, statinfo.st_mtime, time.time()]
+        if not 0 <= time.time() - _LAST_FLUSH < FLUSH_INTERVAL:
+            flush()
+
+
+def _add_pending_uses(manifest):
+    global _LAST_FLUSH
+
+    manifest['files'].update(_PENDING_USES)
+    _PENDING_USES.clear()
+    _LAST_FLUSH = time.time()
+
+
+@atexit.register
+def flush():
+    """Add the uses recorded by record_use() to the manifest."""
+    with _LOCK:
+        if not _PENDING_USES or not os.path.isdir(CACHE_DIR):
+            return
+
+        manifest = _read_manifest()
+        _add_pending_uses(manifest)
+        _write_manifest(manifest)
+
+
+def _scan(manifest):
+    """Update the files of the manifest with the contents of the cache directory."""
+    LOG.debug("Listing the files of %s." % CACHE_DIR)
+    files = {}
+    for filename in os.listdir(CACHE_DIR):
+        if filename.startswith(MANIFEST_FILENAME):
+            continue
+
+        try:
+            statinfo = os.stat(os.path.join(CACHE_DIR, filename))
+        except OSError:
+            continue
+
+        previous = manifest['files'].get(filename)
+        used = previous[2] if previous else statinfo.st_mtime
+        files[filename] = [statinfo.st_size, statinfo.st_mtime, max(used, statinfo.st_mtime)]
+
+    manifest['files'] = files
+    manifest['scanned_at'] = time.time()
+
+
+def _remove(manifest, filename):
+    """Remove a file of the cache and the files named after it (e.g. its sidecar file)."""
+    removed = []
+    for name in sorted(manifest['files']):
+        if name != filename and not name.startswith(filename + '.') or \
+           get_file_class(name)[0] in KEEP_CLASSES:
+            continue
+
+        LOG.debug("Cleaning up %s" % os.path.join(CACHE_DIR, name))
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                LOG.debug("We could not remove %s (%s)." % (name, str(e)))
+                continue
+        del manifest['files'][name]
+        removed.append(name)
+
+    return removed
+
+
+def evict():
+    """
+    Remove the files which are too old and the least recently used files over QUOTA.
+
+    Returns the names of the files removed.
+    """
+    with _LOCK:
+        return _evict()
+
+
+def _evict():
+    if not os.path.isdir(CACHE_DIR):
+        return []
+
+    now = time.time()
+    manifest = _read_manifest()
+    if not manifest['files'] or now - manifest['scanned_at'] >= RESCAN_INTERVAL:
+        _scan(manifest)
+    _add_pending_uses(manifest)
+
+    removed = []
+    for filename, (size, mtime, used) in sorted(manifest['files'].items()):
+        max_age = get_file_class(filename)[1]
+        if filename in manifest['files'] and max_age is not None and \
+           now - mtime > max_age * 24 * 60 * 60:
+            removed.extend(_remove(manifest, filename))
+
+    sizes = {filename: entry[0] for filename, entry in manifest['files'].iteritems()}
+    # The files which do not belong to mozci are not part of the quota
+    total = sum(size for filename, size in sizes.iteritems()
+                if get_file_class(filename)[0] != UNKNOWN_CLASS)
+    least_recently_used = sorted(
+        (get_file_class(filename)[0] not in EVICT_FIRST_CLASSES, used, filename)
+        for filename, (_, _, used) in manifest['files'].iteritems()
+        if get_file_class(filename)[0] not in KEEP_CLASSES)
+    for _, _, filename in least_recently_used:
+        if total <= QUOTA:
+            break
+        if filename not in manifest['files']:
+            continue
+
+        for name in _remove(manifest, filename):
+            total -= sizes[name]
+            removed.append(name)
+
+    manifest['evicted_at'] = now
+    _write_manifest(manifest)
+    return removed
+
+
+def maybe_evict():
+    """
+    Call evict() unless it was called in the last EVICTION_INTERVAL seconds.
+
+    It only reads the manifest if it is not time yet; it is cheap enough to
+    call it every time we are done with the cache.
+    """
+    with _LOCK:
+        manifest = _read_manifest()
+        if 0 <= time.time() - manifest['evicted_at'] < EVICTION_INTERVAL:
+            return []
+
+        return _evict()
@@ -4,8 +4,7 @@ from __future__ import absolute_import
 
 import logging
 
-import requests
-
+from mozci.utils import network
 from mozci.utils.authentication import get_credentials
 
 LOG = logging.getLogger('mozci')
@@ -35,7 +34,7 @@ def _all_urls_reachable(urls):
     for url in urls:
         url_tested = _public_url(url)
         LOG.debug("We are going to test if we can reach %s" % url_tested)
-        req = requests.head(url_tested, auth=get_credentials())
+        req = network.head(url_tested, auth=get_credentials())
         if not req.ok:
             LOG.warning("We can't reach %s for this reason %s" %
                         (url_tested, req.reason))
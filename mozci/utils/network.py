@@ -0,0 +1,166 @@
+"""
+This module holds the HTTP session that mozci uses to reach the network.
+
+Every request goes through one requests.Session per process; connections to
+the same host are kept alive and reused instead of opening a new connection
+(and TLS handshake) per request.
+
+* TIMEOUT applies to every request which does not set its own timeout
+* requests which fail to connect or receive one of RETRY_STATUSES are retried
+  up to MAX_RETRIES times with an exponential backoff (BACKOFF_FACTOR); if
+  every retry fails with an error status the last response is returned (see
+  RETRY_ON_STATUS)
+* every host has a pool of POOL_MAXSIZE connections unless HOST_POOL_SIZES
+  says otherwise
+
+get_host_stats() returns, for every host, the number of requests, the number
+of failed requests, the bytes received and the time spent waiting for responses.
+"""
+from __future__ import absolute_import
+
+import logging
+import os
+import threading
+import time
+import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+LOG = logging.getLogger('mozci')
+
+# Seconds to wait for a connection and between bytes of a response
+TIMEOUT = (10, 60)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+# Number of connections we keep alive per host
+POOL_MAXSIZE = 10
+# Hosts which need a different number of connections (see prefetching of buildjson files)
+HOST_POOL_SIZES = {
+    'builddata.pub.build.mozilla.org': 16,
+}
+
+SESSION = None
+# The process which created SESSION; children get a session of their own
+_SESSION_PID = None
+_SESSION_LOCK = threading.Lock()
+# host -> counters (see get_host_stats())
+HOST_STATS = {}
+_STATS_LOCK = threading.Lock()
+
+
+def _retry_statuses():
+    """
+    Return whether requests which receive one of RETRY_STATUSES can be retried.
+
+    Once the retries run out the last response has to reach the callers, which
+    check its status; urllib3 older than 1.15 cannot return it (raise_on_status)
+    and raises RetryError instead, so only failed connections are retried.
+    """
+    try:
+        Retry(raise_on_status=False)
+    except TypeError:
+        return False
+    return True
+
+
+RETRY_ON_STATUS = _retry_statuses()
+
+
+def _adapter(pool_maxsize):
+    if RETRY_ON_STATUS:
+        retries = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR,
+                        status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    else:
+        retries = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR)
+    return HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retries)
+
+
+def _create_session():
+    session = requests.Session()
+    session.mount('http://', _adapter(POOL_MAXSIZE))
+    session.mount('https://', _adapter(POOL_MAXSIZE))
+    for host, pool_maxsize in HOST_POOL_SIZES.iteritems():
+        for scheme in ('http', 'https'):
+            session.mount('%s://%s/' % (scheme, host), _adapter(pool_maxsize))
+
+    return session
+
+
+def get_session():
+    """Return the requests.Session of this process."""
+    global SESSION, _SESSION_PID
+
+    with _SESSION_LOCK:
+        if SESSION is None or _SESSION_PID != os.getpid():
+            # Connections of a parent process cannot be shared with its children
+            SESSION = _create_session()
+            _SESSION_PID = os.getpid()
+
+    return SESSION
+
+
+def _count(host, latency, size, failed):
+    with _STATS_LOCK:
+        stats = HOST_STATS.setdefault(
+            host, {'requests': 0, 'errors': 0, 'bytes': 0, 'latency': 0.0})
+        stats['requests'] += 1
+        stats['errors'] += failed
+        stats['bytes'] += size
+        stats['latency'] += latency
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the session of this process; see requests.request().
+
+    The body of responses to streamed requests (stream=True) is counted by
+    its Content-Length.
+    """
+    kwargs.setdefault('timeout', TIMEOUT)
+    host = urlparse.urlparse(url).netloc
+    start = time.time()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        _count(host, time.time() - start, 0, True)
+        raise
+
+    if kwargs.get('stream'):
+        size = int(response.headers.get('content-length') or 0)
+    else:
+        size = len(response.content)
+    _count(host, time.time() - start, size, not response.ok)
+    return response
+
+
+def get(url, **kwargs):
+    """Send a GET request; see request()."""
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    """Send a HEAD request; see request()."""
+    kwargs.setdefault('allow_redirects', False)
+    return request('HEAD', url, **kwargs)
+
+
+def get_host_stats():
+    """
+    Return the counters of every host we sent requests to.
+
+    Every host has a dictionary with the number of requests, the number of
+    errors (failed requests and error statuses), the bytes received and the
+    latency (total seconds spent in requests; streamed requests stop counting
+    once the headers are received).
+    """
+    with _STATS_LOCK:
+        return {host: dict(stats) for host, stats in HOST_STATS.iteritems()}
+
+
+def reset_host_stats():
+    with _STATS_LOCK:
+        HOST_STATS.clear()
@@ -1,58 +1,176 @@
 import calendar
-import datetime
 import errno
-import fnmatch
+import glob
 import gzip
+import hashlib
+import importlib
 import json
 import logging
+import marshal
 import os
 import platform
+import re
 import shutil
 import subprocess
+import sys
 import time
 
 import requests
 
+from ijson.common import ObjectBuilder
+
 from mozci.errors import MozciError
+from mozci.utils import cache, network
+from mozci.utils.cache import replace_file
 from progressbar import Bar, Timer, FileTransferSpeed, ProgressBar
 
-# yajl2 backend is faster then the default backend, but it requires
-# libyajl2 to be installed in the system
-try:
-    import ijson.backends.yajl2 as ijson
-except:
-    import ijson
-
 LOG = logging.getLogger('mozci')
+# ijson backends from the fastest to the slowest; the yajl2 ones require
+# libyajl2 to be installed in the system (and yajl2_cffi requires cffi)
+IJSON_BACKENDS = ('yajl2_c', 'yajl2_cffi', 'yajl2', 'python')
 MEMORY_SAVING_MODE = False
+# What _lean_load_json_file() keeps of every job unless told otherwise (see load_file())
+DEFAULT_PROJECTION = ('properties.buildername', 'properties.packageUrl',
+                      'properties.request_ids', 'properties.revision',
+                      'properties.testPackagesUrl', 'properties.testsUrl', 'request_ids')
 SHOW_PROGRESS_BAR = True
-CLEANUP_DAYS = 120
+# Decode JSON files while we decompress them instead of decompressing them first;
+# it lowers the peak memory (see scripts/misc_scripts/benchmark_json_decode.py)
+STREAM_JSON_DECODE = platform.system() == 'Linux'
+STREAM_CHUNK_SIZE = 1024 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# What can follow the first characters of a number ('' is the end of the buffer)
+NUMBER_TAIL = ('',) + tuple('0123456789.eE+-')
+# Files derived from a downloaded file (see write_sidecar()) are named after it plus this suffix
+SIDECAR_SUFFIX = '.idx'
+# Bump this value if the format of the sidecar files changes
+SIDECAR_VERSION = 2
+# load_file() keeps next to every file it parses a marshal copy of what it
+# returned (see decoded_copy_path()); it is loaded instead of parsing the file
+# again as long as the file is not replaced
+KEEP_DECODED_COPIES = True
+DECODED_SUFFIX = '.marshal'
+# Downloads are written to the path of the file plus this suffix and renamed
+# once complete; an interrupted download is resumed from where it stopped
+PARTIAL_SUFFIX = '.part'
+MAX_DOWNLOAD_ATTEMPTS = 5
+# We wait BACKOFF_FACTOR * 2 ** (attempt - 1) seconds (at most MAX_BACKOFF)
+# before we try again
+BACKOFF_FACTOR = 1
+MAX_BACKOFF = 30
+
+
+def _select_ijson_backend():
+    """Return the first ijson backend of IJSON_BACKENDS that we can import."""
+    for name in IJSON_BACKENDS:
+        try:
+            backend = importlib.import_module('ijson.backends.%s' % name)
+        except (ImportError, OSError):
+            continue
+
+        LOG.debug("Using the %s backend of ijson." % name)
+        return backend
+
+    return importlib.import_module('ijson')
+
+
+ijson = _select_ijson_backend()
 
 
 def path_to_file(filename):
     """Add files to .mozilla/mozci"""
-    path = os.path.expanduser('~/.mozilla/mozci/')
+    path = cache.CACHE_DIR
     if not os.path.exists(path):
-        os.makedirs(path)
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            # Another thread (e.g. a download of prefetch()) created it first
+            if e.errno != errno.EEXIST:
+                raise
     filepath = os.path.join(path, filename)
     return filepath
 
 
 def clean_directory():
     """
-    Clean ./mozilla/mozci directory of buildjson files that are older than 120 days
-    Modify CLEANUP_DAYS to change the number of days for which files are not be cleaned up.
+    Remove the files of ~/.mozilla/mozci that are too old or over the quota right now.
+
+    See mozci.utils.cache; cache.maybe_evict() does the same at most once per interval.
+    """
+    cache.evict()
+
+
+def sidecar_path(filepath):
+    """Return the path of the sidecar file of filepath."""
+    return filepath + SIDECAR_SUFFIX
+
+
+def _sidecar_signature(filepath):
+    """Return what identifies the contents of filepath (None if missing)."""
+    if not os.path.exists(filepath):
+        return None
+
+    statinfo = os.stat(filepath)
+    return (SIDECAR_VERSION, tuple(sys.version_info[:2]), statinfo.st_size, statinfo.st_mtime)
+
+
+def decoded_copy_path(filepath, projection=None):
+    """Return the path of the copy of filepath loaded with projection (see load_file())."""
+    if projection is None:
+        return filepath + DECODED_SUFFIX
+
+    key = hashlib.md5(repr(normalize_projection(projection))).hexdigest()[:8]
+    return "%s.%s%s" % (filepath, key, DECODED_SUFFIX)
+
+
+def read_sidecar(filepath, path=None):
+    """
+    Return the value stored in the sidecar file of filepath.
+
+    None is returned if there is no sidecar file or if it was written for
+    another version of filepath. path is the path of the sidecar file if it
+    is not the default one (see sidecar_path()).
+    """
+    path = path or sidecar_path(filepath)
+    signature = _sidecar_signature(filepath)
+    if signature is None or not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as fd:
+            if marshal.load(fd) != signature:
+                LOG.debug("%s is outdated." % path)
+                return None
+            return marshal.load(fd)
+    except (EOFError, IOError, ValueError, TypeError) as e:
+        LOG.debug("%s is corrupted (%s)." % (path, str(e)))
+        return None
+
+
+def write_sidecar(filepath, value, path=None):
     """
-    path = os.path.expanduser('~/.mozilla/mozci/')
-    filter_build_files = fnmatch.filter(os.listdir(path), "builds-*")
-    permissible_last_date = datetime.date.today() - datetime.timedelta(days=CLEANUP_DAYS)
-    permissible_timestamp = int(time.mktime(permissible_last_date.timetuple()))
-    for filename in filter_build_files:
-        full_filepath = os.path.join(path, filename)
-        last_mod_timestamp = int(os.stat(full_filepath).st_mtime)
-        if last_mod_timestamp < permissible_timestamp:
-            LOG.debug("Cleaning up %s" % full_filepath)
-            os.remove(full_filepath)
+    Store next to filepath a value derived from its contents.
+
+    The sidecar file is tied to the size and modification time of filepath,
+    thus, read_sidecar() ignores it once filepath is replaced. The value must
+    be of a type supported by marshal.
+    """
+    path = path or sidecar_path(filepath)
+    signature = _sidecar_signature(filepath)
+    if signature is None:
+        return
+
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fd:
+            marshal.dump(signature, fd)
+            marshal.dump(value, fd)
+        replace_file(tmp_path, path)
+    except (IOError, OSError, ValueError) as e:
+        # The sidecar file is an optimization; not being able to write it is not fatal
+        LOG.debug("We could not write %s (%s)." % (path, str(e)))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
 def _verify_last_mod(remote_last_mod_date, filename):
@@ -89,7 +207,9 @@ def _load_json_file(filepath):
     '''
     This is a helper function to load json contents from a file
 
-    Raises an Exception if a Windows user doesn't have gzip installed.
+    Raises ValueError if the file does not have valid data (see
+    _move_corrupted_file()) and an Exception if a Windows user doesn't have
+    gzip installed.
     '''
     LOG.debug("About to load %s." % filepath)
 
@@ -98,6 +218,15 @@ def _load_json_file(filepath):
     magic = fd.read(2)
     fd.seek(0)
 
+    if STREAM_JSON_DECODE and platform.system() != 'Windows':
+        gzipper = gzip.GzipFile(fileobj=fd) if magic == '\037\213' else None
+        try:
+            return _stream_json_decode(gzipper or fd)
+        finally:
+            if gzipper:
+                gzipper.close()
+            fd.close()
+
     if magic == '\037\213':  # gzip magic number
         if platform.system() == 'Windows':
             # Windows doesn't like multiple processes opening the same files
@@ -124,43 +253,254 @@ def _load_json_file(filepath):
     if platform.system() != 'Windows':
         fd.close()
 
-    try:
-        return json.loads(data)
-    except ValueError, e:
-        LOG.exception(e)
-        new_file = filepath + ".corrupted"
-        shutil.move(filepath, new_file)
-        LOG.error("The file on-disk does not have valid data")
-        LOG.info("We have moved %s to %s for inspection." % (filepath, new_file))
-        exit(1)
+    return json.loads(data)
+
+
+def _move_corrupted_file(filepath, e):
+    """Move a file which does not have valid data aside for inspection."""
+    LOG.exception(e)
+    new_file = filepath + ".corrupted"
+    shutil.move(filepath, new_file)
+    LOG.error("The file on-disk does not have valid data")
+    LOG.info("We have moved %s to %s for inspection." % (filepath, new_file))
 
 
-def _save_file(req, filepath):
+class _JSONStream(object):
+    """
+    Decode JSON values from a file object while we read it.
+
+    We keep in memory the text of the value being decoded (plus one chunk),
+    instead of the whole text of the file.
+    """
+
+    def __init__(self, fd, chunk_size):
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+
+    def _read_chunk(self):
+        """Append the next chunk to the buffer; return False at the end of the file."""
+        chunk = self.fd.read(self.chunk_size)
+        if not chunk:
+            return False
+
+        # Drop what we have already decoded
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character without consuming it."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_chunk():
+                raise ValueError("Unexpected end of JSON data")
+
+    def end(self):
+        """Raise ValueError unless there is only whitespace left in the file."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                raise ValueError("Extra data at position %d of the buffer" % self.pos)
+            if not self._read_chunk():
+                return
+
+    def consume(self, char):
+        """Consume char (after whitespace); raise ValueError if it is not next."""
+        if self.peek() != char:
+            raise ValueError("Expecting '%s' at position %d of the buffer" % (char, self.pos))
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # The value (or a multibyte character) continues in the next chunk
+                if not self._read_chunk():
+                    raise
+                continue
+
+            if self.buffer[end:end + 1] in NUMBER_TAIL and self._read_chunk():
+                # A number might continue in the next chunk (e.g. "1" of "1.5")
+                continue
+
+            self.pos = end
+            return value
+
+
+def _stream_json_decode(fd, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Decode the JSON document of a file object as we read it.
+
+    The elements of the arrays at the top level of an object (e.g. "builds" in
+    the buildjson files) are decoded one by one; any other value is decoded
+    at once.
+
+    Raises ValueError as soon as we find anything but whitespace after the document.
+    """
+    stream = _JSONStream(fd, chunk_size)
+    if stream.peek() != '{':
+        value = stream.decode()
+        stream.end()
+        return value
+
+    stream.consume('{')
+    result = {}
+    if stream.peek() == '}':
+        stream.consume('}')
+        stream.end()
+        return result
+
+    while True:
+        key = stream.decode()
+        stream.consume(':')
+        if stream.peek() == '[':
+            stream.consume('[')
+            value = []
+            if stream.peek() != ']':
+                while True:
+                    value.append(stream.decode())
+                    if stream.peek() == ']':
+                        break
+                    stream.consume(',')
+            stream.consume(']')
+        else:
+            value = stream.decode()
+
+        result[key] = value
+        if stream.peek() == '}':
+            stream.consume('}')
+            stream.end()
+            return result
+        stream.consume(',')
+
+
+def _save_file(req, filepath, offset=0, size=None):
     '''
     Helper class to download a file and show a progress bar.
+
+    If offset is set, the content is appended to the offset bytes that
+    filepath already has. size is the size of the complete file (if known).
+
+    Returns the size of filepath.
     '''
     LOG.debug("About to fetch %s from %s" % (filepath, req.url))
-    size = int(req.headers['Content-Length'].strip())
-    if SHOW_PROGRESS_BAR:
+    if SHOW_PROGRESS_BAR and size:
         pbar = DownloadProgressBar(filepath, size).start()
-    bytes = 0
-    with open(filepath, 'wb') as fd:
+    else:
+        pbar = None
+    bytes = offset
+    with open(filepath, 'ab' if offset else 'wb') as fd:
         for chunk in req.iter_content(10 * 1024):
             if chunk:  # filter out keep-alive new chunks
                 fd.write(chunk)
                 bytes += len(chunk)
-                if SHOW_PROGRESS_BAR:
-                    pbar.update(bytes)
-    if SHOW_PROGRESS_BAR:
+                if pbar:
+                    pbar.update(min(bytes, size))
+    if pbar:
         pbar.finish()
-    _verify_last_mod(req.headers['last-modified'], filepath)
+    return bytes
+
+
+def _backoff(attempt):
+    """Wait before the next attempt (the longer the more attempts failed)."""
+    delay = min(MAX_BACKOFF, BACKOFF_FACTOR * 2 ** (attempt - 1))
+    LOG.debug("We will try again in %d seconds." % delay)
+    time.sleep(delay)
 
 
-def load_file(filename, url):
+def _expected_size(req, offset):
+    """Return the size of the complete file according to the server (None if unknown)."""
+    if req.status_code == 206:
+        # e.g. bytes 100-199/200
+        content_range = req.headers.get('content-range', '')
+        match = re.match(r'bytes (\d+)-\d+/(\d+)$', content_range.strip())
+        if match is None or int(match.group(1)) != offset:
+            raise MozciError("We received an unexpected Content-Range (%s)." % content_range)
+        return int(match.group(2))
+
+    content_length = req.headers.get('content-length')
+    return int(content_length.strip()) if content_length else None
+
+
+def _download(url, filepath, headers):
     '''
-    We download a file without decompressing it so we can keep track of its progress.
-    We save it to disk and return the contents of it.
-    We also check if the file on the server is newer to determine if we should download it again.
+    Download url to the partial file of filepath and rename it to filepath.
+
+    If a previous download left a partial file, we ask the server for the
+    rest of it; the server sends the whole file if it changed since then
+    (If-Range). The file is only renamed once its size matches the size sent
+    by the server and its modified time matches Last-Modified.
+
+    Returns False if the server replied that filepath is current (304).
+
+    Raises IOError if the download is incomplete; the partial file is kept so
+    the next attempt can resume it.
+    '''
+    part_path = filepath + PARTIAL_SUFFIX
+    headers = dict(headers)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset:
+        # The modified time of a partial file is the Last-Modified of its copy on the server
+        headers['Range'] = 'bytes=%d-' % offset
+        headers['If-Range'] = time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                                            time.gmtime(os.stat(part_path).st_mtime))
+
+    req = network.get(url, stream=True, headers=headers)
+
+    if req.status_code == 304:
+        if offset:
+            os.remove(part_path)
+        return False
+
+    if req.status_code == 416:
+        # The partial file is not part of the file on the server
+        os.remove(part_path)
+        raise IOError("The server cannot resume %s; we will start over." % part_path)
+
+    if req.status_code not in (200, 206):
+        raise MozciError("We received %s which is unexpected." % req.status_code)
+
+    if req.status_code == 206:
+        LOG.debug("Resuming the download of %s after %d bytes." % (filepath, offset))
+    else:
+        offset = 0
+    size = _expected_size(req, offset)
+    last_modified = req.headers.get('last-modified')
+
+    try:
+        written = _save_file(req, part_path, offset, size)
+    finally:
+        if last_modified and os.path.exists(part_path):
+            # Used as If-Range if we need to resume this download
+            _verify_last_mod(last_modified, part_path)
+
+    if size is not None and written != size:
+        if written > size:
+            os.remove(part_path)
+        raise IOError("We downloaded %d bytes of %s instead of %d." % (written, url, size))
+
+    replace_file(part_path, filepath)
+    return True
+
+
+def fetch_file(filename, url):
+    '''
+    We download a file unless the copy in the cache is as recent as the one on the server.
+
+    Downloads are written to a partial file which is renamed once it is
+    complete (see _download()); the copy in the cache is never left
+    truncated. Interrupted downloads are resumed up to MAX_DOWNLOAD_ATTEMPTS
+    times with an increasing delay between attempts.
+
+    Returns the path of the file on disk.
 
     Raises MozciError if anything goes wrong.
     '''
@@ -186,59 +526,221 @@ def load_file(filename, url):
         # The file does not exist in the cache; let's fetch
         LOG.debug("We have not been able to find %s on disk." % filepath)
 
-    req = requests.get(url, stream=True, headers=headers)
-
-    if req.status_code == 200:
+    for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+        try:
+            downloaded = _download(url, filepath, headers)
+            break
+        except (IOError, requests.exceptions.RequestException), e:
+            LOG.warning("We could not download %s (attempt %d): %s" % (filename, attempt, e))
+            if attempt == MAX_DOWNLOAD_ATTEMPTS:
+                raise MozciError("We could not download %s." % url)
+            _backoff(attempt)
+
+    if not downloaded:
+        # The file on disk is recent
+        LOG.debug("%s is on disk and it is current." % last_mod_date)
+    else:
         if exists:
             # The file on the server is newer
             LOG.debug("The local file was last modified in %s." % last_mod_date)
-            LOG.debug("The server's last modified in %s" % req.headers['last-modified'])
-            LOG.info("Fetch newer version of %s." % filename)
+            LOG.info("Fetched a newer version of %s." % filename)
 
-        _save_file(req, filename)
+        # What was derived from the previous copy is not valid anymore
+        derived = glob.glob(filepath + '*' + DECODED_SUFFIX)
+        for path in [sidecar_path(filepath)] + derived:
+            if os.path.exists(path):
+                os.remove(path)
 
-    elif req.status_code == 304:
-        # The file on disk is recent
-        LOG.debug("%s is on disk and it is current." % last_mod_date)
+    cache.record_use(filepath)
+    return filepath
 
-    else:
-        raise MozciError("We received %s which is unexpected." % req.status_code)
 
-    try:
-        if not MEMORY_SAVING_MODE:
-            LOG.debug("Running in *non*-memory saving mode.")
-            return _load_json_file(filepath)
+def load_file(filename, url, projection=None, decoded_copy=True, offline=False):
+    '''
+    We download a file without decompressing it so we can keep track of its progress.
+    We save it to disk and return the contents of it.
+    We also check if the file on the server is newer to determine if we should download it again.
 
-        LOG.debug("Running in memory saving mode.")
-        return _lean_load_json_file(filepath)
+    If projection is set, the file is streamed and we only keep the fields of
+    every job listed in it (see normalize_projection()). In memory saving mode
+    DEFAULT_PROJECTION is used unless another projection is given.
 
-    # Issue 213: sometimes we download a corrupted builds-*.js file
-    except (IOError, subprocess.CalledProcessError):
-        LOG.info("%s is corrupted, we will have to download a new one.", filename)
-        os.remove(filepath)
-        return load_file(filename, url)
+    Unless decoded_copy is False (or KEEP_DECODED_COPIES is not set), the first
+    load writes what we return to a marshal file next to the file (per
+    projection) and the loads which come after read it instead of parsing the
+    file; see decoded_copy_path().
 
+    If offline is set, we use the file on disk as it is without asking the server.
 
-def _lean_load_json_file(filepath):
-    """Helper function to load json contents from a file using ijson."""
+    Raises MozciError if anything goes wrong.
+    '''
+    if projection is None and MEMORY_SAVING_MODE:
+        projection = DEFAULT_PROJECTION
+    if projection is not None:
+        projection = normalize_projection(projection)
+    decoded_copy = decoded_copy and KEEP_DECODED_COPIES
+
+    for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+        if offline:
+            filepath = filename if os.path.isabs(filename) else path_to_file(filename)
+            if not os.path.exists(filepath):
+                raise MozciError("We do not have %s on disk." % filename)
+        else:
+            filepath = fetch_file(filename, url)
+        copy_path = decoded_copy_path(filepath, projection)
+        if decoded_copy:
+            copy = read_sidecar(filepath, copy_path)
+            if copy is not None and copy[0] == projection:
+                LOG.debug("Loaded %s from %s." % (filepath, copy_path))
+                return copy[1]
+
+        try:
+            if projection is None:
+                LOG.debug("Running in *non*-memory saving mode.")
+                try:
+                    data = _load_json_file(filepath)
+                except ValueError, e:
+                    _move_corrupted_file(filepath, e)
+                    exit(1)
+            else:
+                LOG.debug("Running in memory saving mode.")
+                data = _lean_load_json_file(filepath, projection)
+
+            if decoded_copy:
+                write_sidecar(filepath, (projection, data), copy_path)
+            return data
+
+        # Issue 213: sometimes we download a corrupted builds-*.js file
+        except (IOError, subprocess.CalledProcessError):
+            if offline:
+                raise MozciError("%s is corrupted." % filename)
+            LOG.info("%s is corrupted, we will have to download a new one.", filename)
+            os.remove(filepath)
+            if attempt < MAX_DOWNLOAD_ATTEMPTS:
+                _backoff(attempt)
+
+    raise MozciError("We could not load a valid copy of %s." % filename)
+
+
+def normalize_projection(projection):
+    """
+    Return a projection in the form we use to compare and cache them.
+
+    A projection is a list of the fields of a job we want to keep. Nested
+    fields are separated by dots (e.g. 'properties.buildername'); a field
+    which is listed without its nested fields (e.g. 'properties') is kept
+    as a whole.
+    """
+    if isinstance(projection, basestring):
+        raise MozciError("A projection is a list of fields, not %s." % projection)
+
+    return tuple(sorted(set(projection)))
+
+
+def _projection_tree(projection):
+    """Return {key: nested tree or None (the whole value)} for a projection."""
+    tree = {}
+    # Shorter fields come first, so 'properties' wins over 'properties.buildername'
+    for field in sorted(normalize_projection(projection), key=len):
+        node = tree
+        keys = field.split('.')
+        for key in keys[:-1]:
+            if node.get(key, {}) is None:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = None
+
+    return tree
+
+
+def build_ijson_value(events):
+    """Consume the ijson events of the next value and return it."""
+    builder = ObjectBuilder()
+    depth = 0
+    for _, event, value in events:
+        builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+
+        if depth == 0:
+            return builder.value
+
+
+def skip_ijson_value(events, depth=0):
+    """
+    Consume the ijson events of the next value without building it.
+
+    depth is the number of containers of the value we have already entered.
+    """
+    for _, event, _ in events:
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+
+        if depth == 0:
+            return
+
+
+def _project_ijson_map(event, events, tree):
+    """
+    Consume the ijson events of an object and return the fields of it in tree.
+
+    event is the first event of the object (it has already been consumed). If
+    the value is not an object, it is skipped and None is returned.
+    """
+    if event != 'start_map':
+        if event == 'start_array':
+            skip_ijson_value(events, depth=1)
+        return None
+
+    result = {}
+    for _, event, key in events:
+        if event == 'end_map':
+            return result
+
+        if key not in tree:
+            skip_ijson_value(events)
+        elif tree[key] is None:
+            result[key] = build_ijson_value(events)
+        else:
+            value = _project_ijson_map(next(events)[1], events, tree[key])
+            if value is not None:
+                result[key] = value
+
+
+def _lean_load_json_file(filepath, projection=DEFAULT_PROJECTION):
+    """
+    Helper function to load json contents from a file using ijson.
+
+    We only build the fields of every job listed in projection (see
+    normalize_projection()); everything else is skipped while we stream the
+    file. Only the "builds" key of the file is returned.
+    """
     LOG.debug("About to load %s." % filepath)
+    tree = _projection_tree(projection)
 
     fd = open(filepath, 'rb')
-
     gzipper = gzip.GzipFile(fileobj=fd)
-    builds = ijson.items(gzipper, 'builds.item')
+    events = ijson.parse(gzipper)
     ret = {'builds': []}
     try:
-        # We are going to store only the information we need from builds-.js
-        # and ignore the rest.
-        ret['builds'] = [{
-            'properties': {
-                key: value for (key, value) in b["properties"].iteritems()
-                if key in ('buildername', 'request_ids', 'revision', 'packageUrl',
-                           'testPackagesUrl', 'testsUrl')
-            },
-            'request_ids': b['request_ids']
-        } for b in builds]
+        for prefix, event, value in events:
+            if prefix != '' or event != 'map_key':
+                continue
+
+            if value != 'builds':
+                skip_ijson_value(events)
+                continue
+
+            next(events)  # start_array
+            for _, event, _ in events:
+                if event == 'end_array':
+                    break
+                ret['builds'].append(_project_ijson_map(event, events, tree))
 
     except IOError, e:
         LOG.warning(str(e))
@@ -0,0 +1,68 @@
+"""
+This script reports how much memory loading allthethings.json takes with
+json.load() and with the streaming loader (MEMORY_SAVING_MODE).
+
+Every mode is measured in a new process; we report the peak memory and the
+memory still in use once the data is loaded (Linux only).
+"""
+import gc
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser, SUPPRESS
+
+from mozci.sources import allthethings
+
+
+def current_rss():
+    """Return the resident memory of this process in KB."""
+    with open('/proc/self/statm') as fd:
+        pages = int(fd.read().split()[1])
+    return pages * resource.getpagesize() / 1024
+
+
+def measure(filename, memory_saving_mode):
+    """Load allthethings.json and print the time and memory it took."""
+    # We don't want the index next to allthethings.json to be used
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        allthethings.FILENAME = os.path.join(tmp_dir, 'allthethings.json')
+        shutil.copy(filename, allthethings.FILENAME)
+        allthethings.MEMORY_SAVING_MODE = memory_saving_mode
+        before = current_rss()
+        start = time.time()
+        allthethings.fetch_allthethings_data(verify=False)
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    gc.collect()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "%.2fs %d %d" % (elapsed, peak - before, current_rss() - before)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('filename', help='Path to an allthethings.json file.')
+    parser.add_argument('--child', choices=['json', 'streaming'], help=SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        measure(options.filename, options.child == 'streaming')
+        return
+
+    print "%-10s %8s %12s %12s" % ('mode', 'time', 'peak (MB)', 'steady (MB)')
+    for mode in ('json', 'streaming'):
+        output = subprocess.check_output(
+            [sys.executable, __file__, options.filename, '--child', mode])
+        elapsed, peak, steady = output.split()
+        print "%-10s %8s %12.1f %12.1f" % (mode, elapsed, int(peak) / 1024.0, int(steady) / 1024.0)
+
+
+if __name__ == '__main__':
+    main()
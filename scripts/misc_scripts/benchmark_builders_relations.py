@@ -0,0 +1,97 @@
+"""
+This script compares how long it takes to compute the relations between builders
+(upstream/downstream jobs) and the SETA intervals in a single pass with how it
+was done before (one pass per structure with per builder lookups).
+
+The index of allthethings.json is not used; we measure the computation.
+Use --file to benchmark against a local copy of allthethings.json.
+"""
+import collections
+import time
+
+from argparse import ArgumentParser
+
+from mozci import platforms
+from mozci.errors import MozciError
+from mozci.sources import allthethings
+
+
+def previous_builders_data():
+    """Compute the relations and the SETA intervals as it was done before."""
+    shortname_to_name = {}
+    buildername_to_trigger = {}
+    build_jobs = {}
+    data = allthethings.fetch_allthethings_data()
+    for buildername, builderinfo in data['builders'].iteritems():
+        if not platforms._wanted_builder(buildername):
+            continue
+
+        if platforms.is_upstream(buildername):
+            shortname_to_name[builderinfo['shortname']] = buildername
+            build_jobs[buildername.lower()] = buildername
+
+    for sched, values in data['schedulers'].iteritems():
+        if not sched.startswith('tests-'):
+            continue
+
+        for buildername in values['downstream']:
+            buildername_to_trigger[buildername.lower()] = values['triggered_by'][0]
+
+    relations = collections.defaultdict(list)
+    for buildername in platforms.list_builders():
+        if platforms.is_downstream(buildername):
+            try:
+                upstream = platforms._find_upstream_builder(
+                    buildername, shortname_to_name, buildername_to_trigger, build_jobs)
+            except MozciError:
+                continue
+            relations[upstream].append(buildername)
+
+    seta = {}
+    for sched, values in data['schedulers'].iteritems():
+        sched_str_list = sched.split('-')
+        if sched.startswith('tests-') and sched_str_list[-1].isnumeric():
+            for buildername in values['downstream']:
+                seta[buildername] = [int(sched_str_list[-2]), int(sched_str_list[-1])]
+
+    return relations, seta
+
+
+def timeit(function, repeat):
+    """Return the best time out of repeat calls to function on a new allthethings generation."""
+    times = []
+    for _ in range(repeat):
+        # This drops the metadata and every other structure derived from allthethings.json
+        allthethings.GENERATION += 1
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--file', dest='filename',
+                        help='Path to an allthethings.json file to use.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times we compute the relations.')
+    options = parser.parse_args()
+
+    if options.filename:
+        allthethings.FILENAME = options.filename
+    data = allthethings.fetch_allthethings_data(verify=options.filename is None)
+    print "Number of builders: %d" % len(data['builders'])
+    print "Number of schedulers: %d" % len(data['schedulers'])
+
+    platforms.load_index_section = lambda name, data: None
+    platforms.save_index_section = lambda name, value, data: None
+
+    before = timeit(previous_builders_data, options.repeat)
+    after = timeit(platforms.load_relations, options.repeat)
+
+    print "Relations and SETA intervals (previous code): %.4fs" % before
+    print "Relations and SETA intervals (single pass): %.4fs" % after
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+This script reports how long and how much memory loading a buildjson file
+takes in every mode:
+
+* json - we decompress it and then decode it (json.loads)
+* streaming - we decode it while we decompress it (STREAM_JSON_DECODE)
+* lean - we stream it with ijson and keep DEFAULT_PROJECTION (MEMORY_SAVING_MODE)
+* marshal - we load the decoded copy that load_file() keeps next to it
+
+Every mode is measured in a new process (a cold load); we report the peak
+memory and the memory still in use once the data is loaded (Linux only). If no
+file is given we generate a builds-YYYY-MM-DD.js.gz like file with --jobs jobs.
+"""
+import gc
+import gzip
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser, SUPPRESS
+
+from mozci.utils import transfer
+
+MODES = ('json', 'streaming', 'lean', 'marshal')
+
+
+def current_rss():
+    """Return the resident memory of this process in KB."""
+    with open('/proc/self/statm') as fd:
+        pages = int(fd.read().split()[1])
+    return pages * resource.getpagesize() / 1024
+
+
+def generate(filename, number_of_jobs, seed=0):
+    """Write a gzipped buildjson file with number_of_jobs jobs."""
+    rand = random.Random(seed)
+    builds = []
+    for i in range(number_of_jobs):
+        revision = '%040x' % rand.getrandbits(160)
+        builds.append({
+            'builder_id': rand.randint(1, 50000),
+            'buildnumber': rand.randint(1, 5000),
+            'endtime': 1435000000 + i,
+            'id': 80000000 + i,
+            'master_id': rand.randint(1, 200),
+            'properties': {
+                'basedir': '/builds/slave/test',
+                'branch': 'mozilla-inbound',
+                'buildername': 'Ubuntu VM 12.04 x64 mozilla-inbound opt test mochitest-%d' %
+                               rand.randint(1, 5),
+                'buildid': '20150622%06d' % rand.randint(0, 999999),
+                'log_url': 'http://ftp.mozilla.org/pub/logs/%s/%d.txt.gz' % (revision, i),
+                'project': '',
+                'repo_path': 'integration/mozilla-inbound',
+                'request_ids': [70000000 + i],
+                'revision': revision,
+                'slavename': 'tst-linux64-spot-%d' % rand.randint(1, 3000),
+            },
+            'reason': 'scheduler',
+            'request_ids': [70000000 + i],
+            'requesttime': 1434990000 + i,
+            'result': rand.choice([0, 0, 0, 1, 2]),
+            'slave_id': rand.randint(1, 9000),
+            'starttime': 1434995000 + i,
+        })
+
+    with open(filename, 'wb') as fd:
+        gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+        json.dump({'builds': builds, 'builders': {}, 'machines': [], 'masters': {},
+                   'slaves': {}}, gzipper)
+        gzipper.close()
+
+
+def write_decoded_copy(filename):
+    """Write the decoded copy of a buildjson file as load_file() does."""
+    copy_path = transfer.decoded_copy_path(filename)
+    transfer.write_sidecar(filename, (None, transfer._load_json_file(filename)), copy_path)
+    if not os.path.exists(copy_path):
+        raise Exception("We could not write %s." % copy_path)
+
+
+def measure(filename, mode):
+    """Load a buildjson file and print the time and memory it took."""
+    transfer.STREAM_JSON_DECODE = mode == 'streaming'
+    before = current_rss()
+    start = time.time()
+    if mode == 'lean':
+        data = transfer._lean_load_json_file(filename)
+    elif mode == 'marshal':
+        data = transfer.read_sidecar(filename, transfer.decoded_copy_path(filename))[1]
+    else:
+        data = transfer._load_json_file(filename)
+    elapsed = time.time() - start
+
+    gc.collect()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "%.2fs %d %d %d" % (elapsed, peak - before, current_rss() - before,
+                              len(data['builds']))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('filename', nargs='?', help='Path to a builds-*.js.gz file.')
+    parser.add_argument('--jobs', type=int, default=100000,
+                        help='Number of jobs of the generated file (default: 100000).')
+    parser.add_argument('--child', choices=MODES + ('prepare',), help=SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child == 'prepare':
+        write_decoded_copy(options.filename)
+        return
+    elif options.child:
+        measure(options.filename, options.child)
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = options.filename
+        if filename is None:
+            filename = os.path.join(tmp_dir, 'builds-2015-06-22.js.gz')
+            generate(filename, options.jobs)
+
+        print "%s (%.1f MB)" % (filename, os.path.getsize(filename) / 1024.0 / 1024)
+        subprocess.check_call([sys.executable, __file__, filename, '--child', 'prepare'])
+        print "%-10s %8s %12s %12s %10s" % ('mode', 'time', 'peak (MB)', 'steady (MB)', 'jobs')
+        for mode in MODES:
+            output = subprocess.check_output(
+                [sys.executable, __file__, filename, '--child', mode])
+            elapsed, peak, steady, jobs = output.split()
+            print "%-10s %8s %12.1f %12.1f %10s" % (
+                mode, elapsed, int(peak) / 1024.0, int(steady) / 1024.0, jobs)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+This script measures how long list_builders() takes on the full set of builders:
+    * uncached - without the metadata cache of get_buildername_metadata()
+    * index build - with the metadata cache, building the builders index
+    * memoized - returning the result that the builders index already holds
+
+Use --file to benchmark against a local copy of allthethings.json.
+"""
+import time
+
+from argparse import ArgumentParser
+
+from mozci import platforms
+from mozci.errors import MissingBuilderError
+from mozci.sources import allthethings
+
+
+def uncached_get_buildername_metadata(buildername):
+    """get_buildername_metadata() as it was before the metadata cache existed."""
+    builders = allthethings.fetch_allthethings_data()['builders']
+    if buildername not in builders:
+        raise MissingBuilderError("Builder '{}' is missing.".format(buildername))
+    return platforms._get_buildername_metadata(buildername)
+
+
+def timeit(function, repeat, setup=None):
+    """Return the best time out of repeat calls to function; setup runs untimed before each."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--file', dest='filename',
+                        help='Path to an allthethings.json file to use.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times we call list_builders().')
+    options = parser.parse_args()
+
+    if options.filename:
+        allthethings.FILENAME = options.filename
+    data = allthethings.fetch_allthethings_data(verify=options.filename is None)
+    print "Number of builders: %d" % len(data['builders'])
+
+    cached_function = platforms.get_buildername_metadata
+    platforms.get_buildername_metadata = uncached_get_buildername_metadata
+    uncached = timeit(platforms.list_builders, options.repeat, setup=platforms._reset_caches)
+    platforms.get_buildername_metadata = cached_function
+
+    index_build = timeit(platforms.list_builders, options.repeat, setup=platforms._reset_caches)
+    # The first call builds the index; the following ones reuse its result
+    platforms.list_builders()
+    memoized = timeit(platforms.list_builders, options.repeat)
+
+    print "list_builders() uncached: %.4fs" % uncached
+    print "list_builders() building the builders index: %.4fs" % index_build
+    print "list_builders() memoized: %.4fs" % memoized
+
+
+if __name__ == '__main__':
+    main()
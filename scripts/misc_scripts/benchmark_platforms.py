@@ -0,0 +1,124 @@
+"""
+This script measures how mozci.platforms scales with the number of builders.
+
+For every size it generates a synthetic allthethings.json (see
+generate_allthethings.py), loads it and times the main functions of
+mozci.platforms. The first call of a function (cold) is made with empty caches
+and without the index of allthethings.json, the following ones (warm) reuse the
+caches. The results are written as JSON so runs can be compared.
+"""
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+from mozci import platforms
+from mozci.sources import allthethings
+
+from generate_allthethings import generate
+
+BENCHMARKS = [
+    ('list_builders', lambda: platforms.list_builders()),
+    ('list_builders(try)', lambda: platforms.list_builders(repo_name='try')),
+    ('find_buildernames', lambda: platforms.find_buildernames(
+        'mozilla-central', suite_name='mochitest-1', job_type=None)),
+    ('filter_buildernames', lambda: platforms.filter_buildernames(
+        allthethings.fetch_allthethings_data()['builders'].keys(),
+        include=['mozilla-central', 'opt'], exclude=['pgo', 'talos'])),
+    ('load_relations', lambda: platforms.load_relations()),
+    ('build_tests_per_platform_graph', lambda: platforms.build_tests_per_platform_graph(
+        platforms.list_builders(repo_name='mozilla-central'))),
+    ('build_talos_buildernames_for_repo', lambda: platforms.build_talos_buildernames_for_repo(
+        'mozilla-central', pgo_only=True)),
+]
+
+
+def timeit(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def run_benchmarks(filename, repeat):
+    """Load filename as allthethings.json and time every benchmark."""
+    allthethings.FILENAME = filename
+    # Like in a new process, nothing is loaded
+    allthethings.DATA = None
+    platforms._reset_caches()
+    elapsed = timeit(lambda: allthethings.fetch_allthethings_data(verify=False))
+    data = allthethings.fetch_allthethings_data(verify=False)
+    result = {
+        'builders': len(data['builders']),
+        'schedulers': len(data['schedulers']),
+        'load': elapsed,
+        'benchmarks': {},
+    }
+    for name, function in BENCHMARKS:
+        platforms._reset_caches()
+        cold = timeit(function)
+        warm = min(timeit(function) for _ in range(repeat))
+        result['benchmarks'][name] = {'cold': cold, 'warm': warm}
+
+    return result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--builders', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='Sizes of the allthethings.json files to generate.')
+    parser.add_argument('--file', dest='filename',
+                        help='Benchmark an existing allthethings.json instead.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed used to generate allthethings.json.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of warm calls of every function (the best one is kept).')
+    parser.add_argument('--output', default='benchmark_platforms.json',
+                        help='File to write the results to.')
+    options = parser.parse_args()
+
+    # We want to measure the computations, not the loading of the index
+    platforms.load_index_section = lambda name, data: None
+    platforms.save_index_section = lambda name, value, data: None
+
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        if options.filename:
+            filename = os.path.join(tmp_dir, 'allthethings.json')
+            shutil.copy(options.filename, filename)
+            results.append(run_benchmarks(filename, options.repeat))
+        else:
+            for size in options.builders:
+                filename = os.path.join(tmp_dir, 'allthethings-%d.json' % size)
+                with open(filename, 'w') as f:
+                    json.dump(generate(size, options.seed), f, sort_keys=True)
+                results.append(run_benchmarks(filename, options.repeat))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print "%-50s" % 'builders' + ''.join('%22d' % r['builders'] for r in results)
+    print "%-50s" % 'load (s)' + ''.join('%22.4f' % r['load'] for r in results)
+    for name, _ in BENCHMARKS:
+        print "%-50s" % (name + ' (s, cold/warm)') + ''.join(
+            '%12.4f/%-9.4f' % (r['benchmarks'][name]['cold'], r['benchmarks'][name]['warm'])
+            for r in results)
+
+    with open(options.output, 'w') as f:
+        json.dump({
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': options.seed,
+            'repeat': options.repeat,
+            'results': results,
+        }, f, indent=4, sort_keys=True)
+    print "Results written to %s" % options.output
+
+
+if __name__ == '__main__':
+    main()
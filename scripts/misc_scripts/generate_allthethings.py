@@ -0,0 +1,180 @@
+"""
+This script writes a synthetic allthethings.json with (at least) a given number of builders.
+
+The data has the shape mozci.platforms relies on: build, nightly and test
+builders with properties and shortnames, talos and pgo talos builders, test
+schedulers with their triggers (some of them with SETA intervals), B2G
+emulator builders and a few builders without a build job, release builders
+and bundle builders. The same arguments always generate the same file.
+"""
+import hashlib
+import json
+import random
+
+from argparse import ArgumentParser
+
+# (build platform name, platform, test platform name, scheduler slug)
+PLATFORMS = [
+    ('WINNT 5.2', 'win32', 'Windows 7 VM 32-bit', 'win7'),
+    ('WINNT 6.1 x86-64', 'win64', 'Windows 8 64-bit', 'win8_64'),
+    ('Linux', 'linux', 'Ubuntu VM 12.04', 'ubuntu32_vm'),
+    ('Linux x86-64', 'linux64', 'Ubuntu VM 12.04 x64', 'ubuntu64_vm'),
+    ('OS X 10.7', 'macosx64', 'Rev7 MacOSX Yosemite 10.10.5', 'yosemite'),
+]
+SUITES = ['mochitest-%d' % i for i in range(1, 6)] + \
+    ['crashtest', 'reftest', 'xpcshell', 'cppunit', 'jittest', 'gtest']
+TALOS_SUITES = ['chromez', 'dromaeojs', 'g2-e10s', 'other', 'tp5o-e10s']
+# Repositories with pgo talos builders for every platform; other ones have a few
+PGO_TALOS_REPOS = ('mozilla-aurora', 'mozilla-beta', 'mozilla-central')
+REPOS = ['mozilla-central', 'mozilla-inbound', 'try', 'mozilla-beta', 'mozilla-aurora',
+         'mozilla-release', 'fx-team', 'autoland', 'b2g-inbound', 'mozilla-esr52', 'alder',
+         'ash', 'birch', 'cedar', 'date', 'elm', 'larch', 'maple', 'oak', 'pine']
+
+
+def _repo_names():
+    """Yield as many repository names as needed."""
+    for repo in REPOS:
+        yield repo
+
+    count = 1
+    while True:
+        yield 'project-%d' % count
+        count += 1
+
+
+def _add_builder(builders, buildername, shortname, branch, platform, test=False,
+                 stage_platform=None):
+    properties = {
+        'branch': branch,
+        'platform': platform,
+        'product': 'firefox',
+        'repo_path': 'projects/%s' % branch,
+        'slavebuilddir': 'test' if test else 'build',
+    }
+    if stage_platform:
+        properties['stage_platform'] = stage_platform
+
+    builders[buildername] = {
+        'properties': properties,
+        'shortname': shortname,
+        'slavebuilddir': properties['slavebuilddir'],
+        'slavepool': hashlib.sha1(platform).hexdigest(),
+    }
+
+
+def _add_repo(builders, schedulers, repo, rand):
+    """Add the builders and schedulers of a repository."""
+    for build_prefix, platform, test_prefix, slug in PLATFORMS:
+        _add_builder(builders, '%s %s build' % (build_prefix, repo),
+                     '%s-%s' % (repo, platform), repo, platform)
+        _add_builder(builders, '%s %s leak test build' % (build_prefix, repo),
+                     '%s-%s-debug' % (repo, platform), repo, platform + '-debug')
+        _add_builder(builders, '%s %s nightly' % (build_prefix, repo),
+                     '%s-%s-nightly' % (repo, platform), repo, platform)
+        schedulers['%s-%s nightly' % (repo, platform)] = {
+            'downstream': ['%s %s nightly' % (build_prefix, repo)],
+        }
+        has_pgo = platform != 'macosx64'
+        if has_pgo:
+            _add_builder(builders, '%s %s pgo-build' % (build_prefix, repo),
+                         '%s-%s-pgo' % (repo, platform), repo, platform)
+
+        for build_type in ('opt', 'debug'):
+            buildernames = []
+            for suite in SUITES:
+                buildername = '%s %s %s test %s' % (test_prefix, repo, build_type, suite)
+                _add_builder(builders, buildername, '%s_%s_test-%s' % (repo, slug, suite),
+                             repo, platform if build_type == 'opt' else platform + '-debug',
+                             test=True)
+                buildernames.append(buildername)
+
+            sched = 'tests-%s-%s-%s-unittest' % (repo, slug, build_type)
+            if rand.random() < 0.5:
+                # SETA intervals, e.g. tests-fx-team-snowleopard-opt-unittest-7-3600
+                sched += '-%d-%d' % (rand.randint(2, 10), rand.choice([1800, 3600, 7200]))
+            schedulers[sched] = {
+                'downstream': buildernames,
+                'triggered_by': ['%s-%s-%s-unittest' % (repo, platform, build_type)],
+            }
+
+        talos_prefix = test_prefix.replace(' VM', '')
+        talos, pgo_talos = [], []
+        for suite in TALOS_SUITES:
+            buildername = '%s %s talos %s' % (talos_prefix, repo, suite)
+            _add_builder(builders, buildername, '%s_%s_talos-%s' % (repo, slug, suite), repo,
+                         platform, test=True, stage_platform=platform)
+            talos.append(buildername)
+            if has_pgo and (repo in PGO_TALOS_REPOS or rand.random() < 0.3):
+                buildername = '%s %s pgo talos %s' % (talos_prefix, repo, suite)
+                _add_builder(builders, buildername, '%s_%s_pgo_talos-%s' % (repo, slug, suite),
+                             repo, platform, test=True, stage_platform=platform)
+                pgo_talos.append(buildername)
+
+        schedulers['tests-%s-%s-talos' % (repo, slug)] = {
+            'downstream': talos, 'triggered_by': ['%s-%s-talos' % (repo, platform)]}
+        if pgo_talos:
+            schedulers['tests-%s-%s-pgo-talos' % (repo, slug)] = {
+                'downstream': pgo_talos, 'triggered_by': ['%s-%s-pgo-talos' % (repo, platform)]}
+
+    # B2G builders have their own naming
+    _add_builder(builders, 'b2g_%s_emulator_dep' % repo, 'b2g_%s_emulator_dep' % repo, repo,
+                 'emulator')
+    buildernames = []
+    for suite in SUITES[:4]:
+        buildername = 'b2g_%s_emulator_vm opt test %s' % (repo, suite)
+        _add_builder(builders, buildername, buildername, repo, 'emulator', test=True)
+        buildernames.append(buildername)
+    schedulers['tests-%s-emulator-opt-unittest' % repo] = {
+        'downstream': buildernames, 'triggered_by': ['%s-emulator-opt-unittest' % repo]}
+
+    # A test builder without a build job and builders that mozci skips
+    buildername = 'Ubuntu Code Coverage VM 12.04 x64 %s debug test cppunit' % repo
+    _add_builder(builders, buildername, buildername, repo, 'linux64-cc', test=True)
+    schedulers['tests-%s-linux64-cc-debug-unittest' % repo] = {
+        'downstream': [buildername], 'triggered_by': ['%s-linux64-cc-debug-unittest' % repo]}
+    builders['%s hg bundle' % repo] = {'properties': {}, 'shortname': '%s-bundle' % repo}
+    builders['release-%s-source' % repo] = {'properties': {}, 'shortname': 'release-%s' % repo}
+
+
+def generate(number_of_builders, seed=0):
+    """Return allthethings data with at least number_of_builders builders."""
+    rand = random.Random(seed)
+    builders = {}
+    schedulers = {}
+    for repo in _repo_names():
+        if len(builders) >= number_of_builders:
+            break
+        _add_repo(builders, schedulers, repo, rand)
+
+    slavepools = {}
+    for builder in builders.itervalues():
+        if 'slavepool' in builder:
+            slavepools[builder['slavepool']] = ['t-slave-%d' % i for i in range(20)]
+
+    return {
+        'builders': builders,
+        'schedulers': schedulers,
+        'master_builders': {},
+        'slavepools': slavepools,
+    }
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--builders', type=int, default=10000,
+                        help='Minimum number of builders to generate (default: 10000).')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the random choices (default: 0).')
+    parser.add_argument('--output', default='allthethings.json',
+                        help='File to write (default: allthethings.json).')
+    options = parser.parse_args()
+
+    data = generate(options.builders, options.seed)
+    with open(options.output, 'w') as f:
+        json.dump(data, f, sort_keys=True)
+    print "Wrote %d builders and %d schedulers to %s" % (
+        len(data['builders']), len(data['schedulers']), options.output)
+
+
+if __name__ == '__main__':
+    main()
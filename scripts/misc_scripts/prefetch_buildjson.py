@@ -0,0 +1,43 @@
+"""
+This script downloads and indexes the buildjson day files of a range of dates.
+
+Analyses and backfills which need many day files can run it first; mozci then
+uses the files (and their sidecar files) on disk instead of fetching them one
+at a time.
+"""
+import logging
+
+from argparse import ArgumentParser
+
+from mozci.sources.buildjson import PREFETCH_DOWNLOADS, prefetch
+
+logging.basicConfig(format='%(asctime)s %(levelname)s:\t %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S')
+LOG = logging.getLogger()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('start_date', help='First day (e.g. 2015-06-20).')
+    parser.add_argument('end_date', help='Last day (e.g. 2015-06-22).')
+    parser.add_argument('--downloads', type=int, default=PREFETCH_DOWNLOADS,
+                        help='Number of files downloaded at once (default: %d).' %
+                             PREFETCH_DOWNLOADS)
+    parser.add_argument('--processes', type=int,
+                        help='Number of processes parsing the files (default: number of CPUs).')
+    parser.add_argument("--debug", action="store_true", dest="debug",
+                        help="set debug for logging.")
+    options = parser.parse_args()
+
+    LOG.setLevel(logging.DEBUG if options.debug else logging.INFO)
+    # requests is too noisy and adds no value
+    logging.getLogger("requests").setLevel(logging.WARNING)
+
+    filepaths = prefetch(options.start_date, options.end_date, options.downloads,
+                         options.processes)
+    for date, filepath in sorted(filepaths.iteritems()):
+        print "%s %s" % (date, filepath or "FAILED")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 """This file contains tests for mozci/sources/allthethings.py."""
+import glob
 import json
 import os
 import unittest
 
+import requests
+
 from mock import patch, Mock
 
+from mozci.errors import MozciError
 from mozci.sources import allthethings
 
 
@@ -12,7 +16,7 @@ TMP_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                             "tmp_allthethings.json")
 
 
-def mock_get(data):
+def mock_get(data, status_code=200, headers=None):
     """Mock of requests.get. The object returned must have headers and iter_content properties."""
     response = Mock()
 
@@ -24,7 +28,9 @@ def mock_get(data):
             rest = rest[chunk_size:]
             yield chunk
 
+    response.status_code = status_code
     response.headers = {'content-length': str(len(data))}
+    response.headers.update(headers or {})
     response.iter_content = iter_content
     return response
 
@@ -34,7 +40,7 @@ class TestFetching(unittest.TestCase):
     """
     Test fetch_allthethings_data().
 
-    We will use mock_get to() mock requests.get and Mock() to mock requests.head.
+    We will use mock_get to() mock requests.get.
     """
 
     DATA = '{"data": 1}'
@@ -49,60 +55,112 @@ class TestFetching(unittest.TestCase):
 
     def tearDown(self):
         """Clean up after every test."""
-        if os.path.exists(TMP_FILENAME):
-            os.remove(TMP_FILENAME)
+        for filename in glob.glob(TMP_FILENAME + '*'):
+            os.remove(filename)
         # This will clean in-memory caching
         allthethings.DATA = None
+        allthethings.OFFLINE = False
 
-    @patch('requests.get', return_value=mock_get(DATA))
-    @patch('requests.head', return_value=Mock(headers={'content-length': str(len(DATA))}))
-    def test_calling_twice_with_caching(self, head, get):
+    @patch('mozci.utils.network.get', return_value=mock_get(DATA))
+    def test_calling_twice_with_caching(self, get):
         """
         We are going to call fetch_allthethings_data 2 times.
 
-        The first time it should use requests.get to download the file, and requests.head
-        to verify its integrity. The second time it will return the variable stored in-memory,
-        so it won't call neither head nor get.
+        The first time it should use requests.get to download the file. The second time
+        it will return the variable stored in-memory, so it won't call get.
         """
         # Calling the function the first time, and checking its result
         self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
-        get.assert_called_with(self.URL, stream=True)
+        get.assert_called_with(self.URL, stream=True, headers={})
         assert get.call_count == 1
-        head.assert_called_with(self.URL)
-        assert head.call_count == 1
 
         # Calling again
         allthethings.fetch_allthethings_data()
-        # No change on the count since we have not called them anymore
+        # No change on the count since we have not called it anymore
         assert get.call_count == 1
-        assert head.call_count == 1
 
-    @patch('requests.get', return_value=mock_get(DATA))
-    @patch('requests.head', return_value=Mock(headers={'content-length': str(len(DATA))}))
-    def test_calling_twice_without_caching(self, head, get):
-        """Without caching, get and head should both be called 2 times."""
+    @patch('mozci.utils.network.get', return_value=mock_get(DATA))
+    def test_calling_twice_without_caching(self, get):
+        """Without caching, get should be called 2 times."""
         self.assertEquals(allthethings.fetch_allthethings_data(no_caching=True), self.expected)
-        head.assert_called_with(self.URL)
-        get.assert_called_with(self.URL, stream=True)
+        get.assert_called_with(self.URL, stream=True, headers={})
         assert get.call_count == 1
-        assert head.call_count == 1
 
         # Calling again
         self.assertEquals(allthethings.fetch_allthethings_data(no_caching=True), self.expected)
         assert get.call_count == 2
-        assert head.call_count == 2
 
-    @patch('requests.get', return_value=mock_get(DATA))
-    @patch('requests.head', return_value=Mock(headers={'content-length': str(len(DATA))}))
-    def test_calling_with_bad_cache(self, head, get):
+    @patch('mozci.utils.network.get', return_value=mock_get(DATA))
+    def test_calling_with_bad_cache(self, get):
         """If the existing file is bad, we should download a new one."""
         # Making sure the cache exists and it's bad
         with open(TMP_FILENAME, 'w') as f:
             f.write('bad file')
 
         self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
-        head.assert_called_with(self.URL)
-        get.assert_called_with(self.URL, stream=True)
+        get.assert_called_with(self.URL, stream=True, headers={})
+
+    @patch('mozci.utils.network.get', return_value=mock_get(DATA[:-1]))
+    def test_truncated_download(self, get):
+        """A download which does not match the content-length never replaces the file."""
+        get.return_value.headers['content-length'] = str(len(self.DATA))
+        with self.assertRaises(MozciError):
+            allthethings.fetch_allthethings_data()
+        assert get.call_count == allthethings.MAX_DOWNLOAD_ATTEMPTS
+        assert not os.path.exists(TMP_FILENAME)
+
+    @patch('mozci.utils.network.get', return_value=mock_get(DATA, headers={'etag': '"abc"'}))
+    def test_fresh_cache(self, get):
+        """A new process should not reach the server before CACHE_TTL expires."""
+        allthethings.fetch_allthethings_data()
+        assert get.call_count == 1
+
+        allthethings.DATA = None
+        self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
+        assert get.call_count == 1
+
+    @patch('mozci.utils.network.get', return_value=mock_get(DATA, headers={'etag': '"abc"'}))
+    def test_expired_cache(self, get):
+        """After CACHE_TTL we send a conditional request and keep the file on 304."""
+        allthethings.fetch_allthethings_data()
+
+        allthethings.DATA = None
+        get.return_value = mock_get('', status_code=304)
+        with patch.object(allthethings, 'CACHE_TTL', 0):
+            self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
+        get.assert_called_with(self.URL, stream=True, headers={'If-None-Match': '"abc"'})
+
+    @patch('mozci.utils.network.get', side_effect=requests.exceptions.ConnectionError)
+    def test_offline(self, get):
+        """We use the last good copy if we are offline or the server cannot be reached."""
+        with open(TMP_FILENAME, 'w') as f:
+            f.write(self.DATA)
+
+        self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
+        assert get.call_count == 1
+
+        allthethings.DATA = None
+        allthethings.OFFLINE = True
+        self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
+        assert get.call_count == 1
+
+        os.remove(TMP_FILENAME)
+        allthethings.DATA = None
+        with self.assertRaises(MozciError):
+            allthethings.fetch_allthethings_data()
+
+    @patch('mozci.utils.network.get', return_value=mock_get('', status_code=503))
+    def test_error_status(self, get):
+        """An error status falls back to the last good copy, if there is one."""
+        with self.assertRaises(MozciError):
+            allthethings.fetch_allthethings_data()
+
+        with open(TMP_FILENAME, 'w') as f:
+            f.write(self.DATA)
+        for status_code in (404, 503):
+            allthethings.DATA = None
+            get.return_value = mock_get('', status_code=status_code)
+            self.assertEquals(allthethings.fetch_allthethings_data(), self.expected)
 
     def test_with_verify_set_to_false_and_existing_cache(self):
         """If verify is set to False and there already is a file, we should just use it."""
@@ -117,6 +175,95 @@ class TestFetching(unittest.TestCase):
             allthethings.fetch_allthethings_data(verify=False)
 
 
+class TestIndex(unittest.TestCase):
+
+    """Test the binary index that fetch_allthethings_data() keeps next to allthethings.json."""
+
+    def setUp(self):
+        allthethings.FILENAME = TMP_FILENAME
+        allthethings.DATA = None
+        with open(TMP_FILENAME, 'w') as f:
+            f.write('{"builders": {"Builder 1": {}}, "schedulers": {}, "slavepools": {}}')
+
+    def tearDown(self):
+        for filename in [TMP_FILENAME] + glob.glob(TMP_FILENAME + '.*.idx'):
+            os.remove(filename)
+        allthethings.DATA = None
+
+    def test_index_is_used(self):
+        """The second process to load allthethings.json should not decode the json file."""
+        expected = {'builders': {'Builder 1': {}}, 'schedulers': {}}
+        assert allthethings.fetch_allthethings_data(verify=False) == expected
+        assert os.path.exists(TMP_FILENAME + '.data.idx')
+
+        allthethings.DATA = None
+        with patch('json.load') as load:
+            assert allthethings.fetch_allthethings_data(verify=False) == expected
+            assert load.call_count == 0
+
+    def test_index_is_rebuilt(self):
+        """A new allthethings.json should invalidate the index."""
+        allthethings.fetch_allthethings_data(verify=False)
+        with open(TMP_FILENAME, 'w') as f:
+            f.write('{"builders": {"Builder 2": {}}, "schedulers": {}}')
+
+        allthethings.DATA = None
+        data = allthethings.fetch_allthethings_data(verify=False)
+        assert data == {'builders': {'Builder 2': {}}, 'schedulers': {}}
+
+    def test_sections(self):
+        """Derived sections are only stored for the data loaded from allthethings.json."""
+        data = allthethings.fetch_allthethings_data(verify=False)
+        allthethings.save_index_section('derived', {'a': [1, 2]}, data)
+        assert allthethings.load_index_section('derived', data) == {'a': [1, 2]}
+
+        other_data = dict(data)
+        allthethings.save_index_section('other', {'a': [1, 2]}, other_data)
+        assert allthethings.load_index_section('other', other_data) is None
+        assert not os.path.exists(TMP_FILENAME + '.other.idx')
+
+
+class TestMemorySavingMode(unittest.TestCase):
+
+    """Test the streaming loader of fetch_allthethings_data()."""
+
+    def setUp(self):
+        allthethings.FILENAME = TMP_FILENAME
+        allthethings.DATA = None
+        allthethings.MEMORY_SAVING_MODE = True
+        with open(TMP_FILENAME, 'w') as f:
+            json.dump({
+                'builders': {
+                    'Builder 1': {
+                        'properties': {'branch': 'try', 'platform': 'linux', 'repo_path': 'try'},
+                        'shortname': 'try-linux',
+                        'slavepool': 'abc',
+                    },
+                },
+                'master_builders': {'master': ['Builder 1']},
+                'schedulers': {'try': {'downstream': ['Builder 1']}},
+                'slavepools': {'abc': ['slave1']},
+            }, f)
+
+    def tearDown(self):
+        for filename in glob.glob(TMP_FILENAME + '*'):
+            os.remove(filename)
+        allthethings.DATA = None
+        allthethings.MEMORY_SAVING_MODE = False
+
+    def test_projection(self):
+        """Only the builder keys and properties that mozci uses should be kept."""
+        assert allthethings.fetch_allthethings_data(verify=False) == {
+            'builders': {
+                'Builder 1': {
+                    'properties': {'branch': 'try', 'platform': 'linux'},
+                    'shortname': 'try-linux',
+                },
+            },
+            'schedulers': {'try': {'downstream': ['Builder 1']}},
+        }
+
+
 class TestListBuilders(unittest.TestCase):
 
     """Test _list_builders with mock data."""
@@ -0,0 +1,138 @@
+"""This file contains tests for mozci/builders_index.py."""
+import glob
+import json
+import mmap
+import os
+import time
+import unittest
+
+from mock import patch
+
+from mozci import builders_index, platforms
+from mozci.errors import MissingBuilderError, MozciError
+from mozci.sources import allthethings
+
+
+TMP_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "tmp_builders_index_allthethings.json")
+
+BUILD = "Linux x86-64 mozilla-central build"
+TEST = "Ubuntu VM 12.04 x64 mozilla-central opt test mochitest-1"
+TRY_TEST = "Ubuntu VM 12.04 x64 try opt test mochitest-1"
+
+
+def _builder(branch, slavebuilddir, shortname):
+    return {
+        'properties': {
+            'branch': branch,
+            'platform': 'linux64',
+            'product': 'firefox',
+            'repo_path': branch,
+            'slavebuilddir': slavebuilddir,
+        },
+        'shortname': shortname,
+    }
+
+
+ALLTHETHINGS = {
+    'builders': {
+        BUILD: _builder('mozilla-central', 'build', 'mozilla-central-linux64'),
+        TEST: _builder('mozilla-central', 'test', 'mozilla-central_ubuntu64_vm_test-mochitest-1'),
+        TRY_TEST: _builder('try', 'test', 'try_ubuntu64_vm_test-mochitest-1'),
+        'release-mozilla-central-source': {'properties': {}, 'shortname': 'release'},
+    },
+    'schedulers': {
+        'tests-mozilla-central-ubuntu64_vm-opt-unittest': {
+            'downstream': [TEST],
+            'triggered_by': ['mozilla-central-linux64-opt-unittest'],
+        },
+    },
+}
+
+
+class TestSharedBuildersIndex(unittest.TestCase):
+
+    """Test the shared builders index against a small allthethings.json."""
+
+    def setUp(self):
+        self.filename = allthethings.FILENAME
+        allthethings.FILENAME = TMP_FILENAME
+        allthethings.OFFLINE = True
+        allthethings.DATA = None
+        platforms._reset_caches()
+        builders_index.SHARED_INDEX = None
+        with open(TMP_FILENAME, 'w') as fd:
+            json.dump(ALLTHETHINGS, fd)
+
+    def tearDown(self):
+        builders_index.SHARED_INDEX = None
+        for filename in glob.glob(TMP_FILENAME + '*'):
+            os.remove(filename)
+        allthethings.FILENAME = self.filename
+        allthethings.OFFLINE = False
+        allthethings.DATA = None
+        platforms._reset_caches()
+
+    def test_lookups(self):
+        """The lookups return what mozci.platforms returns."""
+        index = builders_index.get_shared_index()
+        self.assertTrue(isinstance(index.buffer, mmap.mmap))
+        self.assertEquals(len(index), 4)
+        self.assertTrue(TEST in index)
+        self.assertFalse('Unknown builder' in index)
+
+        self.assertEquals(index.get_buildername_metadata(TEST),
+                          dict(platforms.get_buildername_metadata(TEST)))
+        self.assertEquals(index.determine_upstream_builder(TEST), BUILD)
+        self.assertEquals(index.determine_upstream_builder(BUILD), BUILD)
+        with self.assertRaises(MozciError):
+            index.determine_upstream_builder(TRY_TEST)
+        with self.assertRaises(MozciError):
+            index.get_buildername_metadata('release-mozilla-central-source')
+        with self.assertRaises(MissingBuilderError):
+            index.get_buildername_metadata('Unknown builder')
+
+        self.assertEquals(index.get_downstream_jobs(BUILD), [TEST])
+        self.assertEquals(index.get_downstream_jobs(TEST), [])
+        self.assertEquals(sorted(index.list_builders()), sorted(platforms.list_builders()))
+        for repo_name in ('try', 'mozilla-central', 'central', 'alder'):
+            self.assertEquals(index.list_builders(repo_name),
+                              sorted(platforms.list_builders(repo_name)))
+
+    def test_repos_section(self):
+        """The builders of a repo name of allthethings.json are not searched for."""
+        index = builders_index.get_shared_index()
+        self.assertTrue(index.repos_count > 0)
+        with patch.object(index, '_postings', wraps=index._postings) as postings:
+            self.assertEquals(index.list_builders('try'), sorted(platforms.list_builders('try')))
+            self.assertTrue((index.wanted_start, index.wanted_count) not in
+                            [c[0] for c in postings.call_args_list])
+            # Any other value is looked for in every name
+            self.assertEquals(index.list_builders('central'),
+                              sorted(platforms.list_builders('central')))
+            self.assertEquals(postings.call_args_list[-1][0],
+                              (index.wanted_start, index.wanted_count))
+
+    def test_regenerated_when_allthethings_changes(self):
+        """Processes map the index on disk; a new allthethings.json replaces it."""
+        index = builders_index.get_shared_index()
+        builders_index.SHARED_INDEX = None
+        # Another process maps the same file instead of loading allthethings.json
+        allthethings.DATA = None
+        self.assertEquals(builders_index.get_shared_index().signature, index.signature)
+        self.assertTrue(allthethings.DATA is None)
+
+        data = json.loads(json.dumps(ALLTHETHINGS))
+        del data['builders'][TRY_TEST]
+        with open(TMP_FILENAME, 'w') as fd:
+            json.dump(data, fd)
+
+        # We do not look at allthethings.json again until CACHE_TTL seconds have passed
+        self.assertTrue(builders_index.get_shared_index() is builders_index.SHARED_INDEX)
+        self.assertEquals(builders_index.get_shared_index().signature, index.signature)
+        with patch('time.time', return_value=time.time() + allthethings.CACHE_TTL):
+            new_index = builders_index.get_shared_index()
+        self.assertNotEqual(new_index.signature, index.signature)
+        self.assertFalse(TRY_TEST in new_index)
+        # The previous index is still readable
+        self.assertTrue(TRY_TEST in index)
@@ -0,0 +1,305 @@
+"""This file contains tests for mozci/sources/buildjson.py."""
+import glob
+import gzip
+import json
+import os
+import time
+import unittest
+
+from mock import patch
+
+from mozci.sources import buildjson
+
+# 2015-06-22 19:06:40 UTC
+COMPLETE_AT = 1435000000
+DAY_FILE = "builds-2015-06-22.js"
+JOBS = [
+    {"properties": {"buildername": "job-1", "request_ids": [1, 2], "revision": "a" * 40},
+     "request_ids": [1], "endtime": 1435000000, "reason": "scheduler"},
+    {"properties": {"buildername": "job-2"}, "request_ids": [3]},
+    {"properties": {"buildername": "job-3", "request_ids": [4], "revision": "b" * 40},
+     "request_ids": [5]},
+    {"properties": {"buildername": "job-1", "revision": "b" * 12}, "request_ids": [3, 6]},
+]
+TMP_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tmp_" + DAY_FILE)
+
+
+class TestQueryJobData(unittest.TestCase):
+
+    """Test query_job_data() with a mocked buildjson file."""
+
+    def setUp(self):
+        buildjson._reset_cache()
+
+    def tearDown(self):
+        buildjson._reset_cache()
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_both_sources_of_request_ids(self, load_file, fetch_file):
+        """Request ids are found in the job and in its properties; the first job wins."""
+        for request_id, buildername in ((1, "job-1"), (2, "job-1"), (3, "job-2"),
+                                        (4, "job-3"), (5, "job-3"), (6, "job-1")):
+            job = buildjson.query_job_data(COMPLETE_AT, request_id)
+            self.assertEquals(job["properties"]["buildername"], buildername)
+
+        # The file is loaded and indexed once
+        assert load_file.call_count == 1
+        self.assertEquals(buildjson.JOBS_INDEX.keys(), [DAY_FILE])
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_missing_request_id(self, load_file, fetch_file):
+        """We load the file again before giving up on a request id."""
+        self.assertIsNone(buildjson.query_job_data(COMPLETE_AT, 7))
+        assert load_file.call_count == 2
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_query_jobs_data(self, load_file, fetch_file):
+        """Jobs are grouped per file; every file is loaded once."""
+        next_day = COMPLETE_AT + 24 * 60 * 60
+        jobs = buildjson.query_jobs_data([(COMPLETE_AT, 1), (next_day, 3), (COMPLETE_AT, 5),
+                                          (COMPLETE_AT, 7)])
+        self.assertEquals(jobs, {1: JOBS[0], 3: JOBS[1], 5: JOBS[2], 7: None})
+        # One load per day and one more for the missing job
+        assert load_file.call_count == 3
+
+    def test_index_follows_the_cache(self):
+        """The index is built again if the jobs of a file are replaced."""
+        buildjson._cache_jobs(DAY_FILE, JOBS[:1])
+        self.assertIsNone(buildjson._find_job(3, DAY_FILE))
+        buildjson._cache_jobs(DAY_FILE, JOBS)
+        self.assertEquals(buildjson._find_job(3, DAY_FILE), JOBS[1])
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_find_jobs_by_date(self, load_file, fetch_file):
+        """Jobs are looked up by buildername and by revision."""
+        self.assertEquals(buildjson.find_jobs_by_date("2015-06-22", buildername="job-1"),
+                          [JOBS[0], JOBS[3]])
+        self.assertEquals(buildjson.find_jobs_by_date("2015-06-22", revision="b" * 40),
+                          [JOBS[2], JOBS[3]])
+        self.assertEquals(buildjson.find_jobs_by_date(
+            "2015-06-22", buildername="job-1", revision="b" * 40), [JOBS[3]])
+        self.assertEquals(buildjson.find_jobs_by_date("2015-06-22"), JOBS)
+
+
+class TestSidecarFile(unittest.TestCase):
+
+    """Test the sidecar file written next to a day file."""
+
+    def setUp(self):
+        buildjson._reset_cache()
+        self.use_jobs_store = buildjson.USE_JOBS_STORE
+        with open(TMP_FILENAME, 'wb') as fd:
+            gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+            gzipper.write(json.dumps({"builds": JOBS}))
+            gzipper.close()
+
+    def tearDown(self):
+        buildjson._reset_cache()
+        buildjson.USE_JOBS_STORE = self.use_jobs_store
+        for filename in glob.glob(TMP_FILENAME + '*'):
+            os.remove(filename)
+
+    @patch('mozci.utils.transfer.fetch_file', side_effect=lambda filename, url: filename)
+    @patch('mozci.sources.buildjson.fetch_file')
+    def test_new_process_uses_the_sidecar_file(self, fetch_file, transfer_fetch_file):
+        """A new process neither parses nor indexes the day file again; jobs are complete."""
+        self.assertEquals(list(buildjson._fetch_data(TMP_FILENAME)), JOBS)
+        assert os.path.exists(TMP_FILENAME + '.idx')
+
+        # As if a new process was started
+        buildjson._reset_cache()
+        with patch('mozci.utils.transfer._load_json_file') as load_json_file:
+            with patch('mozci.sources.buildjson._index_jobs') as index_jobs:
+                job = buildjson._find_job(6, TMP_FILENAME)
+                assert load_json_file.call_count == 0
+                assert index_jobs.call_count == 0
+        self.assertEquals(job, JOBS[3])
+
+    @patch('mozci.utils.transfer.fetch_file', side_effect=lambda filename, url: filename)
+    @patch('mozci.sources.buildjson.fetch_file')
+    def test_jobs_store(self, fetch_file, transfer_fetch_file):
+        """The jobs are kept in a JobsStore only if USE_JOBS_STORE is set; they are complete."""
+        for use_jobs_store in (True, False):
+            buildjson._reset_cache()
+            buildjson.USE_JOBS_STORE = use_jobs_store
+            jobs = buildjson._fetch_data(TMP_FILENAME)
+            self.assertEquals(isinstance(jobs, buildjson.JobsStore), use_jobs_store)
+            self.assertEquals(list(jobs), JOBS)
+            self.assertEquals(buildjson._find_job(6, TMP_FILENAME), JOBS[3])
+
+    @patch('mozci.utils.transfer.fetch_file', side_effect=lambda filename, url: filename)
+    @patch('mozci.sources.buildjson.fetch_file')
+    def test_sidecar_file_of_previous_copy(self, fetch_file, transfer_fetch_file):
+        """The sidecar file is ignored once the day file is replaced."""
+        buildjson._fetch_data(TMP_FILENAME)
+        with open(TMP_FILENAME, 'wb') as fd:
+            json.dump({"builds": JOBS[:1]}, fd)
+
+        buildjson._reset_cache()
+        self.assertIsNone(buildjson._find_job(6, TMP_FILENAME))
+
+
+class TestPrefetch(unittest.TestCase):
+
+    """Test prefetching the day files of a range of dates."""
+
+    def setUp(self):
+        buildjson._reset_cache()
+        with open(TMP_FILENAME, 'wb') as fd:
+            gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+            gzipper.write(json.dumps({"builds": JOBS}))
+            gzipper.close()
+
+    def tearDown(self):
+        buildjson._reset_cache()
+        for filename in glob.glob(TMP_FILENAME + '*'):
+            os.remove(filename)
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    def test_prefetch(self, fetch_file):
+        """Every day is downloaded and the day files are indexed in other processes."""
+        def fetch(filepath, url):
+            if url.endswith("builds-2015-06-23.js.gz"):
+                raise buildjson.MozciError("404")
+            return TMP_FILENAME
+
+        fetch_file.side_effect = fetch
+        filepaths = buildjson.prefetch("2015-06-22", "2015-06-23", downloads=1, processes=1)
+        self.assertEquals(filepaths, {"2015-06-22": TMP_FILENAME, "2015-06-23": None})
+        assert fetch_file.call_count == 2
+        self.assertTrue(os.path.exists(TMP_FILENAME + '.idx'))
+
+        self.assertTrue(os.path.exists(TMP_FILENAME + '.marshal'))
+
+        with patch('mozci.utils.transfer.fetch_file', side_effect=fetch):
+            with patch('mozci.utils.transfer._load_json_file') as load_json_file:
+                self.assertEquals(buildjson._find_job(6, TMP_FILENAME), JOBS[3])
+                assert load_json_file.call_count == 0
+
+    def test_corrupted_day_file(self):
+        """A day file without valid data is moved aside instead of indexed."""
+        with open(TMP_FILENAME, 'wb') as fd:
+            gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+            gzipper.write('{"builds": [')
+            gzipper.close()
+
+        self.assertEquals(buildjson._index_day_file(TMP_FILENAME), None)
+        self.assertFalse(os.path.exists(TMP_FILENAME))
+        self.assertTrue(os.path.exists(TMP_FILENAME + '.corrupted'))
+        self.assertFalse(os.path.exists(TMP_FILENAME + '.idx'))
+
+
+class TestBuildsCache(unittest.TestCase):
+
+    """Test the eviction policy of BUILDS_CACHE."""
+
+    def setUp(self):
+        buildjson._reset_cache()
+        self.max_cached_jobs = buildjson.MAX_CACHED_JOBS
+        buildjson.MAX_CACHED_JOBS = 2 * len(JOBS)
+
+    def tearDown(self):
+        buildjson._reset_cache()
+        buildjson.MAX_CACHED_JOBS = self.max_cached_jobs
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_least_recently_used_day_file_is_evicted(self, load_file, fetch_file):
+        """Day files are evicted once they hold more than MAX_CACHED_JOBS jobs."""
+        buildjson.fetch_by_date("2015-06-20")
+        buildjson.fetch_by_date("2015-06-21")
+        buildjson.fetch_by_date("2015-06-20")
+        buildjson.fetch_by_date("2015-06-22")
+        self.assertEquals(list(buildjson.BUILDS_CACHE),
+                          ["builds-2015-06-20.js", "builds-2015-06-22.js"])
+        self.assertEquals(buildjson.get_cache_stats(), {
+            'hits': 1, 'misses': 3, 'evictions': 1, 'files': 2, 'jobs': 2 * len(JOBS)})
+
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS * 3})
+    def test_4hr_file(self, load_file):
+        """The 4 hour file does not count towards MAX_CACHED_JOBS; it expires instead."""
+        buildjson._fetch_data(buildjson.BUILDS_4HR_FILE)
+        buildjson._fetch_data(buildjson.BUILDS_4HR_FILE)
+        assert load_file.call_count == 1
+        self.assertEquals(buildjson.get_cache_stats()['jobs'], 0)
+        # It changes too often to keep a decoded copy of it
+        self.assertEquals(load_file.call_args[1]['decoded_copy'], False)
+
+        with patch('time.time', return_value=time.time() + buildjson.BUILDS_4HR_TTL):
+            buildjson._fetch_data(buildjson.BUILDS_4HR_FILE)
+        assert load_file.call_count == 2
+
+    @patch('mozci.sources.buildjson.fetch_file')
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_projections_are_cached_apart(self, load_file, fetch_file):
+        """The jobs of a file are cached once per projection."""
+        buildjson.fetch_by_date("2015-06-22", ['endtime', 'result'])
+        buildjson.fetch_by_date("2015-06-22", ('result', 'endtime'))
+        buildjson.fetch_by_date("2015-06-22")
+        assert load_file.call_count == 2
+        self.assertEquals(load_file.call_args_list[0][0][2], ['endtime', 'result'])
+        self.assertEquals(list(buildjson.BUILDS_CACHE),
+                          [(DAY_FILE, ('endtime', 'result')), DAY_FILE])
+        self.assertEquals(buildjson.get_cache_stats()['jobs'], 2 * len(JOBS))
+
+
+class TestRecentJobs(unittest.TestCase):
+
+    """Test looking for jobs in the 4 hour file."""
+
+    def setUp(self):
+        buildjson._reset_cache()
+        self.complete_at = int(time.time()) - 60
+
+    def tearDown(self):
+        buildjson._reset_cache()
+
+    @patch('mozci.sources.buildjson.load_file', return_value={"builds": JOBS})
+    def test_missing_jobs_do_not_refetch(self, load_file):
+        """A burst of lookups of missing jobs costs at most one download per interval."""
+        for request_id in (7, 8, 7, 9):
+            self.assertIsNone(buildjson.query_job_data(self.complete_at, request_id))
+        assert load_file.call_count == 1
+
+        later = time.time() + buildjson.BUILDS_4HR_MIN_REFRESH
+        with patch('time.time', return_value=later):
+            self.assertIsNone(buildjson.query_job_data(self.complete_at, 7))
+            self.assertIsNone(buildjson.query_job_data(self.complete_at, 8))
+        assert load_file.call_count == 2
+
+    def test_new_jobs_are_merged(self):
+        """The jobs of a new copy of the 4 hour file are merged into the ones we have."""
+        copies = [{"builds": JOBS[:2]}, {"builds": JOBS[1:]}]
+        with patch('mozci.sources.buildjson.load_file', side_effect=copies):
+            job = buildjson.query_job_data(self.complete_at, 1)
+            self.assertEquals(job, JOBS[0])
+            jobs = buildjson.BUILDS_CACHE[buildjson.BUILDS_4HR_FILE]
+
+            later = time.time() + buildjson.BUILDS_4HR_MIN_REFRESH
+            with patch('time.time', return_value=later):
+                self.assertEquals(buildjson.query_job_data(self.complete_at, 5), JOBS[2])
+
+        # The job which is not in the new copy is still there
+        self.assertEquals(buildjson.query_job_data(self.complete_at, 1), JOBS[0])
+        self.assertTrue(buildjson.BUILDS_CACHE[buildjson.BUILDS_4HR_FILE] is jobs)
+        self.assertEquals(jobs, JOBS)
+
+    def test_jobs_without_request_ids_are_merged_once(self):
+        """Jobs without request ids are not added again on every refresh."""
+        no_ids = [{"properties": {"buildername": "job-4"}, "request_ids": [], "starttime": 1},
+                  {"properties": {"buildername": "job-4"}, "request_ids": [], "starttime": 2}]
+        copies = [{"builds": JOBS[:1] + no_ids[:1]}, {"builds": JOBS[:2] + no_ids},
+                  {"builds": JOBS[:2] + no_ids}]
+        with patch('mozci.sources.buildjson.load_file', side_effect=copies):
+            buildjson.query_job_data(self.complete_at, 1)
+            for refresh in (1, 2):
+                later = time.time() + refresh * buildjson.BUILDS_4HR_MIN_REFRESH
+                with patch('time.time', return_value=later):
+                    self.assertIsNone(buildjson.query_job_data(self.complete_at, 8 + refresh))
+
+        self.assertEquals(buildjson.BUILDS_CACHE[buildjson.BUILDS_4HR_FILE],
+                          JOBS[:1] + no_ids[:1] + JOBS[1:2] + no_ids[1:])
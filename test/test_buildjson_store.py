@@ -0,0 +1,49 @@
+"""This file contains tests for mozci/sources/buildjson_store.py."""
+import sys
+import unittest
+
+from mozci.sources.buildjson_store import JobsStore
+
+JOBS = [
+    {"properties": {"buildername": "job-1", "request_ids": [1, 2], "revision": "a" * 40,
+                    "slavename": "t-w732-ix-001"},
+     "request_ids": [1], "endtime": 1435000000, "starttime": 1434990000, "result": 0,
+     "reason": "scheduler"},
+    {"properties": {"buildername": "job-2", "slavename": "".join(["t-w732-ix-", "001"])},
+     "request_ids": [3], "endtime": None, "result": 0.5},
+    {"properties": {"buildername": "job-1", "revision": "a" * 40, "blobber_files": {"a": 1}},
+     "request_ids": [sys.maxint, -sys.maxint - 1], "builder_id": 10 ** 30},
+    {"request_ids": "unexpected", "properties": None},
+    {},
+]
+
+
+class TestJobsStore(unittest.TestCase):
+
+    """Test that JobsStore returns the jobs it was given."""
+
+    def test_jobs_are_returned_as_they_were(self):
+        store = JobsStore(JOBS)
+        self.assertEquals(len(store), len(JOBS))
+        self.assertEquals(list(store), JOBS)
+        self.assertEquals(store[-1], JOBS[-1])
+        self.assertEquals(store[1:3], JOBS[1:3])
+        with self.assertRaises(IndexError):
+            store[len(JOBS)]
+
+        store.append(JOBS[0])
+        self.assertEquals(store[len(JOBS)], JOBS[0])
+
+    def test_values_are_stored_once(self):
+        """Buildernames and revisions are dictionary-encoded; other strings are shared."""
+        store = JobsStore(JOBS)
+        self.assertEquals(store._coded['buildername'].distinct_values, ["job-1", "job-2"])
+        self.assertEquals(store._coded['revision'].distinct_values, ["a" * 40])
+        self.assertTrue(store[0]['properties']['slavename'] is
+                        store[1]['properties']['slavename'])
+
+    def test_jobs_are_copies(self):
+        """Changing a job does not change the store."""
+        store = JobsStore(JOBS)
+        store[0]['properties']['request_ids'].append(7)
+        self.assertEquals(store[0], JOBS[0])
@@ -0,0 +1,139 @@
+"""This file contains tests for mozci/utils/cache.py."""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from mozci.utils import cache
+
+DAY = 24 * 60 * 60
+
+
+class TestCache(unittest.TestCase):
+
+    """Test the eviction of the files of the cache directory."""
+
+    def setUp(self):
+        self.cache_dir = cache.CACHE_DIR
+        self.quota = cache.QUOTA
+        cache.CACHE_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(cache.CACHE_DIR)
+        cache.CACHE_DIR = self.cache_dir
+        cache.QUOTA = self.quota
+        cache._PENDING_USES.clear()
+        cache._LAST_FLUSH = 0
+
+    def _create(self, filename, size=10, age=0):
+        filepath = os.path.join(cache.CACHE_DIR, filename)
+        with open(filepath, 'w') as fd:
+            fd.write('x' * size)
+        then = time.time() - age * DAY
+        os.utime(filepath, (then, then))
+        return filepath
+
+    def _files(self):
+        return sorted(os.listdir(cache.CACHE_DIR))
+
+    def test_age_limits(self):
+        """Files older than the maximum age of their class go with the files named after them."""
+        self._create('builds-2015-01-01.js', age=200)
+        self._create('builds-2015-01-01.js.idx', age=1)
+        self._create('builds-2015-06-01.js', age=100)
+        self._create('allthethings.json', age=400)
+        self._create('credentials.cfg', age=400)
+        self._create('builds-2015-06-01.js.marshal', age=40)
+
+        self.assertEquals(sorted(cache.evict()), ['builds-2015-01-01.js',
+                                                  'builds-2015-01-01.js.idx',
+                                                  'builds-2015-06-01.js.marshal'])
+        self.assertEquals(self._files(), ['allthethings.json', 'builds-2015-06-01.js',
+                                          cache.MANIFEST_FILENAME, 'credentials.cfg'])
+
+    def test_unknown_files_are_kept(self):
+        """Files which mozci does not write are never removed nor part of the quota."""
+        self._create('graph.json', size=1000, age=400)
+        self._create('builds-2015-06-01.js', size=100)
+        cache.QUOTA = 200
+        self.assertEquals(cache.evict(), [])
+        self.assertEquals(self._files(), ['builds-2015-06-01.js', cache.MANIFEST_FILENAME,
+                                          'graph.json'])
+
+    def test_quota(self):
+        """The least recently used files go first; allthethings.json is kept."""
+        self._create('allthethings.json', size=100, age=3)
+        first = self._create('builds-2015-06-01.js', size=100, age=2)
+        self._create('builds-2015-06-02.js', size=100, age=1)
+        self.assertEquals(cache.evict(), [])
+        # The first file is used again after the cache was listed
+        cache.record_use(first)
+        self._create('builds-2015-06-03.js', size=50)
+        cache.record_use(os.path.join(cache.CACHE_DIR, 'builds-2015-06-03.js'))
+
+        cache.QUOTA = 250
+        self.assertEquals(cache.evict(), ['builds-2015-06-02.js'])
+        self.assertTrue('allthethings.json' in self._files())
+
+    def test_decoded_copies_go_first(self):
+        """Decoded copies are removed before the files they were decoded from."""
+        self._create('builds-2015-06-01.js', size=100, age=2)
+        self._create('builds-2015-06-02.js', size=100, age=1)
+        self._create('builds-2015-06-02.js.marshal', size=100)
+        cache.QUOTA = 250
+        self.assertEquals(cache.evict(), ['builds-2015-06-02.js.marshal'])
+        self.assertEquals(self._files(), ['builds-2015-06-01.js', 'builds-2015-06-02.js',
+                                          cache.MANIFEST_FILENAME])
+
+    def test_eviction_interval(self):
+        """The directory is not looked at again until EVICTION_INTERVAL seconds have passed."""
+        self._create('allthethings.json')
+        self._create('builds-2015-01-01.js', age=200)
+        self.assertEquals(cache.maybe_evict(), ['builds-2015-01-01.js'])
+
+        self._create('builds-2015-01-01.js', age=200)
+        with patch('os.listdir') as listdir:
+            self.assertEquals(cache.maybe_evict(), [])
+            assert listdir.call_count == 0
+
+        later = time.time() + cache.EVICTION_INTERVAL
+        with patch('time.time', return_value=later):
+            # The manifest does not know about the new file until we list the directory
+            self.assertEquals(cache.maybe_evict(), [])
+        with patch('time.time', return_value=later + cache.RESCAN_INTERVAL):
+            self.assertEquals(cache.maybe_evict(), ['builds-2015-01-01.js'])
+
+    def test_concurrent_uses(self):
+        """Every use recorded by several threads at once ends up in the manifest."""
+        filepaths = [self._create('builds-2015-06-%02d.js' % day) for day in range(1, 41)]
+
+        def record_uses(offset):
+            for filepath in filepaths[offset:] + filepaths[:offset]:
+                cache.record_use(filepath)
+
+        with patch('mozci.utils.cache.FLUSH_INTERVAL', 0):
+            threads = [threading.Thread(target=record_uses, args=(i * 10,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEquals(sorted(cache._read_manifest()['files']),
+                          [os.path.basename(f) for f in filepaths])
+        self.assertEquals([f for f in self._files() if f.endswith('.tmp')], [])
+
+    def test_uses_are_batched(self):
+        """Uses are added to the manifest once per FLUSH_INTERVAL and by flush()."""
+        first = self._create('builds-2015-06-01.js')
+        second = self._create('builds-2015-06-02.js')
+        cache.flush()
+        cache.record_use(first)
+        cache.record_use(second)
+        self.assertEquals(sorted(cache._read_manifest()['files']), ['builds-2015-06-01.js'])
+        cache.flush()
+        self.assertEquals(sorted(cache._read_manifest()['files']),
+                          ['builds-2015-06-01.js', 'builds-2015-06-02.js'])
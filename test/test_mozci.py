@@ -9,6 +9,7 @@ from mock import patch
 
 # This project
 from helpers import ALLTHETHINGS
+from mozci.errors import BuildjsonError
 from mozci.mozci import (
     StatusSummary,
     _unique_build_request,
@@ -132,6 +133,15 @@ class TestJobValidation(unittest.TestCase):
         """Test StatusSummary with a coalesced state."""
         assert StatusSummary(self.jobs).coalesced_jobs == 1
 
+    @patch('mozci.query_jobs.BuildApi.get_job_status',
+           return_value=SUCCESS)
+    @patch('mozci.query_jobs.BuildApi.get_jobs_data',
+           side_effect=BuildjsonError("The file could not be fetched."))
+    def test_status_summary_without_jobs_data(self, get_jobs_data, get_status):
+        """The jobs are looked up one by one when we cannot get their data at once."""
+        assert StatusSummary(self.jobs).successful_jobs == 1
+        get_status.assert_called_once_with(self.jobs[0], None)
+
     @patch('mozci.platforms.fetch_allthethings_data')
     def test_valid_builder(self, fetch_allthethings_data):
         fetch_allthethings_data.return_value = ALLTHETHINGS
@@ -145,7 +155,7 @@ def test_disable_validations():
     assert validate() is False
 
 
-@pytest.mark.parametrize("query_source", [("buildapi"), ("treeherder")])
+@pytest.mark.parametrize("query_source", [("buildapi"), ("buildjson"), ("treeherder")])
 def test_set_query_source(query_source):
     set_query_source(query_source=query_source)
 
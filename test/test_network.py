@@ -0,0 +1,102 @@
+"""This file contains tests for mozci/utils/network.py."""
+import BaseHTTPServer
+import threading
+import unittest
+
+import requests
+
+from mock import patch, Mock
+
+from mozci.utils import network
+
+BUILDJSON_URL = "http://builddata.pub.build.mozilla.org/builddata/buildjson/builds-4hr.js.gz"
+
+
+class _UnavailableHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Answer every request with 503 Service Unavailable."""
+
+    requests_count = 0
+
+    def do_GET(self):
+        _UnavailableHandler.requests_count += 1
+        self.send_response(503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSession(unittest.TestCase):
+
+    """Test the session shared by the requests of a process."""
+
+    def setUp(self):
+        network.SESSION = None
+        network.reset_host_stats()
+
+    def tearDown(self):
+        network.SESSION = None
+        network.reset_host_stats()
+
+    def test_one_session_per_process(self):
+        session = network.get_session()
+        self.assertTrue(network.get_session() is session)
+        with patch('os.getpid', return_value=-1):
+            self.assertFalse(network.get_session() is session)
+
+    def test_pool_sizes(self):
+        session = network.get_session()
+        self.assertEquals(session.get_adapter(BUILDJSON_URL)._pool_maxsize,
+                          network.HOST_POOL_SIZES['builddata.pub.build.mozilla.org'])
+        self.assertEquals(session.get_adapter("https://index.taskcluster.net/v1/")._pool_maxsize,
+                          network.POOL_MAXSIZE)
+
+    @patch('requests.Session.request')
+    def test_host_stats(self, request):
+        """Requests, errors and bytes are counted per host."""
+        request.side_effect = [
+            Mock(ok=True, content='0123', headers={}),
+            Mock(ok=True, headers={'content-length': '10'}),
+            Mock(ok=False, content='', headers={}),
+            requests.exceptions.ConnectionError(),
+        ]
+        network.get(BUILDJSON_URL)
+        network.get(BUILDJSON_URL, stream=True, timeout=5)
+        network.head("https://index.taskcluster.net/v1/")
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            network.get("https://index.taskcluster.net/v1/")
+
+        self.assertEquals(request.call_args_list[0][1]['timeout'], network.TIMEOUT)
+        self.assertEquals(request.call_args_list[1][1]['timeout'], 5)
+        stats = network.get_host_stats()
+        self.assertEquals(sorted(stats), ['builddata.pub.build.mozilla.org',
+                                          'index.taskcluster.net'])
+        for host, (requests_count, errors, size) in (
+                ('builddata.pub.build.mozilla.org', (2, 0, 14)),
+                ('index.taskcluster.net', (2, 2, 0))):
+            self.assertEquals((stats[host]['requests'], stats[host]['errors'],
+                               stats[host]['bytes']), (requests_count, errors, size))
+
+    @patch('mozci.utils.network.BACKOFF_FACTOR', 0)
+    def test_error_status_after_last_retry(self):
+        """The last response is returned once every retry failed with an error status."""
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _UnavailableHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        _UnavailableHandler.requests_count = 0
+        try:
+            response = network.get('http://127.0.0.1:%d/' % server.server_port)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEquals(response.status_code, 503)
+        self.assertFalse(response.ok)
+        if network.RETRY_ON_STATUS:
+            self.assertEquals(_UnavailableHandler.requests_count, network.MAX_RETRIES + 1)
+        else:
+            self.assertEquals(_UnavailableHandler.requests_count, 1)
+        self.assertEquals(network.get_host_stats().values()[0]['errors'], 1)
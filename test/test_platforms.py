@@ -15,17 +15,23 @@ from helpers import (
     SETA_RESULT,
     GRAPH_RESULT
 )
-from mozci.errors import MissingBuilderError
+from mozci.errors import MissingBuilderError, MozciError
+from mozci import platforms
+from mozci.sources import allthethings
 from mozci.platforms import (
     MAX_PUSHES,
+    _generate_builders_data,
     _get_job_type,
     _include_builders_matching,
+    _reset_caches,
     _wanted_builder,
     build_tests_per_platform_graph,
     build_talos_buildernames_for_repo,
     determine_upstream_builder,
     get_associated_platform_name,
     get_buildername_metadata,
+    get_builders_changes,
+    get_builders_without_upstream,
     get_downstream_jobs,
     get_SETA_info,
     get_SETA_interval_dict,
@@ -141,6 +147,28 @@ class TestFindBuildernames(unittest.TestCase):
             find_buildernames('try', suite_name=None, platform=None)
 
 
+class TestListBuilders(unittest.TestCase):
+
+    """Test list_builders with mock data."""
+
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_repo_name(self, fetch_allthethings_data):
+        """Every builder containing the repo name should be listed."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        obtained = list_builders(repo_name='try')
+        assert 'Windows 7 VM 32-bit try opt test mochitest-1' in obtained
+        assert all('try' in builder for builder in obtained)
+
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_cached_results_are_not_shared(self, fetch_allthethings_data):
+        """Modifying the returned list should not affect the following calls."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        builders = list_builders(repo_name='try')
+        expected = list(builders)
+        builders.pop()
+        assert list_builders(repo_name='try') == expected
+
+
 class TestFilterBuildernames(unittest.TestCase):
 
     """Test filter_buildernames with mock data."""
@@ -160,6 +188,26 @@ class TestFilterBuildernames(unittest.TestCase):
         ]
         assert obtained == expected
 
+    def test_words_with_spaces_and_duplicates(self):
+        """filter_buildernames should match like a case insensitive substring search."""
+        buildernames = ['Linux x86-64 try opt test xpcshell',
+                        'Linux x86-64 try opt test xpcshell',
+                        'Linux try debug test xpcshell',
+                        'b2g_try_emulator dep']
+        for include, exclude in [(['86-64 TRY OP'], []), (['t test x'], ['debug']),
+                                 (['y_em'], []), ([''], ['64 t']), ([' '], ['linux'])]:
+            expected = buildernames
+            for word in include:
+                expected = [b for b in expected if word.lower() in b.lower()]
+            for word in exclude:
+                expected = [b for b in expected if word.lower() not in b.lower()]
+            assert filter_buildernames(buildernames, include, exclude) == sorted(expected)
+
+    def test_same_buildernames_other_counts(self):
+        """Lists with the same buildernames repeated differently do not share an index."""
+        assert filter_buildernames(['a', 'a', 'b'], ['']) == ['a', 'a', 'b']
+        assert filter_buildernames(['a', 'b', 'b'], ['']) == ['a', 'b', 'b']
+
 
 class TestSETA(unittest.TestCase):
 
@@ -190,6 +238,42 @@ class TestSETA(unittest.TestCase):
         assert get_max_pushes("Platform2 mozilla-beta talos tp5o-e10s") == MAX_PUSHES
 
 
+class TestMetadataCache(unittest.TestCase):
+
+    """Test the cache of get_buildername_metadata."""
+
+    BUILDERNAME = 'Windows 8 64-bit try opt test mochitest-1'
+
+    def tearDown(self):
+        # Make sure that no other test sees the metadata of the modified data
+        allthethings.GENERATION += 1
+
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_read_only(self, fetch_allthethings_data):
+        """The metadata records are shared among callers, thus, they cannot be modified."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        metadata = get_buildername_metadata(self.BUILDERNAME)
+        assert metadata is get_buildername_metadata(self.BUILDERNAME)
+        with pytest.raises(TypeError):
+            metadata['platform_name'] = 'win32'
+
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_new_generation(self, fetch_allthethings_data):
+        """Reloading allthethings.json should invalidate the cached metadata."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        assert get_buildername_metadata(self.BUILDERNAME)['platform_name'] == 'win64'
+
+        data = {'builders': dict(ALLTHETHINGS['builders']), 'schedulers': {}}
+        builder = dict(data['builders'][self.BUILDERNAME])
+        builder['properties'] = dict(builder['properties'], platform='win32')
+        data['builders'][self.BUILDERNAME] = builder
+        fetch_allthethings_data.return_value = data
+        # This is what fetch_allthethings_data() does when it reloads the data
+        allthethings.GENERATION += 1
+
+        assert get_buildername_metadata(self.BUILDERNAME)['platform_name'] == 'win32'
+
+
 class TestGetPlatform(unittest.TestCase):
 
     """Test get_associated_platform_name with mock data."""
@@ -285,6 +369,18 @@ class TestDetermineUpstream(unittest.TestCase):
         with pytest.raises(Exception):
             determine_upstream_builder("Not a valid buildername")
 
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_builders_without_upstream(self, fetch_allthethings_data):
+        """The test jobs listed are the ones without a build job to trigger them."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        builders = get_builders_without_upstream()
+        assert 'Windows 7 VM 32-bit try opt test mochitest-1' not in builders
+        for buildername in builders:
+            try:
+                assert determine_upstream_builder(buildername) is None
+            except MozciError:
+                pass
+
 
 class TestGetDownstream(unittest.TestCase):
 
@@ -300,6 +396,99 @@ class TestGetDownstream(unittest.TestCase):
         assert obtained == expected
 
 
+class TestBuildersData(unittest.TestCase):
+
+    """Test the structures derived from the builders and schedulers."""
+
+    def setUp(self):
+        # Make sure that we don't use what other tests computed
+        _reset_caches()
+
+    def tearDown(self):
+        _reset_caches()
+
+    @patch('mozci.platforms._generate_builders_data', wraps=_generate_builders_data)
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_computed_once_per_generation(self, fetch_allthethings_data, generate):
+        """Upstream builders, downstream jobs and SETA intervals are computed together."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        build = 'OS X 10.7 try build'
+        downstream = get_downstream_jobs(build)
+        assert sorted(downstream) == sorted(GRAPH_RESULT['opt']['macosx64'][build])
+        assert all(determine_upstream_builder(job) == build for job in downstream)
+        assert get_max_pushes("Windows 7 VM 32-bit mozilla-inbound opt test mochitest-2") == 8
+        assert generate.call_count == 1
+
+        # Reloading the same data does not change anything
+        allthethings.GENERATION += 1
+        assert get_downstream_jobs(build) == downstream
+        assert generate.call_count == 1
+        assert get_builders_changes()['builders_removed'] == []
+
+    @patch('mozci.platforms._generate_builders_data', wraps=_generate_builders_data)
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_incremental_update(self, fetch_allthethings_data, generate):
+        """Reloading allthethings.json only updates what changed and reports it."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        build = 'OS X 10.7 try build'
+        removed = sorted(get_downstream_jobs(build))[0]
+        seta_job = "Windows 7 VM 32-bit mozilla-inbound opt test mochitest-2"
+        assert get_SETA_info(seta_job) == [8, 3600]
+
+        data = {'builders': dict(ALLTHETHINGS['builders']),
+                'schedulers': dict(ALLTHETHINGS['schedulers'])}
+        del data['builders'][removed]
+        sched = [sched for sched, values in data['schedulers'].iteritems()
+                 if sched.startswith('tests-') and seta_job in values['downstream']][0]
+        data['schedulers'][u'tests-without-seta'] = data['schedulers'].pop(sched)
+        fetch_allthethings_data.return_value = data
+        allthethings.GENERATION += 1
+
+        assert removed not in get_downstream_jobs(build)
+        assert get_SETA_info(seta_job) is None
+        assert generate.call_count == 1
+        changes = get_builders_changes()
+        assert changes['builders_removed'] == [removed]
+        assert changes['seta_changes'][seta_job] == ([8, 3600], None)
+
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_incremental_update_matches_rebuild(self, fetch_allthethings_data):
+        """Triggers and SETA intervals are the ones a full rebuild computes."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        get_SETA_interval_dict()
+
+        data = {'builders': dict(ALLTHETHINGS['builders']),
+                'schedulers': dict(ALLTHETHINGS['schedulers'])}
+        sched = sorted(sched for sched in data['schedulers']
+                       if sched.startswith('tests-') and sched[-1].isdigit())[0]
+        values = data['schedulers'].pop(sched)
+        seta_job = values['downstream'][0]
+        data['schedulers'][sched.rsplit('-', 2)[0] + u'-5-1801'] = values
+        fetch_allthethings_data.return_value = data
+        allthethings.GENERATION += 1
+
+        assert get_SETA_info(seta_job) == [5, 1801]
+        rebuilt = _generate_builders_data()
+        assert get_SETA_interval_dict() == rebuilt['seta']
+        assert platforms.BUILDERNAME_TO_TRIGGER == rebuilt['buildername_to_trigger']
+
+    @patch('mozci.platforms.fetch_allthethings_data')
+    def test_job_of_two_schedulers(self, fetch_allthethings_data):
+        """A test job cannot be triggered by two schedulers."""
+        fetch_allthethings_data.return_value = ALLTHETHINGS
+        get_SETA_interval_dict()
+
+        data = {'builders': dict(ALLTHETHINGS['builders']),
+                'schedulers': dict(ALLTHETHINGS['schedulers'])}
+        sched = [sched for sched in data['schedulers'] if sched.startswith('tests-')][0]
+        data['schedulers'][u'tests-copy'] = data['schedulers'][sched]
+        fetch_allthethings_data.return_value = data
+        allthethings.GENERATION += 1
+
+        with pytest.raises(MozciError):
+            get_SETA_interval_dict()
+
+
 class TestTalosBuildernames(unittest.TestCase):
 
     """We need this class because of the mock module."""
@@ -1,11 +1,17 @@
+import gzip
 import json
+import os
+import shutil
+import tempfile
 import unittest
 
 from mock import patch, Mock
 
-from mozci.errors import TreeherderError
+from mozci.errors import BuildjsonError, TreeherderError
 from mozci import query_jobs
-from mozci.query_jobs import BuildApi, TreeherderApi, SUCCESS, PENDING,\
+from mozci.sources import buildjson
+from mozci.utils import cache
+from mozci.query_jobs import BuildApi, BuildjsonApi, TreeherderApi, SUCCESS, PENDING,\
     RUNNING, UNKNOWN, COALESCED, FAILURE
 
 BASE_JSON = """
@@ -297,6 +303,34 @@ class TestBuildApiGetJobStatus(unittest.TestCase):
         with self.assertRaises(Exception):
             self.query_api.get_job_status(weird_job)
 
+    @patch('mozci.query_jobs.query_job_data')
+    @patch('mozci.query_jobs.query_jobs_data')
+    def test_jobs_data(self, query_jobs_data, query_job_data):
+        """The buildjson data of the successful jobs is queried at once."""
+        successful_job = json.loads(BASE_JSON % (SUCCESS, 1433166610, 1, 1433166609))[0]
+        failed_job = json.loads(BASE_JSON % (FAILURE, 1433166610, 1, 1433166609))[0]
+        query_jobs_data.return_value = {71123549: {
+            "properties": {"revision": "146071751b1e5d16b87786f6e60485222c28c202"}}}
+
+        jobs_data = self.query_api.get_jobs_data([successful_job, failed_job])
+        query_jobs_data.assert_called_once_with([(1433166610, 71123549)])
+        self.assertEquals(self.query_api.get_job_status(successful_job, jobs_data), SUCCESS)
+        self.assertEquals(self.query_api.get_job_status(failed_job, jobs_data), FAILURE)
+        assert query_job_data.call_count == 0
+
+    @patch('mozci.query_jobs.query_job_data')
+    @patch('mozci.query_jobs.query_jobs_data', side_effect=BuildjsonError)
+    def test_jobs_data_failure(self, query_jobs_data, query_job_data):
+        """If the jobs cannot be looked up at once, they are looked up one by one."""
+        jobs = json.loads(BASE_JSON % (SUCCESS, 1433166610, 1, 1433166609)) * 2
+        jobs[1] = dict(jobs[1], buildername="Other builder")
+        query_job_data.side_effect = [
+            BuildjsonError, {"properties": {"revision": jobs[1]["revision"]}}]
+        with patch.object(self.query_api, 'get_all_jobs', return_value=jobs):
+            self.assertEquals(self.query_api.find_all_jobs_by_status("try", "146071751b1e",
+                                                                     SUCCESS), [71123549])
+        assert query_job_data.call_count == 2
+
 
 class TestTreeherderApiGetJobStatus(unittest.TestCase):
     """Test query_job_status with different types of jobs"""
@@ -395,3 +429,90 @@ class TestTreeherderApiGetAllJobsByStatus(unittest.TestCase):
             self.repo_name, self.revision, PENDING),
             ["Ubuntu VM 12.04 x64 mozilla-inbound opt test mochitest-1",
              "[TC] - Linux64 web-platform-tests-e10s-6"])
+
+
+def buildjson_job(buildername, revision, repo_path, request_id, result):
+    return {"properties": {"buildername": buildername, "revision": revision,
+                           "repo_path": repo_path, "request_ids": [request_id]},
+            "request_ids": [request_id], "result": result, "endtime": 1435000000}
+
+
+BUILDJSON_JOBS = {
+    "2015-06-22": [
+        buildjson_job("job-1", "a" * 40, "integration/mozilla-inbound", 1, SUCCESS),
+        buildjson_job("job-2", "a" * 40, "integration/mozilla-inbound", 2, FAILURE),
+        buildjson_job("job-1", "a" * 40, "integration/fx-team", 3, FAILURE),
+        buildjson_job("job-1", "b" * 40, "integration/mozilla-inbound", 4, SUCCESS),
+    ],
+    "2015-06-23": [
+        buildjson_job("job-2", "a" * 40, "integration/mozilla-inbound", 5, SUCCESS),
+        buildjson_job("job-3", "a" * 40, "integration/mozilla-inbound", 6, SUCCESS),
+    ],
+}
+
+
+@patch('mozci.sources.buildjson.fetch_file', side_effect=AssertionError("We are offline"))
+class TestBuildjsonApi(unittest.TestCase):
+    """Test BuildjsonApi with day files in a temporary cache directory."""
+
+    def setUp(self):
+        buildjson._reset_cache()
+        self.cache_dir = cache.CACHE_DIR
+        cache.CACHE_DIR = tempfile.mkdtemp()
+        for date, jobs in BUILDJSON_JOBS.iteritems():
+            with open(os.path.join(cache.CACHE_DIR, buildjson.BUILDS_DAY_FILE % date), 'wb') as fd:
+                gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+                gzipper.write(json.dumps({"builds": jobs}))
+                gzipper.close()
+        self.query_api = BuildjsonApi()
+
+    def tearDown(self):
+        buildjson._reset_cache()
+        shutil.rmtree(cache.CACHE_DIR)
+        cache.CACHE_DIR = self.cache_dir
+
+    def test_get_all_jobs(self, fetch_file):
+        """Jobs of the revision are gathered from every day file; other repositories are ignored."""
+        jobs = self.query_api.get_all_jobs("mozilla-inbound", "a" * 12)
+        self.assertEquals([job["request_ids"] for job in jobs], [[1], [2], [5], [6]])
+        self.assertEquals([job["buildername"] for job in jobs],
+                          ["job-1", "job-2", "job-2", "job-3"])
+        self.assertEquals(self.query_api.get_all_jobs("mozilla-inbound", "c" * 40), [])
+
+    def test_get_matching_jobs(self, fetch_file):
+        jobs = self.query_api.get_matching_jobs("mozilla-inbound", "a" * 40, "job-2")
+        self.assertEquals([job["request_ids"] for job in jobs], [[2], [5]])
+        self.assertEquals(
+            self.query_api.get_buildapi_request_id("mozilla-inbound", jobs[0]), 2)
+
+    def test_get_buildapi_request_id(self, fetch_file):
+        """The request ids of the properties are used if the job has none."""
+        job = buildjson_job("job-1", "a" * 40, "integration/mozilla-inbound", 7, SUCCESS)
+        job["request_ids"] = []
+        self.assertEquals(self.query_api.get_buildapi_request_id("mozilla-inbound", job), 7)
+
+        del job["request_ids"]
+        job["properties"]["request_ids"] = []
+        with self.assertRaises(query_jobs.BuildjsonError):
+            self.query_api.get_buildapi_request_id("mozilla-inbound", job)
+
+    def test_date_range(self, fetch_file):
+        """Only the day files between start_date and end_date are used."""
+        query_api = BuildjsonApi(start_date="2015-06-23")
+        jobs = query_api.get_all_jobs("mozilla-inbound", "a" * 40)
+        self.assertEquals([job["request_ids"] for job in jobs], [[5], [6]])
+
+    def test_get_job_status(self, fetch_file):
+        job = BUILDJSON_JOBS["2015-06-22"][1]
+        self.assertEquals(self.query_api.get_job_status(job), FAILURE)
+        self.assertEquals(self.query_api.get_job_status(dict(job, result=None)), UNKNOWN)
+        with self.assertRaises(query_jobs.BuildjsonError):
+            self.query_api.get_job_status(dict(job, result=20))
+
+    def test_find_all_jobs_by_status(self, fetch_file):
+        """Buildernames with a job of another status are left out."""
+        self.assertEquals(
+            self.query_api.find_all_jobs_by_status("mozilla-inbound", "a" * 40, SUCCESS), [1, 6])
+        self.assertEquals(
+            self.query_api.determine_missing_jobs("mozilla-inbound", "a" * 40,
+                                                  ["job-1", "job-3", "job-4"]), ["job-4"])
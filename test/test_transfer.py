@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""This file contains tests for mozci/utils/transfer.py."""
+import glob
+import gzip
+import json
+import os
+import time
+import unittest
+
+from StringIO import StringIO
+
+import requests
+
+from mock import patch, Mock
+
+from mozci.errors import MozciError
+from mozci.utils import transfer
+
+TMP_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tmp_builds.js.gz")
+URL = "http://builddata.pub.build.mozilla.org/builddata/buildjson/builds-2015-06-22.js.gz"
+LAST_MODIFIED = "Mon, 22 Jun 2015 19:06:40 GMT"
+DATA = {
+    u"builds": [
+        {u"properties": {u"buildername": u"Ubuntu VM 12.04 x64 try opt test mochitest-1",
+                         u"request_ids": [1, 2]},
+         u"request_ids": [1], u"endtime": 1435000000, u"result": 0.5e3},
+        {u"properties": {u"buildername": u"Windows XP 32-bit try débug test jsreftest"},
+         u"request_ids": [], u"endtime": None, u"result": -12345678901234},
+    ],
+    u"machines": [],
+    u"slaves": {u"1": u"t-w732-ix-001"},
+    u"version": 3,
+}
+
+
+def mock_get(content, status_code=200, headers=None, fail_after=None):
+    """
+    Mock of requests.get() sending content.
+
+    If fail_after is set, the connection drops after sending that many bytes.
+    """
+    response = Mock()
+    response.url = URL
+    response.status_code = status_code
+    response.headers = {'content-length': str(len(content)), 'last-modified': LAST_MODIFIED}
+    response.headers.update(headers or {})
+
+    def iter_content(chunk_size):
+        for start in range(0, len(content), 4):
+            if fail_after is not None and start >= fail_after:
+                raise requests.exceptions.ConnectionError("Connection reset by peer")
+            yield content[start:start + 4]
+
+    response.iter_content = iter_content
+    return response
+
+
+class TestPathToFile(unittest.TestCase):
+
+    @patch('os.path.exists', return_value=False)
+    def test_directory_created_meanwhile(self, exists):
+        """Another thread creating the cache directory first is not an error."""
+        cache_dir = transfer.cache.CACHE_DIR
+        transfer.cache.CACHE_DIR = os.path.dirname(TMP_FILENAME)
+        try:
+            self.assertEquals(transfer.path_to_file("tmp_builds.js.gz"), TMP_FILENAME)
+        finally:
+            transfer.cache.CACHE_DIR = cache_dir
+
+
+class TestStreamJSONDecode(unittest.TestCase):
+
+    """Test decoding JSON while we read it."""
+
+    def test_chunk_sizes(self):
+        """Values, numbers and multibyte characters split across chunks are decoded."""
+        for indent in (None, 2):
+            text = json.dumps(DATA, indent=indent, ensure_ascii=False).encode('utf-8')
+            for chunk_size in (1, 2, 3, 7, 64, 1024):
+                self.assertEquals(transfer._stream_json_decode(StringIO(text), chunk_size),
+                                  DATA)
+
+    def test_other_documents(self):
+        """Documents which are not objects are decoded as well."""
+        for document in ([1, [2, 3]], 12.5, u"text", {}, {u"a": []}):
+            self.assertEquals(transfer._stream_json_decode(StringIO(json.dumps(document))),
+                              document)
+
+    def test_invalid_document(self):
+        """Invalid documents raise ValueError."""
+        for text in ('{"builds": [1, 2}', '{"builds": [1, 2]', '{"a" 1}', '[1, 2'):
+            with self.assertRaises(ValueError):
+                transfer._stream_json_decode(StringIO(text))
+
+    def test_trailing_data(self):
+        """Anything but whitespace after the document raises ValueError, like json.loads()."""
+        for text in ('{"builds": []} x', '{} {}', '[1] ]', '{"a": 1}\n\n,'):
+            with self.assertRaises(ValueError):
+                json.loads(text)
+            with self.assertRaises(ValueError):
+                transfer._stream_json_decode(StringIO(text), 2)
+        self.assertEquals(transfer._stream_json_decode(StringIO('{"a": [1]} \n\t'), 2),
+                          {u"a": [1]})
+
+    def test_trailing_data_is_not_buffered(self):
+        """We stop reading at the first character after the document."""
+        fd = StringIO('{"a": 1} garbage' + ' ' * 1000)
+        with self.assertRaises(ValueError):
+            transfer._stream_json_decode(fd, 16)
+        self.assertTrue(fd.tell() <= 32)
+
+
+class TestLoadJSONFile(unittest.TestCase):
+
+    """Test _load_json_file() with and without STREAM_JSON_DECODE."""
+
+    def setUp(self):
+        with open(TMP_FILENAME, 'wb') as fd:
+            gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+            json.dump(DATA, gzipper)
+            gzipper.close()
+
+    def tearDown(self):
+        transfer.STREAM_JSON_DECODE = transfer.platform.system() == 'Linux'
+        os.remove(TMP_FILENAME)
+
+    def test_both_modes(self):
+        for stream in (False, True):
+            transfer.STREAM_JSON_DECODE = stream
+            self.assertEquals(transfer._load_json_file(TMP_FILENAME), DATA)
+
+
+class TestLeanLoadJSONFile(unittest.TestCase):
+
+    """Test the projections of _lean_load_json_file()."""
+
+    def setUp(self):
+        with open(TMP_FILENAME, 'wb') as fd:
+            gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+            json.dump(DATA, gzipper)
+            gzipper.close()
+
+    def tearDown(self):
+        os.remove(TMP_FILENAME)
+
+    def test_default_projection(self):
+        """By default we keep what query_job_data() needs to find jobs."""
+        builds = transfer._lean_load_json_file(TMP_FILENAME)['builds']
+        self.assertEquals(builds, [
+            {u"properties": {u"buildername": u"Ubuntu VM 12.04 x64 try opt test mochitest-1",
+                             u"request_ids": [1, 2]},
+             u"request_ids": [1]},
+            {u"properties": {u"buildername": u"Windows XP 32-bit try débug test jsreftest"},
+             u"request_ids": []},
+        ])
+
+    def test_projection(self):
+        """Only the fields of the projection are kept; a field includes its nested fields."""
+        projection = ['endtime', 'properties.request_ids', 'missing', 'result.value']
+        builds = transfer._lean_load_json_file(TMP_FILENAME, projection)['builds']
+        self.assertEquals(builds, [
+            {u"properties": {u"request_ids": [1, 2]}, u"endtime": 1435000000},
+            {u"properties": {}, u"endtime": None},
+        ])
+
+        builds = transfer._lean_load_json_file(
+            TMP_FILENAME, ['properties.buildername', 'properties'])['builds']
+        self.assertEquals(builds, [{u"properties": b[u"properties"]} for b in DATA[u"builds"]])
+
+    def test_normalize_projection(self):
+        self.assertEquals(transfer.normalize_projection(['result', 'endtime', 'result']),
+                          ('endtime', 'result'))
+        with self.assertRaises(transfer.MozciError):
+            transfer.normalize_projection('endtime')
+
+
+class TestFetchFile(unittest.TestCase):
+
+    """Test that downloads are resumed and that they never leave a truncated file."""
+
+    CONTENT = "0123456789abcdef"
+
+    def setUp(self):
+        self.show_progress_bar = transfer.SHOW_PROGRESS_BAR
+        transfer.SHOW_PROGRESS_BAR = False
+
+    def tearDown(self):
+        transfer.SHOW_PROGRESS_BAR = self.show_progress_bar
+        for filepath in (TMP_FILENAME, TMP_FILENAME + transfer.PARTIAL_SUFFIX):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    @patch('time.sleep')
+    def test_interrupted_download_is_resumed(self, sleep):
+        """The second attempt only asks for the bytes we are missing."""
+        responses = [
+            mock_get(self.CONTENT, fail_after=8),
+            mock_get(self.CONTENT[8:], status_code=206, headers={
+                'content-range': 'bytes 8-15/16'}),
+        ]
+        with patch('mozci.utils.network.get', side_effect=responses) as get:
+            self.assertEquals(transfer.fetch_file(TMP_FILENAME, URL), TMP_FILENAME)
+
+        self.assertEquals(get.call_args_list[1][1]['headers']['Range'], 'bytes=8-')
+        self.assertEquals(get.call_args_list[1][1]['headers']['If-Range'], LAST_MODIFIED)
+        assert sleep.call_count == 1
+        with open(TMP_FILENAME) as fd:
+            self.assertEquals(fd.read(), self.CONTENT)
+        self.assertEquals(time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                                        time.gmtime(os.stat(TMP_FILENAME).st_mtime)),
+                          LAST_MODIFIED)
+        self.assertFalse(os.path.exists(TMP_FILENAME + transfer.PARTIAL_SUFFIX))
+
+    @patch('time.sleep')
+    def test_truncated_download_is_not_used(self, sleep):
+        """After MAX_DOWNLOAD_ATTEMPTS short downloads the file in the cache is untouched."""
+        with open(TMP_FILENAME, 'w') as fd:
+            fd.write("previous copy")
+
+        with patch('mozci.utils.network.get', return_value=mock_get(self.CONTENT[:8], headers={
+                'content-length': '16'})) as get:
+            with self.assertRaises(MozciError):
+                transfer.fetch_file(TMP_FILENAME, URL)
+
+        assert get.call_count == transfer.MAX_DOWNLOAD_ATTEMPTS
+        self.assertEquals([c[0][0] for c in sleep.call_args_list],
+                          [min(transfer.MAX_BACKOFF, 2 ** i)
+                           for i in range(transfer.MAX_DOWNLOAD_ATTEMPTS - 1)])
+        with open(TMP_FILENAME) as fd:
+            self.assertEquals(fd.read(), "previous copy")
+
+
+class TestDecodedCopy(unittest.TestCase):
+
+    """Test that load_file() keeps a decoded copy of the files it parses."""
+
+    def setUp(self):
+        with open(TMP_FILENAME, 'wb') as fd:
+            gzipper = gzip.GzipFile(fileobj=fd, mode='wb')
+            json.dump(DATA, gzipper)
+            gzipper.close()
+
+    def tearDown(self):
+        for filepath in glob.glob(TMP_FILENAME + '*'):
+            os.remove(filepath)
+
+    @patch('mozci.utils.transfer.fetch_file', side_effect=lambda filename, url: filename)
+    def test_decoded_copy_is_used(self, fetch_file):
+        """Later loads read the copy (one per projection) until the file is replaced."""
+        self.assertEquals(transfer.load_file(TMP_FILENAME, URL), DATA)
+        projected = transfer.load_file(TMP_FILENAME, URL, ['endtime'])
+        self.assertNotEqual(transfer.decoded_copy_path(TMP_FILENAME),
+                            transfer.decoded_copy_path(TMP_FILENAME, ['endtime']))
+
+        with patch('mozci.utils.transfer._load_json_file') as load_json_file:
+            with patch('mozci.utils.transfer._lean_load_json_file') as lean_load_json_file:
+                self.assertEquals(transfer.load_file(TMP_FILENAME, URL), DATA)
+                self.assertEquals(transfer.load_file(TMP_FILENAME, URL, ['endtime']), projected)
+                assert load_json_file.call_count == 0
+                assert lean_load_json_file.call_count == 0
+
+        with open(TMP_FILENAME, 'wb') as fd:
+            json.dump({u"builds": []}, fd)
+        self.assertEquals(transfer.load_file(TMP_FILENAME, URL), {u"builds": []})
+
+    @patch('mozci.utils.transfer.fetch_file', side_effect=lambda filename, url: filename)
+    def test_no_decoded_copy(self, fetch_file):
+        transfer.load_file(TMP_FILENAME, URL, decoded_copy=False)
+        self.assertFalse(os.path.exists(transfer.decoded_copy_path(TMP_FILENAME)))